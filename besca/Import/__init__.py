@@ -1,4 +1,5 @@
 from besca.Import._read import read_mtx, assert_adata
 from besca.Import._labelings import add_cell_labeling
+from besca.Import._mtx import read_matrix_market
 
-__all__ = ["read_mtx", "add_cell_labeling", "assert_adata"]
+__all__ = ["read_mtx", "add_cell_labeling", "assert_adata", "read_matrix_market"]
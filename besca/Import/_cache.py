@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from numpy import load, save
+from pandas import read_pickle
+from scipy.sparse import csr_matrix
+
+# bump when the layout of the cached files changes
+_CACHE_VERSION = "1"
+_HASH_BLOCK = 2**20
+
+
+def default_cache_dir() -> str:
+    """directory used for cached inputs if no cache_dir is specified"""
+    return os.path.join(os.path.expanduser("~"), ".cache", "besca", "read_mtx")
+
+
+def _content_hash(path: str, cache_dir: str) -> str:
+    """blake2b hash of a file, remembered as long as its size and mtime do not change
+
+    The hash of every input file is stored together with its size and mtime in
+    cache_dir/index, so unchanged files are only read completely once.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    name = hashlib.blake2b(path.encode(), digest_size=16).hexdigest() + ".json"
+    index_file = os.path.join(cache_dir, "index", name)
+
+    if os.path.isfile(index_file):
+        try:
+            with open(index_file) as fp:
+                entry = json.load(fp)
+            if entry["path"] == path and entry["fingerprint"] == fingerprint:
+                return entry["hash"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    content_hash = digest.hexdigest()
+
+    entry = {"path": path, "fingerprint": fingerprint, "hash": content_hash}
+    try:
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        with open(index_file + ".tmp", "w") as fp:
+            json.dump(entry, fp)
+        os.replace(index_file + ".tmp", index_file)
+    except OSError:
+        # the cache directory is not usable, the hash is just not remembered;
+        # errors reading the input file itself are raised above
+        pass
+    return content_hash
+
+
+def _cache_key(files: list, cache_dir: str) -> str:
+    """key of the cache entry for the content of a list of input files"""
+    digest = hashlib.blake2b(_CACHE_VERSION.encode(), digest_size=20)
+    for path in files:
+        digest.update(os.path.basename(path).encode())
+        digest.update(_content_hash(path, cache_dir).encode())
+    return digest.hexdigest()
+
+
+def _write_entry(entry_dir: str, X: csr_matrix, tables: dict) -> None:
+    """write the matrix as .npy arrays and the tables as pickles to entry_dir"""
+    parent = os.path.dirname(entry_dir)
+    try:
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    except OSError as error:
+        # e.g. read-only file system or full disk, the result is still returned
+        print("cache directory " + parent + " is not usable (" + str(error) + ")")
+        return None
+    try:
+        for name in ["data", "indices", "indptr"]:
+            save(os.path.join(tmp_dir, name + ".npy"), getattr(X, name))
+        save(os.path.join(tmp_dir, "shape.npy"), X.shape)
+        for name, table in tables.items():
+            table.to_pickle(os.path.join(tmp_dir, name + ".pkl"))
+        # the entry only becomes visible once it is complete
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # e.g. another process wrote the same entry in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _read_entry(entry_dir: str, names: list):
+    """read a cache entry, the matrix arrays are memory-mapped copy-on-write"""
+    arrays = [
+        load(os.path.join(entry_dir, name + ".npy"), mmap_mode="c")
+        for name in ["data", "indices", "indptr"]
+    ]
+    shape = tuple(load(os.path.join(entry_dir, "shape.npy")).tolist())
+    X = csr_matrix(tuple(arrays), shape=shape, copy=False)
+    tables = {
+        name: read_pickle(os.path.join(entry_dir, name + ".pkl")) for name in names
+    }
+    return X, tables
+
+
+def cached_inputs(files: list, parse, names: list, cache_dir: str = None):
+    """return the parsed input files, from the cache if they were parsed before
+
+    parameters
+    ----------
+    files: `list`
+        paths of the input files, the cache entry is keyed by their content
+    parse: `callable`
+        function without arguments returning the parsed matrix (csr_matrix) and
+        a dictionary of pandas objects (one for every entry of names)
+    names: `list`
+        names of the tables returned by parse
+    cache_dir: `str` | default = None
+        directory containing the cache, defaults to ~/.cache/besca/read_mtx
+
+    returns
+    -------
+    the matrix and the dictionary of tables
+
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    # a missing or unreadable input file raises here, an unusable cache
+    # directory only prevents writing the entry (see _write_entry)
+    entry_dir = os.path.join(cache_dir, _cache_key(files, cache_dir))
+
+    if os.path.isdir(entry_dir):
+        try:
+            return _read_entry(entry_dir, names)
+        except (OSError, ValueError, EOFError):
+            print("cache entry is unreadable, reparsing input files")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    X, tables = parse()
+    _write_entry(entry_dir, X, tables)
+    return X, tables
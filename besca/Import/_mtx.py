@@ -0,0 +1,151 @@
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from numpy import (
+    bincount,
+    concatenate,
+    cumsum,
+    diff,
+    empty,
+    int32,
+    int64,
+    ones,
+)
+from pandas import read_csv
+from scipy.io import mmread
+from scipy.sparse import coo_matrix, csr_matrix
+
+
+def _parse_block(block: bytes, has_values: bool, dtype):
+    """parse a block of 'row col [value]' lines into three arrays (0-based indices)"""
+    columns = {0: int64, 1: int64}
+    if has_values:
+        columns[2] = dtype
+    table = read_csv(
+        BytesIO(block),
+        sep=r"\s+",
+        header=None,
+        names=list(columns),
+        usecols=list(columns),
+        dtype=columns,
+        comment="%",
+        engine="c",
+    )
+    genes = table[0].to_numpy() - 1
+    cells = table[1].to_numpy() - 1
+    if has_values:
+        values = table[2].to_numpy()
+    else:
+        values = ones(len(genes), dtype=dtype)
+    return genes, cells, values
+
+
+def _read_header(fp):
+    """read the banner, comments and size line of a matrix market file"""
+    banner = fp.readline().decode().lower().split()
+    if len(banner) != 5 or banner[0] != "%%matrixmarket":
+        raise ValueError("file is not in the matrix market format")
+    line = fp.readline()
+    while line.startswith(b"%") or not line.strip():
+        line = fp.readline()
+    n_genes, n_cells, nnz = [int(x) for x in line.split()]
+    return banner[2:], (n_genes, n_cells, nnz)
+
+
+def read_matrix_market(
+    filename: str,
+    dtype: str = "float32",
+    n_jobs: int = None,
+    chunk_size: int = 2**26,
+) -> csr_matrix:
+    """read a genes x cells Matrix Market file into a cells x genes CSR matrix
+
+    The file (plain or gzip compressed) is read and decompressed in blocks of
+    chunk_size bytes, which are parsed in parallel threads with the C parser of
+    pandas while the next block is being read. The coordinates are directly
+    assembled into a cells x genes CSR matrix, so no transposed copy of the
+    matrix is created. Files that are not general coordinate matrices are read
+    with scipy.io.mmread instead.
+
+    parameters
+    ----------
+    filename: `str`
+        path to the matrix.mtx or matrix.mtx.gz file
+    dtype: `str` | default = 'float32'
+        data type of the returned matrix
+    n_jobs: `int` | default = None
+        number of threads used for parsing, if None the number of cpus is used
+    chunk_size: `int` | default = 2**26
+        number of bytes that are parsed at once in one thread
+
+    returns
+    -------
+    scipy.sparse.csr_matrix
+        cells x genes matrix
+
+    """
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    if filename.endswith(".gz"):
+        fp = gzip.open(filename, "rb")
+    else:
+        fp = open(filename, "rb")
+    with fp:
+        (layout, field, symmetry), shape = _read_header(fp)
+        if (
+            layout != "coordinate"
+            or symmetry != "general"
+            or field not in ["real", "integer", "unsigned-integer", "pattern"]
+        ):
+            return csr_matrix(mmread(filename).T, dtype=dtype)
+        n_genes, n_cells, nnz = shape
+        has_values = field != "pattern"
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            futures = []
+            rest = b""
+            while True:
+                block = fp.read(chunk_size)
+                if not block:
+                    break
+                # only parse complete lines, the remainder is added to the next block
+                end = block.rfind(b"\n") + 1
+                if end == 0:
+                    rest += block
+                    continue
+                futures.append(
+                    pool.submit(_parse_block, rest + block[:end], has_values, dtype)
+                )
+                rest = block[end:]
+            if rest.strip():
+                futures.append(pool.submit(_parse_block, rest, has_values, dtype))
+            parts = [future.result() for future in futures]
+
+    if parts:
+        genes, cells, values = [concatenate(x) for x in zip(*parts)]
+    else:
+        genes, cells, values = [empty(0, dtype=int64)] * 2 + [empty(0, dtype=dtype)]
+    if len(values) != nnz:
+        raise ValueError(
+            f"expected {nnz} entries in {filename} but found {len(values)}"
+        )
+
+    index_dtype = int32 if max(n_cells, n_genes, nnz) < 2**31 else int64
+    if (diff(cells) >= 0).all():
+        # entries are sorted by cell (as written by 10x and besca), so the rows
+        # of the CSR matrix are already contiguous
+        indptr = concatenate([[0], cumsum(bincount(cells, minlength=n_cells))])
+        X = csr_matrix(
+            (values, genes.astype(index_dtype), indptr.astype(index_dtype)),
+            shape=(n_cells, n_genes),
+        )
+        if not X.has_sorted_indices:
+            X.sort_indices()
+        if not X.has_canonical_format:
+            X.sum_duplicates()
+    else:
+        X = coo_matrix((values, (cells, genes)), shape=(n_cells, n_genes)).tocsr()
+    return X
@@ -3,10 +3,11 @@ import sys
 
 import pandas as pd
 from anndata import AnnData
-from scanpy import read
 from scipy.sparse import csr_matrix, issparse
 
 from besca._helper import convert_ensembl_to_symbol
+from besca.Import._cache import cached_inputs
+from besca.Import._mtx import read_matrix_market
 
 
 def assert_filepath(filepath):
@@ -97,8 +98,29 @@ def assert_adata(adata: AnnData, attempFix=True):
     return adata
 
 
+def _parse_inputs(files):
+    """parse matrix, barcodes, genes and (if present) metadata files of read_mtx"""
+    print("reading " + os.path.basename(files[0]))
+    X = read_matrix_market(files[0])
+    tables = {}
+    print("reading cell barcodes")
+    tables["barcodes"] = pd.read_csv(files[1], header=None, engine="c")[0]
+    print("reading genes")
+    tables["genes"] = pd.read_csv(files[2], header=None, sep="\t", engine="c")
+    if len(files) > 3:
+        print("reading annotation")
+        tables["metadata"] = pd.read_csv(files[3], sep="\\t", engine="python")
+    return X, tables
+
+
 def read_mtx(
-    filepath, annotation=True, use_genes="SYMBOL", species="human", citeseq=None
+    filepath,
+    annotation=True,
+    use_genes="SYMBOL",
+    species="human",
+    citeseq=None,
+    cache=True,
+    cache_dir=None,
 ):
     """Read matrix.mtx, genes.tsv, barcodes.tsv to AnnData object.
     By specifiying an input folder this function reads the contained matrix.mtx,
@@ -120,42 +142,38 @@ def read_mtx(
     citeseq: 'gex_only' or 'citeseq_only' or None | default = None
         string indicating if only gene expression values (gex_only) or only protein
         expression values ('citeseq_only') or everything is read if None is specified
+    cache: `bool` | default = True
+        boolian identifier if the parsed input files should be stored in (and
+        reloaded from) a binary cache. Cache entries are keyed by the content of
+        the input files, files are only rehashed if their size or mtime changed.
+    cache_dir: `str` | default = None
+        directory of the cache, defaults to ~/.cache/besca/read_mtx
 
     Returns
     -------
     returns an AnnData object
     """
     gzfiles = assert_filepath(filepath)
-    if gzfiles == "gz":
-        print("reading matrix.mtx.gz")
-        adata = read(
-            os.path.join(filepath, "matrix.mtx.gz"), cache=True
-        ).T  # transpose the data
-        print("adding cell barcodes")
-        adata.obs_names = pd.read_csv(
-            os.path.join(filepath, "barcodes.tsv.gz"), compression="gzip", header=None
-        )[0]
-        print("adding genes")
-        var_anno = pd.read_csv(
-            os.path.join(filepath, "genes.tsv.gz"),
-            compression="gzip",
-            header=None,
-            sep="\\t",
-            engine="python",
+    suffix = ".gz" if gzfiles == "gz" else ""
+    files = [
+        os.path.join(filepath, x + suffix)
+        for x in ["matrix.mtx", "barcodes.tsv", "genes.tsv"]
+    ]
+    if annotation == True:
+        files.append(os.path.join(filepath, "metadata.tsv"))
+    names = ["barcodes", "genes", "metadata"][: len(files) - 1]
+
+    if cache:
+        print("looking up input files in the cache")
+        X, tables = cached_inputs(
+            files, lambda: _parse_inputs(files), names, cache_dir=cache_dir
         )
     else:
-        print("reading matrix.mtx")
-        adata = read(
-            os.path.join(filepath, "matrix.mtx"), cache=True
-        ).T  # transpose the data
-        print("adding cell barcodes")
-        adata.obs_names = pd.read_csv(
-            os.path.join(filepath, "barcodes.tsv"), header=None
-        )[0]
-        print("adding genes")
-        var_anno = pd.read_csv(
-            os.path.join(filepath, "genes.tsv"), header=None, sep="\\t", engine="python"
-        )
+        X, tables = _parse_inputs(files)
+
+    adata = AnnData(X)
+    adata.obs_names = tables["barcodes"]
+    var_anno = tables["genes"]
 
     symbols = var_anno[1]
     ensembl_id = var_anno[0]
@@ -199,9 +217,7 @@ def read_mtx(
 
     if annotation == True:
         print("adding annotation")
-        adata.obs = pd.read_csv(
-            os.path.join(filepath, "metadata.tsv"), sep="\\t", engine="python"
-        )
+        adata.obs = tables["metadata"]
         if adata.obs.get("CELL") is not None:
             adata.obs.index = adata.obs.get("CELL").tolist()
 
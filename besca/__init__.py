@@ -16,6 +16,7 @@ from besca._helper import (
     get_means,
     concate_adata,
     get_singlegenedf,
+    get_gene_indexes,
     print_software_versions
 )
 
@@ -38,6 +39,7 @@ __all__ = [
     "convert_symbol_to_ensembl",
     "get_raw",
     "get_ameans",
+    "get_gene_indexes",
     "get_means",
     "concate_adata",
     "get_singlegenedf",
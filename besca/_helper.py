@@ -1,15 +1,35 @@
 from anndata import AnnData
 import mygene
 import sys
-from pandas import DataFrame, concat
+from pandas import Categorical, CategoricalIndex, DataFrame, Index, concat
 from scipy import sparse
-from math import expm1
-from numpy import sort
+from numpy import (
+    arange,
+    asarray,
+    bincount,
+    column_stack,
+    errstate,
+    expm1,
+    log1p,
+    nan,
+    ones,
+    sort,
+    take_along_axis,
+    zeros,
+)
+from numpy.lib.recfunctions import structured_to_unstructured
 from distutils.version import StrictVersion
 import scanpy as sc
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 import re
+import weakref
 from besca._version import get_versions
+from besca.datasets._genes import get_gene_annotation, map_gene_ids
+
+# hash indexes of recently used var_names objects, see get_gene_indexes
+_GENE_INDEX_CACHE = OrderedDict()
+_GENE_INDEX_CACHE_SIZE = 32
+
 
 def subset_adata(adata, filter_criteria, raw=True, axis=0):
     """Subset AnnData object into new object
@@ -76,10 +96,13 @@ def subset_adata(adata, filter_criteria, raw=True, axis=0):
         return subset_full
 
 
-def convert_ensembl_to_symbol(gene_list, species="human"):
+def convert_ensembl_to_symbol(gene_list, species="human", annotation_file=None):
     """Convert ENSEMBL gene ids to SYMBOLS
-    Uses the python package mygene to look up the supplied list of ENSEMBLE Ids and return
-    the equivalent list of Symbols. Species needs to be supplied.
+    Looks up the supplied list of ENSEMBLE Ids and returns the equivalent list of
+    Symbols. Species needs to be supplied. If a local gene annotation table is
+    available for the species (see besca.datasets.build_gene_annotation) or an
+    annotation_file is supplied, the lookup is done offline on this table,
+    otherwise the python package mygene is used.
 
     parameters
     ----------
@@ -87,13 +110,19 @@ def convert_ensembl_to_symbol(gene_list, species="human"):
         list of ensemble_Ids that need to be converted
     species: `str` | default = 'human'
         string identifying the species of the supplied Ensemble IDs
+    annotation_file: `str` | default = None
+        tab separated file with ENSEMBL ids and SYMBOLS (no header) that is used
+        instead of the local table of the species
 
     returns
     -------
     list
-        List containing the converted Symbols
+        List containing the converted Symbols (None for unknown ENSEMBL ids)
 
     """
+    lookup = get_gene_annotation(species, annotation_file)
+    if lookup is not None:
+        return map_gene_ids(gene_list, lookup, "ENSEMBL", "SYMBOL")
 
     mg = mygene.MyGeneInfo()
     gene_symbols = mg.querymany(
@@ -107,12 +136,16 @@ def convert_ensembl_to_symbol(gene_list, species="human"):
     return symbols
 
 
-def convert_symbol_to_ensembl(gene_list, species="human"):
+def convert_symbol_to_ensembl(gene_list, species="human", annotation_file=None):
     """Convert SYMBOLS to ENSEMBL gene ids
-    Uses the python package mygene to look up the supplied list of SYMBOLS and return
-    the equivalent list of ENSEMBLE GENEIDs. Species needs to be supplied.
+    Looks up the supplied list of SYMBOLS and returns the equivalent list of
+    ENSEMBLE GENEIDs. Species needs to be supplied. If a local gene annotation
+    table is available for the species (see besca.datasets.build_gene_annotation)
+    or an annotation_file is supplied, the lookup is done offline on this table
+    (returning the first ENSEMBL id of a symbol), otherwise the python package
+    mygene is used.
 
-    Note: this can result in an error when non-unqiue Symbols are supplied.
+    Note: using mygene this can result in an error when non-unqiue Symbols are supplied.
 
     parameters
     ----------
@@ -120,13 +153,19 @@ def convert_symbol_to_ensembl(gene_list, species="human"):
         list of ensemble_Ids that need to be converted
     species: `str` | default = 'human'
         string identifying the species of the supplied Ensemble IDs
+    annotation_file: `str` | default = None
+        tab separated file with ENSEMBL ids and SYMBOLS (no header) that is used
+        instead of the local table of the species
 
     returns
     -------
     list
-        List containing the converted ENSEMBLE gene ids
+        List containing the converted ENSEMBLE gene ids (None for unknown SYMBOLS)
 
     """
+    lookup = get_gene_annotation(species, annotation_file)
+    if lookup is not None:
+        return map_gene_ids(gene_list, lookup, "SYMBOL", "ENSEMBL")
 
     mg = mygene.MyGeneInfo()
     gene_symbols = mg.querymany(
@@ -140,6 +179,60 @@ def convert_symbol_to_ensembl(gene_list, species="human"):
     return ensembl
 
 
+def get_gene_indexes(var_names, genes):
+    """Return the integer positions of genes in var_names
+    Vectorized replacement of [var_names.tolist().index(x) for x in genes]: the
+    positions of all genes are looked up at once through a hash index, that is built
+    once per var_names object and cached, so repeated lookups on the same object
+    do not rebuild it. Like list.index the first occurrence of duplicated names
+    is returned.
+
+    parameters
+    ----------
+    var_names: `pandas.Index` | `list`
+        the gene names to search in, e.g. adata.var_names
+    genes: `list` | `str`
+        gene name or list of gene names that should be located
+
+    returns
+    -------
+    numpy.ndarray
+        integer positions of the genes in var_names, raises a ValueError if
+        one of the genes is not contained in var_names
+
+    """
+    if isinstance(genes, str):
+        genes = [genes]
+    index, positions = _gene_index_lookup(var_names)
+    found = index.get_indexer(Index(list(genes), dtype=object))
+    if (found < 0).any():
+        missing = [gene for gene, x in zip(genes, found) if x < 0]
+        raise ValueError(f"{missing} not contained in var_names")
+    return positions[found]
+
+
+def _gene_index_lookup(var_names):
+    """hash index of the unique names in var_names and their first position"""
+    key = id(var_names)
+    entry = _GENE_INDEX_CACHE.get(key)
+    if entry is not None and entry[0]() is var_names:
+        _GENE_INDEX_CACHE.move_to_end(key)
+        return entry[1], entry[2]
+
+    names = var_names if isinstance(var_names, Index) else Index(list(var_names))
+    unique = ~names.duplicated()
+    lookup = (Index(names[unique], dtype=object), unique.nonzero()[0])
+    try:
+        reference = weakref.ref(var_names)
+    except TypeError:
+        # e.g. lists can not be weakly referenced, these are not cached
+        return lookup
+    _GENE_INDEX_CACHE[key] = (reference,) + lookup
+    if len(_GENE_INDEX_CACHE) > _GENE_INDEX_CACHE_SIZE:
+        _GENE_INDEX_CACHE.popitem(last=False)
+    return lookup
+
+
 def get_raw(adata):
     """Extract the AnnData object saved in adata.raw
 
@@ -182,6 +275,82 @@ def get_raw(adata):
     return adata_raw
 
 
+def get_group_stats(
+    adata, mycat, stats=("mean", "amean", "fraction"), use_raw=True, chunk_size=10000
+):
+    """Calculates mean, linear scale mean and fraction of expressing cells per category
+    Works directly on the sparse expression matrix: the cells are processed in blocks
+    of chunk_size cells and the per category sums are accumulated through a sparse
+    category x cells indicator matrix of every block, so the expression matrix is never
+    densified.
+
+    parameters
+    ----------
+    adata: AnnData
+      an AnnData object
+    mycat: str
+      the category for stratification (e.g. louvain, donor)
+    stats: tuple | default = ('mean', 'amean', 'fraction')
+      the statistics that are calculated: 'mean' (mean of the stored values, i.e.
+      geometric mean if the values are log), 'amean' (arithmetic mean on linear scale,
+      assumes log values: exponentiates, calculates mean and logs back) and
+      'fraction' (fraction of cells expressing a gene)
+    use_raw: bool | default = True
+      use the values stored in adata.raw instead of adata.X
+    chunk_size: int | default = 10000
+      number of cells that are processed at once
+    returns
+    -------
+    dict
+        dictionary of pandas.DataFrames (categories x genes) with the requested
+        statistics, categories without cells are NaN
+    """
+    unknown = set(stats) - {"mean", "amean", "fraction"}
+    if unknown:
+        sys.exit("unknown statistics requested: " + ", ".join(sorted(unknown)))
+    if use_raw:
+        X, gene_ids = adata.raw.X, adata.raw.var.index
+    else:
+        X, gene_ids = adata.X, adata.var.index
+
+    groups = adata.obs[mycat].astype("category")
+    categories = groups.cat.categories
+    codes = groups.cat.codes.values
+
+    sums = {x: zeros((len(categories), X.shape[1])) for x in stats}
+    for start in range(0, X.shape[0], chunk_size):
+        block = X[start : start + chunk_size]
+        # category x cells indicator matrix of the block, cells without a category are left out
+        block_codes = codes[start : start + chunk_size]
+        cells = arange(len(block_codes))[block_codes >= 0]
+        block_indicator = sparse.csr_matrix(
+            (ones(len(cells)), (block_codes[cells], cells)),
+            shape=(len(categories), len(block_codes)),
+        )
+        if not sparse.issparse(block):
+            block = sparse.csr_matrix(block)
+        for x in stats:
+            values = block.copy() if x != "mean" else block
+            if x == "amean":
+                values.data = expm1(values.data)
+            elif x == "fraction":
+                values.data = (values.data != 0).astype(float)
+            sums[x] += (block_indicator @ values).toarray()
+
+    n_cells = bincount(codes[codes >= 0], minlength=len(categories))[:, None]
+    index = CategoricalIndex(categories, categories=categories, name=mycat)
+    results = {}
+    for x in stats:
+        with errstate(invalid="ignore", divide="ignore"):
+            values = sums[x] / n_cells
+        if x == "amean":
+            values = log1p(values)
+        if x != "fraction" and X.dtype.kind == "f":
+            values = values.astype(X.dtype)
+        results[x] = DataFrame(values, index=index, columns=gene_ids.values)
+    return results
+
+
 def get_ameans(adata, mycat, condition=None):
     """Calculates average and fraction expression per category in adata.obs
     Based artihmetic mean expression and fraction cells expressing gene per category
@@ -203,18 +372,11 @@ def get_ameans(adata, mycat, condition=None):
     fraction_obs
         fraction cells expressing a gene per category
     """
-    gene_ids = adata.raw.var.index.values
     try:
-        x = adata.obs[mycat]
         adata.obs[mycat] = adata.obs[mycat].astype("category")
-        clusters = adata.obs[mycat].cat.categories
-        obs = expm1.adata.raw[:, gene_ids].X.toarray()
-        obs = DataFrame(obs, columns=gene_ids, index=adata.obs[mycat])
-        average_obs = log1p(obs.groupby(level=0).mean())
-        obs_bool = obs.astype(bool)
-        fraction_obs = (
-            obs_bool.groupby(level=0).sum() / obs_bool.groupby(level=0).count()
-        )
+        stats = get_group_stats(adata, mycat, stats=("amean", "fraction"))
+        average_obs = stats["amean"]
+        fraction_obs = stats["fraction"]
 
         if condition != None:
             try:
@@ -250,6 +412,50 @@ def formatmean(average_obs, fraction_obs, what, mycond, myg):
     return df
 
 
+def get_rank_genes_groups(
+    rank_genes, keys=("scores", "pvals", "logfoldchanges", "pvals_adj")
+):
+    """Extract the results of scanpy.tl.rank_genes_groups to aligned gene x group DataFrames
+
+    Reads the structured record arrays saved in adata.uns['rank_genes_groups'] once and
+    aligns the values of every group to the genes ranked for the first group. Genes
+    that were not ranked in a group are set to NaN, genes that were not ranked in the
+    first group are not reported.
+
+    parameters
+    ----------
+    rank_genes: `dict`
+        the results of scanpy.tl.rank_genes_groups, i.e. adata.uns['rank_genes_groups']
+    keys: `tuple` | default = ('scores', 'pvals', 'logfoldchanges', 'pvals_adj')
+        the statistics that should be extracted
+
+    returns
+    -------
+    dict
+        dictionary of pandas.DataFrames (genes x groups) with the statistics in keys,
+        indexed by the gene names (index name 'NAME') in the ranked order of the first group
+
+    """
+    names = rank_genes["names"]
+    groups = names.dtype.names
+    genes = Index(names[groups[0]].astype(str), name="NAME")
+
+    # positions of the reference genes in the ranking of every group
+    positions = column_stack(
+        [Index(names[group].astype(str)).get_indexer(genes) for group in groups]
+    )
+    missing = positions < 0
+    positions[missing] = 0
+
+    results = {}
+    for key in keys:
+        values = structured_to_unstructured(rank_genes[key]).astype(float)
+        values = take_along_axis(values, positions, axis=0)
+        values[missing] = nan
+        results[key] = DataFrame(values, index=genes, columns=list(groups))
+    return results
+
+
 def get_means(adata, mycat, condition=None):
     """Calculates average and fraction expression per category in adata.obs
         Based on an AnnData object and an annotation category (e.g. louvain) returns
@@ -271,18 +477,11 @@ def get_means(adata, mycat, condition=None):
         fraction_obs
             fraction cells expressing a gene per category
     """
-    gene_ids = adata.raw.var.index.values
     try:
-        x = adata.obs[mycat]
         adata.obs[mycat] = adata.obs[mycat].astype("category")
-        clusters = adata.obs[mycat].cat.categories
-        obs = adata.raw[:, gene_ids].X.toarray()
-        obs = DataFrame(obs, columns=gene_ids, index=adata.obs[mycat])
-        average_obs = obs.groupby(level=0).mean()
-        obs_bool = obs.astype(bool)
-        fraction_obs = (
-            obs_bool.groupby(level=0).sum() / obs_bool.groupby(level=0).count()
-        )
+        stats = get_group_stats(adata, mycat, stats=("mean", "fraction"))
+        average_obs = stats["mean"]
+        fraction_obs = stats["fraction"]
 
         if condition != None:
             try:
@@ -357,29 +556,46 @@ def get_singlegenedf(myg, adata, cond1, cond2, cond3):
     if (cond3 in adata.obs.columns) == False:
         sys.exit("Please select a valid condition name - cond3")
 
-    myit1 = sort(list(set(adata.obs[cond1])))  ### iterate over elements of condition 1
-    myit2 = sort(list(set(adata.obs[cond2])))  ### iterate over elements of condition 2
-
-    df = DataFrame()
-    for i in myit1:
-        cdata = adata[adata.obs[cond1] == i].copy()
-        myit3 = sort(
-            list(set(cdata.obs[cond3]))
-        )  ### iterate over elements of condition 3
-        for j in myit3:
-            data = cdata[cdata.obs[cond3] == j].copy()
-            average_obs, fraction_obs = get_means(data, cond2)
-            mylen = len(fraction_obs[myg])
-            df1 = DataFrame(
-                data={
-                    "Avg": average_obs[myg],
-                    "Fct": fraction_obs[myg],
-                    cond1: [i] * mylen,
-                    cond3: [j] * mylen,
-                    cond2: fraction_obs[myg].index,
-                }
-            )
-            df = concat([df, df1], ignore_index=True)
+    position = adata.raw.var.index.get_indexer([myg])[0]
+    if position < 0:
+        sys.exit("Please select a valid gene name - myg")
+    # extract only the column of the requested gene
+    values = adata.raw.X[:, [position]]
+    values = values.toarray() if sparse.issparse(values) else asarray(values)
+    values = values.ravel()
+
+    # condition 1 and 3 are iterated in sorted order, condition 2 in the order of
+    # its categories
+    myit1 = sort(list(set(adata.obs[cond1].dropna())))
+    myit3 = sort(list(set(adata.obs[cond3].dropna())))
+    myit2 = adata.obs[cond2].astype("category").cat.categories
+    codes1 = Index(myit1).get_indexer(adata.obs[cond1])
+    codes3 = Index(myit3).get_indexer(adata.obs[cond3])
+    codes2 = adata.obs[cond2].astype("category").cat.codes.values
+    valid = (codes1 >= 0) & (codes2 >= 0) & (codes3 >= 0)
+
+    # one group per combination of the three conditions
+    n_groups = len(myit1) * len(myit3) * len(myit2)
+    groups = ((codes1 * len(myit3) + codes3) * len(myit2) + codes2)[valid]
+    n_cells = bincount(groups, minlength=n_groups)
+    total = bincount(groups, weights=values[valid], minlength=n_groups)
+    expressing = bincount(groups, weights=values[valid] != 0, minlength=n_groups)
+
+    observed = n_cells.nonzero()[0]
+    average = total[observed] / n_cells[observed]
+    if values.dtype.kind == "f":
+        average = average.astype(values.dtype)
+    index1, rest = divmod(observed, len(myit3) * len(myit2))
+    index3, index2 = divmod(rest, len(myit2))
+    df = DataFrame(
+        data={
+            "Avg": average,
+            "Fct": expressing[observed] / n_cells[observed],
+            cond1: myit1[index1],
+            cond3: myit3[index3],
+            cond2: Categorical.from_codes(index2, categories=myit2),
+        }
+    )
     return df
 
 
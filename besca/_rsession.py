@@ -0,0 +1,115 @@
+import importlib
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+# library paths and R packages already attached to the embedded R session
+_LIB_PATHS = set()
+_LIBRARIES = set()
+
+
+def r_session(libraries: list, rlib_loc: str = "", caller: str = "this function"):
+    """Returns rpy2.robjects with the R packages attached.
+
+    R is embedded once per python process by rpy2, the session stays warm
+    between calls. rlib_loc is added to .libPaths() and every package is
+    attached only the first time it is requested, so chaining several R
+    wrappers does not reload their libraries.
+
+    parameters
+    ----------
+    libraries: `list`
+        names of the R packages to attach
+    rlib_loc: `str`
+        R library location that will be added to the default .libPaths()
+    caller: `str`
+        name of the calling function, used in the error message if rpy2 is missing
+
+    returns
+    -------
+    the rpy2.robjects module
+    """
+    if importlib.util.find_spec("rpy2") is None:
+        raise ImportError(caller + " requires rpy2. Install with pip install rpy2")
+    import rpy2.robjects as ro
+
+    if rlib_loc not in _LIB_PATHS:
+        ro.globalenv["rlib_loc"] = rlib_loc
+        ro.r(".libPaths(c(rlib_loc, .libPaths()))")
+        _LIB_PATHS.add(rlib_loc)
+    for library in libraries:
+        if library not in _LIBRARIES:
+            ro.r("suppressPackageStartupMessages(library(" + library + "))")
+            _LIBRARIES.add(library)
+    return ro
+
+
+def _to_r_vector(array, dtype):
+    """copy a numpy array into an R vector with a single memory copy"""
+    from rpy2 import rinterface
+
+    array = np.ascontiguousarray(array, dtype=dtype)
+    if dtype == np.float64:
+        return rinterface.FloatSexpVector.from_memoryview(memoryview(array))
+    return rinterface.IntSexpVector.from_memoryview(memoryview(array))
+
+
+def assign_counts(ro, name: str, X, genes=None, cells=None):
+    """Assign a count matrix to R as a sparse dgCMatrix with genes as rows.
+
+    Only the three arrays of the sparse matrix are transferred: the CSR
+    arrays of the cells x genes matrix are the CSC arrays of its transposed
+    genes x cells matrix, so they are copied as they are into R vectors and
+    assembled to a dgCMatrix without converting the AnnData object.
+
+    parameters
+    ----------
+    ro: `module`
+        rpy2.robjects as returned by r_session
+    name: `str`
+        name of the matrix in the R global environment
+    X: `csr_matrix` | `numpy.ndarray`
+        counts with cells as rows and genes as columns
+    genes: `list` | default = None
+        row names of the R matrix (e.g. adata.var_names)
+    cells: `list` | default = None
+        column names of the R matrix (e.g. adata.obs_names)
+    """
+    if not issparse(X) or X.format != "csr":
+        X = csr_matrix(X)
+    if not X.has_sorted_indices:
+        X = X.sorted_indices()
+
+    ro.globalenv[".besca_x"] = _to_r_vector(X.data, np.float64)
+    ro.globalenv[".besca_i"] = _to_r_vector(X.indices, np.int32)
+    ro.globalenv[".besca_p"] = _to_r_vector(X.indptr, np.int32)
+    ro.globalenv[".besca_dim"] = ro.IntVector([X.shape[1], X.shape[0]])
+    ro.r(
+        name
+        + ' <- new("dgCMatrix", x = .besca_x, i = .besca_i, p = .besca_p, Dim = .besca_dim)'
+    )
+    ro.r("rm(.besca_x, .besca_i, .besca_p, .besca_dim)")
+    for names, setter in [(genes, "rownames"), (cells, "colnames")]:
+        if names is not None:
+            ro.globalenv[".besca_names"] = ro.StrVector([str(x) for x in names])
+            ro.r(setter + "(" + name + ") <- .besca_names")
+            ro.r("rm(.besca_names)")
+
+
+def assign_dense(ro, name: str, X):
+    """Assign a dense numpy array (e.g. principal components) to R as a numeric matrix."""
+    X = np.asarray(X, dtype=np.float64)
+    # R matrices are stored column-major
+    ro.globalenv[".besca_x"] = _to_r_vector(X.ravel(order="F"), np.float64)
+    ro.globalenv[".besca_dim"] = ro.IntVector(list(X.shape))
+    ro.r(name + " <- matrix(.besca_x, nrow = .besca_dim[1], ncol = .besca_dim[2])")
+    ro.r("rm(.besca_x, .besca_dim)")
+
+
+def get_dense(ro, expression: str) -> np.ndarray:
+    """Evaluate an R expression returning a numeric matrix and return it as numpy array."""
+    ro.r(".besca_x <- as.matrix(" + expression + ")")
+    dims = tuple(ro.r("dim(.besca_x)"))
+    values = np.array(ro.r("as.vector(.besca_x)").memoryview(), dtype=np.float64)
+    ro.r("rm(.besca_x)")
+    return values.reshape(dims, order="F")
@@ -23,7 +23,9 @@ from besca.datasets._datasets import (
     pbmc3k_processed,
     pbmc3k_raw,
 )
-from besca.datasets._mito import get_mito_genes
+from besca.datasets._mito import get_mito_genes, get_ribo_genes
+from besca.datasets._genes import build_gene_annotation, get_gene_annotation
+from besca.datasets._homologs import get_mouse_human_conversion
 from besca.datasets._helper import (
     simulated_pbmc3k_raw,
     simulated_Kotliarov2020_processed,
@@ -46,6 +48,10 @@ __all__ = [
     "Granja2019_processed",
     "Granja2019_raw",
     "get_mito_genes",
+    "get_ribo_genes",
+    "build_gene_annotation",
+    "get_gene_annotation",
+    "get_mouse_human_conversion",
     "Kotliarov2020_raw",
     "Kotliarov2020_citeSeq",
     "Kotliarov2020_processed",
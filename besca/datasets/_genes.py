@@ -0,0 +1,144 @@
+import os
+
+from pandas import DataFrame, Index, read_csv
+
+# gene annotation tables that were already loaded, by path of the table
+_GENE_TABLES = {}
+
+_GTF_COLUMNS = {2: "feature", 8: "attributes"}
+
+
+def gene_annotation_dir() -> str:
+    """directory containing the gene annotation tables built by build_gene_annotation"""
+    return os.environ.get(
+        "BESCA_GENE_ANNOTATION",
+        os.path.join(os.path.expanduser("~"), ".cache", "besca", "gene_annotation"),
+    )
+
+
+def _annotation_file(species: str) -> str:
+    return os.path.join(gene_annotation_dir(), species + ".genes.tsv")
+
+
+def build_gene_annotation(gtf_file: str, species: str = "human", outdir: str = None):
+    """Build the local ENSEMBL to SYMBOL table of a species from a GTF file.
+
+    Extracts gene_id and gene_name of all gene records of a GTF file (e.g. the
+    genes.gtf of the cellranger reference) and stores them as a two column
+    table (ENS_GENE_ID  GENE_SYMBOL, same layout as the mito files) in
+    `outdir`. The table is afterwards used by convert_ensembl_to_symbol and
+    convert_symbol_to_ensembl instead of querying mygene.
+
+    Parameters
+    ----------
+    gtf_file: `str`
+        path to a GTF file, can be gzip compressed
+    species: `str` | default = 'human'
+        species the table is stored for
+    outdir: `str` | default = None
+        directory the table is written to, defaults to the directory specified
+        by the environment variable BESCA_GENE_ANNOTATION or
+        ~/.cache/besca/gene_annotation
+
+    Returns
+    -------
+    pandas.DataFrame with the columns ENSEMBL and SYMBOL
+    """
+    gtf = read_csv(
+        gtf_file,
+        sep="\t",
+        comment="#",
+        header=None,
+        usecols=list(_GTF_COLUMNS),
+        dtype=str,
+        engine="c",
+    ).rename(columns=_GTF_COLUMNS)
+    if (gtf.feature == "gene").any():
+        gtf = gtf[gtf.feature == "gene"]
+
+    table = DataFrame(
+        {
+            "ENSEMBL": gtf.attributes.str.extract(r'gene_id "([^"]+)"', expand=False),
+            "SYMBOL": gtf.attributes.str.extract(r'gene_name "([^"]+)"', expand=False),
+        }
+    )
+    table = table.dropna().drop_duplicates("ENSEMBL")
+    table["ENSEMBL"] = _strip_version(table.ENSEMBL)
+    table = table.reset_index(drop=True)
+
+    if outdir is None:
+        outdir = gene_annotation_dir()
+    os.makedirs(outdir, exist_ok=True)
+    annotation_file = os.path.join(outdir, species + ".genes.tsv")
+    table.to_csv(annotation_file, sep="\t", header=False, index=False)
+    _GENE_TABLES.pop(annotation_file, None)
+    print(f"{len(table)} genes written to {annotation_file}")
+    return table
+
+
+def _strip_version(ensembl_ids):
+    """remove the version suffix from ENSEMBL gene ids (ENSG00000141510.17)"""
+    return ensembl_ids.str.replace(r"^(ENS[A-Z]*G\d+)\.\d+$", r"\1", regex=True)
+
+
+def get_gene_annotation(species: str = "human", annotation_file: str = None):
+    """Returns the local ENSEMBL to SYMBOL table of a species.
+
+    The table is read once and kept in memory together with a hash index on
+    both identifier columns, so repeated lookups do not reread the file.
+
+    Parameters
+    ----------
+    species: `str` | default = 'human'
+        species of the table, see build_gene_annotation
+    annotation_file: `str` | default = None
+        tab separated file with the columns ENS_GENE_ID and GENE_SYMBOL (no
+        header) used instead of the table stored for species
+
+    Returns
+    -------
+    dictionary with the table ('table') and an index of the unique ENSEMBL ids
+    ('ENSEMBL') and symbols ('SYMBOL') pointing to the rows of the table, or
+    None if no table is available for the species
+    """
+    if annotation_file is None:
+        annotation_file = _annotation_file(species)
+    if annotation_file in _GENE_TABLES:
+        return _GENE_TABLES[annotation_file]
+    if not os.path.isfile(annotation_file):
+        return None
+
+    table = read_csv(
+        annotation_file,
+        sep="\t",
+        header=None,
+        names=["ENSEMBL", "SYMBOL"],
+        usecols=[0, 1],
+        dtype=str,
+        engine="c",
+    )
+    table["ENSEMBL"] = _strip_version(table.ENSEMBL)
+    lookup = {"table": table}
+    for column in ["ENSEMBL", "SYMBOL"]:
+        # first occurrence of every identifier
+        unique = ~table[column].duplicated()
+        lookup[column] = (Index(table[column][unique]), unique.to_numpy().nonzero()[0])
+    _GENE_TABLES[annotation_file] = lookup
+    return lookup
+
+
+def map_gene_ids(gene_list, lookup: dict, source: str, target: str) -> list:
+    """map a list of gene identifiers from the source to the target column
+
+    Identifiers that are not in the table are returned as None.
+    """
+    index, rows = lookup[source]
+    query = Index([str(x) for x in gene_list])
+    if source == "ENSEMBL":
+        query = Index(_strip_version(query.to_series()))
+    position = index.get_indexer(query)
+    if len(index) == 0:
+        return [None] * len(position)
+    result = lookup["table"][target].to_numpy()[rows[position]].astype(object)
+    result[position < 0] = None
+    return result.tolist()
@@ -0,0 +1,34 @@
+import os
+from functools import lru_cache
+
+from pandas import read_csv
+
+
+@lru_cache(maxsize=None)
+def get_mouse_human_conversion():
+    """Mouse to human ortholog table bundled with besca (homologs/MGItoHGNC.csv).
+
+    The table is read once per process, the same Series is returned on every
+    call and should therefore not be modified in place.
+
+    Returns
+    -------
+    pandas.Series indexed by the MGI mouse symbols with the HGNC human symbols
+    as values, as expected by the conversion argument of
+    bc.tl.sig.combined_signature_score and bc.tl.sig.convert_siggenes
+
+    Example
+    -------
+    >>> import besca as bc
+    >>> conversion = bc.datasets.get_mouse_human_conversion()
+    >>> conversion['Map2k3']
+    'MAP2K3'
+    """
+    table = read_csv(
+        os.path.dirname(__file__) + "/homologs/MGItoHGNC.csv",
+        sep="\t",
+        index_col=0,
+        dtype=str,
+        engine="c",
+    )
+    return table["HGNC"][table.index.notna()]
@@ -1,18 +1,36 @@
 import os
+from functools import lru_cache
 from pandas import read_csv
 
 
-def get_mito_genes(species: str = "human", annotation_type: str = "ENSEMBL"):
+@lru_cache(maxsize=None)
+def _read_reference_genes(filename: str, annotation_type: str):
+    """Reads a reference gene file once, returns the genes as tuple and as frozenset."""
+    # ENS_GENE_ID  GENE_SYMBOL (2 cols)
+    if annotation_type == "SYMBOL":
+        genes = tuple(read_csv(filename, header=None, sep="\t")[1])
+    elif annotation_type == "ENSEMBL":
+        genes = tuple(read_csv(filename, header=None, sep="\t")[0])
+    else:
+        raise ValueError("annotation_type must be either SYMBOL or ENSEMBL")
+    return genes, frozenset(genes)
+
+
+def get_mito_genes(
+    species: str = "human", annotation_type: str = "ENSEMBL", as_set: bool = False
+):
     """Returns the array of genes annotated as mitochondrial in species.
     Parameters
     ----------
     species:`str`| default = human ; species of the datasets.
     Accepted: cyno, cynomolgus, human, mouse, rat, pig
     annotation_type:`str`| default = ENSEMBL.  ENSEMBL or SYMBOL accepted
+    as_set:`bool`| default = False ; return a frozenset for fast membership tests.
+    The reference files are only read once per session.
 
     Returns
     -------
-    mito_genes : array of str
+    mito_genes : array of str (or frozenset of str if as_set)
 
     Example
     -------
@@ -26,11 +44,39 @@ def get_mito_genes(species: str = "human", annotation_type: str = "ENSEMBL"):
     if species not in valid:
         raise ValueError("species must be one of %s." % valid)
     ref_mito_file = os.path.dirname(__file__) + "/mito_files/" + species + ".mito.tsv"
-    # ENS_GENE_ID  GENE_SYMBOL (2 cols)
-    if annotation_type == "SYMBOL":
-        mito_list = list(read_csv(ref_mito_file, header=None, sep="\t")[1])
-    elif annotation_type == "ENSEMBL":
-        mito_list = list(read_csv(ref_mito_file, header=None, sep="\t")[0])
-    else:
-        raise ValueError("annotation_type must be either SYMBOL or ENSEMBL")
-    return mito_list
+    genes, gene_set = _read_reference_genes(ref_mito_file, annotation_type)
+    return gene_set if as_set else list(genes)
+
+
+def get_ribo_genes(
+    species: str = "human", annotation_type: str = "ENSEMBL", as_set: bool = False
+):
+    """Returns the array of genes annotated as ribosomal in species.
+    Parameters
+    ----------
+    species:`str`| default = human ; species of the datasets.
+    Accepted: human
+    annotation_type:`str`| default = ENSEMBL.  ENSEMBL or SYMBOL accepted
+    as_set:`bool`| default = False ; return a frozenset for fast membership tests.
+    The reference files are only read once per session.
+
+    Returns
+    -------
+    ribo_genes : array of str (or frozenset of str if as_set)
+
+    Example
+    -------
+    >>> import besca as bc
+    >>> ribo_genes = bc.datasets.get_ribo_genes('human', 'SYMBOL', as_set=True)
+    >>> 'RPS9' in ribo_genes
+    True
+
+    """
+    valid = {"human"}
+    if species not in valid:
+        raise ValueError("species must be one of %s." % valid)
+    ref_ribo_file = (
+        os.path.dirname(__file__) + "/mito_files/" + species + ".ribosomal.tsv"
+    )
+    genes, gene_set = _read_reference_genes(ref_ribo_file, annotation_type)
+    return gene_set if as_set else list(genes)
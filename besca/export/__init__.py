@@ -9,6 +9,7 @@ from besca.export._export import (
     ranked_genes,
     raw_to_mtx,
 )
+from besca.export._mtx import write_mtx
 
 __all__ = [
     "X_to_mtx",
@@ -20,4 +21,5 @@ __all__ = [
     "generate_gep",
     "ranked_genes",
     "pseudobulk",
+    "write_mtx",
 ]
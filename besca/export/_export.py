@@ -1,22 +1,34 @@
+import gzip
 import os
 import sys
 from io import BytesIO
 
 import pkg_resources
-from numpy import arange, expm1, ix_, ndarray, round, where, zeros
-from pandas import DataFrame, concat, read_csv
+from numpy import (
+    arange,
+    array,
+    asarray,
+    bincount,
+    concatenate,
+    diff,
+    expm1,
+    full,
+    ix_,
+    ndarray,
+    ones,
+    repeat,
+    round,
+    unique,
+    where,
+    zeros,
+)
+from pandas import Categorical, DataFrame, concat, read_csv
 from scanpy import AnnData
 from scipy import io, sparse
-from scipy.io.mmio import MMFile
 
-from besca._helper import get_raw
-
-
-## overwriding _field_template to avoid scientific notations
-class MMFileFixedFormat(MMFile):
-    def _field_template(self, field, precision):
-        # Override MMFile._field_template.
-        return f"%.{precision}f\n"
+from besca._helper import get_rank_genes_groups, get_raw
+from besca.export._mtx import write_mtx
+from besca.export._write import write_gct, write_table
 
 
 # Functions to export AnnData objects to FAIR dataformat
@@ -26,6 +38,7 @@ def X_to_mtx(
     write_metadata: bool = False,
     geneannotation: str = "SYMBOL",
     additional_geneannotation: str = "ENSEMBL",
+    compression: str = None,
 ) -> None:
     """export adata object to mtx format (matrix.mtx, genes.tsv, barcodes.tsv)
 
@@ -55,6 +68,9 @@ def X_to_mtx(
     additional_geneannotation: `str` | default = None
         string identifying the coloumn name in which either the SYMBOL or the ENSEMBL geneids
         are contained as additional gene annotation in adata.var
+    compression: `str` | default = None
+        if 'gzip' matrix.mtx.gz, genes.tsv.gz and barcodes.tsv.gz are written instead of
+        the uncompressed files
 
     returns
     -------
@@ -68,15 +84,21 @@ def X_to_mtx(
     if not os.path.exists(outpath):
         os.makedirs(outpath)
 
-    ### write out matrix.mtx as float with 3 significant digits
-    print("writing out matrix.mtx ...")
+    if compression not in [None, "gzip"]:
+        sys.exit("compression should be either None or 'gzip'")
+    suffix = ".gz" if compression == "gzip" else ""
+    _open = gzip.open if compression == "gzip" else open
 
-    if type(adata.X) == ndarray:
-        E = sparse.csr_matrix(adata.X).T
-    else:
-        E = adata.X.tocsr().T  # transpose back into the same format as we imported it
+    ### write out matrix.mtx as float with 1 decimal
+    print("writing out matrix.mtx ...")
 
-    MMFileFixedFormat().write(os.path.join(outpath, "matrix.mtx"), a=E, precision=2)
+    # streams blocks of cells, the transposed genes x cells layout is written directly
+    write_mtx(
+        adata.X,
+        os.path.join(outpath, "matrix.mtx" + suffix),
+        decimals=1,
+        compression=compression,
+    )
     print("adata.X successfully written to matrix.mtx.")
     ### export genes
 
@@ -114,7 +136,7 @@ def X_to_mtx(
         gene_feature = adata.var.get("feature_type")
 
     # write the genes out in the correct format (first ENSEMBL THEN SYMBOL)
-    with open(os.path.join(outpath, "genes.tsv"), "w") as fp:
+    with _open(os.path.join(outpath, "genes.tsv" + suffix), "wt") as fp:
         if feature is not None:
             for ENSEMBL, symbol, feature in zip(
                 genes_ENSEMBL, genes_SYMBOL, gene_feature
@@ -128,7 +150,7 @@ def X_to_mtx(
 
     ### write out the cellbarcodes
     cellbarcodes = adata.obs_names.tolist()
-    with open(os.path.join(outpath, "barcodes.tsv"), "w") as fp:
+    with _open(os.path.join(outpath, "barcodes.tsv" + suffix), "wt") as fp:
         for barcode in cellbarcodes:
             fp.write(barcode + "\n")
         fp.close()
@@ -137,9 +159,7 @@ def X_to_mtx(
     ### export annotation
     if write_metadata == True:
         annotation = adata.obs
-        annotation.to_csv(
-            os.path.join(outpath, "metadata.tsv"), sep="\t", header=True, index=True
-        )
+        write_table(annotation, os.path.join(outpath, "metadata.tsv"), sep="\t")
         print("annotation successfully written out to metadata.tsv")
 
     return None
@@ -152,6 +172,7 @@ def raw_to_mtx(
     write_metadata: bool = False,
     geneannotation: str = "ENSEMBL",
     additional_geneannotation: str = None,
+    compression: str = None,
 ) -> None:
     """export adata.raw to .mtx (matrix.mtx, genes.tsv, barcodes, tsv)
 
@@ -183,6 +204,9 @@ def raw_to_mtx(
     additional_geneannotation: `str` | default = None
         string identifying the coloumn name in which either the SYMBOL symbols or the ENSEMBL geneids
         are contained as additional gene annotation in adata.var
+    compression: `str` | default = None
+        if 'gzip' matrix.mtx.gz, genes.tsv.gz and barcodes.tsv.gz are written instead of
+        the uncompressed files
     returns
     -------
     None
@@ -201,6 +225,7 @@ def raw_to_mtx(
         write_metadata=write_metadata,
         geneannotation=geneannotation,
         additional_geneannotation=additional_geneannotation,
+        compression=compression,
     )
 
 
@@ -356,6 +381,67 @@ def labeling_info(
     sys.exit(0)
 
 
+def _label_aggregates(X, labels, label_names):
+    """compute per label linear scale means and fraction of positive cells
+
+    Builds a sparse cell x label indicator matrix (weighted with 1/label size)
+    once and obtains the mean expression of every label with a single sparse
+    matrix product over the expm1 transformed values. The number of positive
+    cells per label and gene is counted from the same sparsity structure, so
+    no transposed or densified copy of the expression matrix is created.
+    The summation order and precision are the same as when averaging the
+    cells of each label separately, so the results are identical.
+
+    parameters
+    ----------
+    X: `ndarray` | `scipy.sparse.spmatrix`
+        cells x genes expression matrix on log1p scale
+    labels: `pd.Series`
+        label of each cell
+    label_names: `list`
+        names of the labels that are to be aggregated, defines the column order
+
+    returns
+    -------
+    tuple of `ndarray`
+        genes x labels matrices of the mean linear scale expression and of the
+        fraction of cells with a stored value
+
+    """
+    if type(X) == ndarray:
+        X = sparse.csr_matrix(X)
+    else:
+        X = X.tocsr()
+    n_genes = X.shape[1]
+    num_labels = len(label_names)
+
+    codes = Categorical(labels.astype(str), categories=label_names).codes
+    cells = where(codes >= 0)[0]
+    codes = codes[cells]
+    labeling_size = bincount(codes, minlength=num_labels)
+
+    # revert to linear scale, the sparsity structure is shared with X
+    E = sparse.csr_matrix((expm1(X.data), X.indices, X.indptr), shape=X.shape)
+    inverse_size = array([1.0 / size for size in labeling_size], dtype=E.dtype)
+    indicator = sparse.csr_matrix(
+        (inverse_size[codes], (cells, codes)), shape=(X.shape[0], num_labels)
+    )
+    average = (E.T @ indicator).toarray()
+
+    # count stored values per label and gene
+    entry_codes = full(X.shape[0], -1, dtype=codes.dtype)
+    entry_codes[cells] = codes
+    entry_codes = repeat(entry_codes, diff(X.indptr))
+    keep = entry_codes >= 0
+    counts = bincount(
+        X.indices[keep] * num_labels + entry_codes[keep],
+        minlength=n_genes * num_labels,
+    ).reshape(n_genes, num_labels)
+    fractpos = counts.astype(float) / labeling_size
+
+    return average, fractpos
+
+
 def write_labeling_to_files(
     adata: AnnData,
     outpath: str = None,
@@ -407,12 +493,10 @@ def write_labeling_to_files(
     if not os.path.exists(outpath):
         os.makedirs(outpath)
 
-    data.to_csv(
-        os.path.join(outpath, filename), sep="\t", header=True, index_label="CELL"
-    )
+    write_table(data, os.path.join(outpath, filename), sep="\t", index_label="CELL")
     print("mapping of cells to ", column, "exported successfully to", filename)
 
-    if export_average:
+    if export_average or export_fractpos:
         if column == "louvain" or column == "leiden":
             labeling = sorted(set(adata.obs[column].astype(int)))
         else:
@@ -422,34 +506,23 @@ def write_labeling_to_files(
         for i in range(len(labeling)):
             label_names.append(str(labeling[i]))
 
-        num_labels = len(label_names)
-
         if use_raw:
-            gct = DataFrame(index=adata.raw.var_names, columns=label_names)
+            X = adata.raw.X
+            var_names = adata.raw.var_names
             mydat = adata.raw.var.copy()
-            if type(adata.raw.X) == ndarray:
-                E = sparse.csr_matrix(adata.raw.X).T
-            else:
-                E = adata.raw.X.tocsr().T
-
         else:
-            gct = DataFrame(index=adata.var_names, columns=label_names)
+            X = adata.X
+            var_names = adata.var_names
             mydat = adata.var.copy()
-            if type(adata.X) == ndarray:
-                E = sparse.csr_matrix(adata.X).T
-            else:
-                E = adata.X.tocsr().T
-
-        # revert to linear scale
-        E = E.expm1()
 
-        for i in range(num_labels):
-            cells = where(adata.obs.get(column) == label_names[i])[0]
-            gct.iloc[:, i] = E[:, cells].mean(axis=1)  # get mean expression per gene
-            labeling_size = len(cells)
+        # per label linear scale means and fraction of positive cells in one pass
+        average, fractpos = _label_aggregates(X, adata.obs.get(column), label_names)
 
         mydat = mydat.loc[:, ["SYMBOL", "ENSEMBL"]]
         mydat.rename(columns={"SYMBOL": "Description"}, inplace=True)
+
+    if export_average:
+        gct = DataFrame(average, index=var_names, columns=label_names)
         gct = mydat.merge(gct, how="right", left_index=True, right_index=True)
 
         gct.set_index("ENSEMBL", inplace=True)
@@ -457,89 +530,18 @@ def write_labeling_to_files(
 
         # write out average expression
         gctFile_average = os.path.join(outpath, "average.gct")
-        with open(gctFile_average, "w") as fp:
-            fp.write("#1.2" + "\n")
-            fp.write(
-                str(gct.shape[0]) + "\t" + str(gct.shape[1] - 1) + "\n"
-            )  # "description" already merged in as a column
-        fp.close()
-        # ...and then the matrix
-        gct.to_csv(
-            gctFile_average,
-            sep="\t",
-            index=True,
-            index_label="NAME",
-            header=True,
-            mode="a",
-            float_format="%.3f",
-        )
+        write_gct(gct, gctFile_average)
         print("average.gct exported successfully to file")
 
     if export_fractpos:
-        if column == "louvain" or column == "leiden":
-            labeling = sorted(set(adata.obs[column].astype(int)))
-        else:
-            labeling = sorted(set(adata.obs[column]))
-
-        label_names = []
-        for i in range(len(labeling)):
-            label_names.append(str(labeling[i]))
-
-        num_labels = len(label_names)
-
-        if use_raw:
-            f = DataFrame(index=adata.raw.var_names, columns=label_names)
-            mydat = adata.raw.var.copy()
-            if type(adata.raw.X) == ndarray:
-                E = sparse.csr_matrix(adata.raw.X).T
-            else:
-                E = adata.raw.X.tocsr().T
-        else:
-            gct = DataFrame(index=adata.var_names, columns=label_names)
-            f = DataFrame(index=adata.var_names, columns=label_names)
-            mydat = adata.var.copy()
-            if type(adata.X) == ndarray:
-                E = sparse.csr_matrix(adata.X).T
-            else:
-                E = adata.X.tocsr().T
-        # revert to linear scale
-        E = E.expm1()
-
-        for i in range(num_labels):
-            cells = where(adata.obs.get(column) == label_names[i])[0]
-            a = E[:, cells].getnnz(axis=1)  # get number of values not 0
-            f.iloc[:, i] = a.copy()
-        f = f.astype(float)
-        for i in range(num_labels):
-            cells = where(adata.obs.get(column) == label_names[i])[0]
-            labeling_size = len(cells)
-            f[label_names[i]] = f[label_names[i]] / labeling_size
-
-        mydat = mydat.loc[:, ["SYMBOL", "ENSEMBL"]]
-        mydat.rename(columns={"SYMBOL": "Description"}, inplace=True)
-
+        f = DataFrame(fractpos, index=var_names, columns=label_names)
         f = mydat.merge(f, how="right", left_index=True, right_index=True)
         f.set_index("ENSEMBL", inplace=True)
         f.index.names = ["NAME"]
 
         # write out frac_pos.gct
         gctFile_fracpos = os.path.join(outpath, "fract_pos.gct")
-        with open(gctFile_fracpos, "w") as fp:
-            fp.write("#1.2" + "\n")
-            fp.write(
-                str(f.shape[0]) + "\t" + str(f.shape[1] - 1) + "\n"
-            )  # "description" already merged in as a column
-        fp.close()
-        # ...and then the matrix
-        f.to_csv(
-            gctFile_fracpos,
-            sep="\t",
-            index=True,
-            index_label="NAME",
-            header=True,
-            mode="a",
-            float_format="%.3f",
-        )
+        write_gct(f, gctFile_fracpos)
         print("fract_pos.gct exported successfully to file")
 
     return None
@@ -622,40 +624,41 @@ def analysis_metadata(
                 "need to have calculated 'n_genes' and stored it in adata.obs, n_genes will not be exported"
             )
 
-    obsm = adata.obsm.to_df()
-
+    # only read the requested coordinates from adata.obsm
     if n_pcs > 0:
-        for i in range(1, n_pcs + 1):
-            if obsm.get("X_pca" + str(i)) is None:
-                sys.exit(
-                    "number of PCA components requested not saved in adata.obsm, please ensure that PCA components have been calculated"
-                )
-            else:
-                data["PCA.PC" + str(i)] = obsm.get("X_pca" + str(i)).tolist()
+        pca = adata.obsm.get("X_pca")
+        if pca is None or asarray(pca).shape[1] < n_pcs:
+            sys.exit(
+                "number of PCA components requested not saved in adata.obsm, please ensure that PCA components have been calculated"
+            )
+        else:
+            for i in range(1, n_pcs + 1):
+                data["PCA.PC" + str(i)] = asarray(pca)[:, i - 1].astype(float)
 
     if umap:
-        if obsm.get("X_umap1") is None:
+        if adata.obsm.get("X_umap") is None:
             sys.exit(
                 "no UMAP coordinates found in adata.obsm, please ensure that UMAP coordinates have been calculated"
             )
         else:
-            data["UMAP.c1"] = obsm.get("X_umap1").tolist()
-            data["UMAP.c2"] = obsm.get("X_umap2").tolist()
+            data["UMAP.c1"] = asarray(adata.obsm["X_umap"])[:, 0].astype(float)
+            data["UMAP.c2"] = asarray(adata.obsm["X_umap"])[:, 1].astype(float)
 
     if tsne:
-        if obsm.get("X_tsne1") is None:
+        if adata.obsm.get("X_tsne") is None:
             sys.exit(
                 "no tSNE coordinates found in adata.obsm, please ensure that tSNE coordinates have been calculated"
             )
         else:
-            data["tSNE.c1"] = obsm.get("X_tsne1").tolist()
-            data["tSNE.c2"] = obsm.get("X_tsne2").tolist()
+            data["tSNE.c1"] = asarray(adata.obsm["X_tsne"])[:, 0].astype(float)
+            data["tSNE.c2"] = asarray(adata.obsm["X_tsne"])[:, 1].astype(float)
 
     ### check if the outdir exists if not create
     if not os.path.exists(outpath):
         os.makedirs(outpath)
 
-    data.to_csv(
+    write_table(
+        data,
         os.path.join(outpath, "analysis_metadata.tsv"),
         sep="\t",
         index_label="CELL",
@@ -712,101 +715,26 @@ def ranked_genes(
         # extract relevant data from adata object
         rank_genes = adata.uns["rank_genes_groups"]
 
-    # get group names
-    groups = rank_genes["names"].dtype.names
-
-    # get number of groups
-    group_number = len(groups)
+    frames = get_rank_genes_groups(
+        rank_genes, keys=["scores", "pvals", "logfoldchanges"]
+    )
 
     # get gene information
     mydat = adata.raw.var.loc[:, ["SYMBOL", "ENSEMBL"]]
     mydat.rename(columns={"SYMBOL": "Description"}, inplace=True)
 
-    # initialize dataframe for storing the scores
-    scores = DataFrame(
-        {"n_" + key[:1]: rank_genes[key][groups[0]] for key in ["names", "scores"]}
-    )
-    scores.rename(columns={"n_s": groups[0], "n_n": "NAME"}, inplace=True)
-    scores.set_index("NAME", inplace=True)
-    scores.index = scores.index.astype(str)
-
-    for i in range(1, group_number):
-        n_scores = DataFrame(
-            {"n_" + key[:1]: rank_genes[key][groups[i]] for key in ["names", "scores"]}
+    results = []
+    for key in ["scores", "pvals", "logfoldchanges"]:
+        # merge in gene annotation
+        result = mydat.merge(
+            frames[key], how="right", left_index=True, right_index=True
         )
-        n_scores.set_index("n_n", inplace=True)
-        n_scores.index = n_scores.index.astype(str)
-        scores = scores.merge(n_scores, how="left", left_index=True, right_index=True)
-        newname = groups[i]
-        scores.rename(columns={"n_s": newname}, inplace=True)
-    scores = scores.astype(float)
-
-    # merge in gene annotation
-    scores = mydat.merge(scores, how="right", left_index=True, right_index=True)
-
-    # make index into ENSEMBL instead of symbol
-    scores.set_index("ENSEMBL", inplace=True)
-    scores.index.names = ["NAME"]
-
-    # get pvalues
-    # initialize dataframe for storing the pvalues
-    pvalues = DataFrame(
-        {"n_" + key[:1]: rank_genes[key][groups[0]] for key in ["names", "pvals"]}
-    )
-    pvalues.rename(columns={"n_p": groups[0], "n_n": "NAME"}, inplace=True)
-    pvalues.set_index("NAME", inplace=True)
-    pvalues.index = pvalues.index.astype(str)
-
-    for i in range(1, group_number):
-        n_pvalues = DataFrame(
-            {"n_" + key[:1]: rank_genes[key][groups[i]] for key in ["names", "pvals"]}
-        )
-        n_pvalues.set_index("n_n", inplace=True)
-        n_pvalues.index = n_pvalues.index.astype(str)
-        pvalues = pvalues.merge(
-            n_pvalues, how="left", left_index=True, right_index=True
-        )
-        newname = groups[i]
-        pvalues.rename(columns={"n_p": newname}, inplace=True)
-    pvalues = pvalues.astype(float)
-
-    # merge in pvalues
-    pvalues = mydat.merge(pvalues, how="right", left_index=True, right_index=True)
-
-    # make index into ENSEMBL instead of symbol
-    pvalues.set_index("ENSEMBL", inplace=True)
-    pvalues.index.names = ["NAME"]
-
-    logFC = DataFrame(
-        {
-            "n_" + key[:1]: rank_genes[key][groups[0]]
-            for key in ["names", "logfoldchanges"]
-        }
-    )
-    logFC.rename(columns={"n_l": groups[0], "n_n": "NAME"}, inplace=True)
-    logFC.set_index("NAME", inplace=True)
-    logFC.index = logFC.index.astype(str)
-
-    for i in range(1, group_number):
-        n_logFC = DataFrame(
-            {
-                "n_" + key[:1]: rank_genes[key][groups[i]]
-                for key in ["names", "logfoldchanges"]
-            }
-        )
-        n_logFC.set_index("n_n", inplace=True)
-        n_logFC.index = n_logFC.index.astype(str)
-        logFC = logFC.merge(n_logFC, how="left", left_index=True, right_index=True)
-        newname = groups[i]
-        logFC.rename(columns={"n_l": newname}, inplace=True)
-    logFC = logFC.astype(float)
-
-    # merge in pvalues
-    logFC = mydat.merge(logFC, how="right", left_index=True, right_index=True)
 
-    # make index into ENSEMBL instead of symbol
-    logFC.set_index("ENSEMBL", inplace=True)
-    logFC.index.names = ["NAME"]
+        # make index into ENSEMBL instead of symbol
+        result.set_index("ENSEMBL", inplace=True)
+        result.index.names = ["NAME"]
+        results.append(result)
+    scores, pvalues, logFC = results
 
     ### check if the outdir exists if not create
     if not os.path.exists(outpath):
@@ -830,50 +758,78 @@ def ranked_genes(
         )
 
     # write out rankfile
-    with open(gct_rank_File, "w") as fp:
-        fp.write("#1.2" + "\n")
-        fp.write(
-            str(scores.shape[0]) + "\t" + str(scores.shape[1] - 1) + "\n"
-        )  # "description" already merged in as a column
-    fp.close()
-    scores.to_csv(
-        gct_rank_File, sep="\t", index=True, header=True, mode="a", float_format="%.3f"
-    )
+    write_gct(scores, gct_rank_File)
     print(gct_rank_File, "written out")
 
     # write out pvalues
-    with open(gct_pvalue_File, "w") as fp:
-        fp.write("#1.2" + "\n")
-        fp.write(
-            str(pvalues.shape[0]) + "\t" + str(pvalues.shape[1] - 1) + "\n"
-        )  # "description" already merged in as a column
-    fp.close()
-    pvalues.to_csv(
-        gct_pvalue_File,
-        sep="\t",
-        index=True,
-        header=True,
-        mode="a",
-        float_format="%.3e",
-    )
+    write_gct(pvalues, gct_pvalue_File, float_format="%.3e")
     print(gct_pvalue_File, "written out")
 
     # write out logFC
-    with open(gct_logFC_File, "w") as fp:
-        fp.write("#1.2" + "\n")
-        fp.write(
-            str(logFC.shape[0]) + "\t" + str(logFC.shape[1] - 1) + "\n"
-        )  # "description" already merged in as a column
-    fp.close()
-    logFC.to_csv(
-        gct_logFC_File, sep="\t", index=True, header=True, mode="a", float_format="%.3f"
-    )
+    write_gct(logFC, gct_logFC_File)
     print(gct_logFC_File, "written out")
 
     return None
     sys.exit(0)
 
 
+def _pseudobulk_sums(X, groups, samples, n_groups, n_samples):
+    """sum linear scale expression of all group x sample combinations
+
+    All sums are obtained from one sparse product of the expm1 transformed
+    expression matrix with a cell x (group, sample) indicator matrix. Every cell
+    contributes to the column of its group and sample as well as to the column
+    of its sample in an additional block covering all cells (group n_groups).
+    Cells are summed up in their order in X and in the precision of X, the same
+    as when summing up the expression of the corresponding subsets.
+
+    parameters
+    ----------
+    X: `ndarray` | `scipy.sparse.spmatrix`
+        cells x genes expression matrix on log1p scale
+    groups: `ndarray`
+        integer code of the group of every cell, cells with negative codes are
+        only added to the block covering all cells
+    samples: `ndarray`
+        integer code of the sample of every cell
+    n_groups: `int`
+        number of groups
+    n_samples: `int`
+        number of samples
+
+    returns
+    -------
+    tuple of `ndarray`
+        genes x ((n_groups + 1) * n_samples) matrix of summed expression with the
+        column of group g and sample s at g * n_samples + s, and a boolean
+        (n_groups + 1) x n_samples matrix indicating which combinations contain cells
+
+    """
+    if type(X) == ndarray:
+        X = sparse.csr_matrix(X)
+    else:
+        X = X.tocsr()
+    n_cells = X.shape[0]
+
+    # revert to linear scale, the sparsity structure is shared with X
+    E = sparse.csr_matrix((expm1(X.data), X.indices, X.indptr), shape=X.shape)
+
+    cells = arange(n_cells)
+    grouped = where(groups >= 0)[0]
+    rows = concatenate([cells[grouped], cells])
+    cols = concatenate(
+        [groups[grouped] * n_samples + samples[grouped], n_groups * n_samples + samples]
+    )
+    indicator = sparse.csr_matrix(
+        (ones(len(rows), dtype=E.dtype), (rows, cols)),
+        shape=(n_cells, (n_groups + 1) * n_samples),
+    )
+    sums = (E.T @ indicator).toarray()
+
+    present = bincount(cols, minlength=(n_groups + 1) * n_samples) > 0
+    return sums, present.reshape(n_groups + 1, n_samples)
+
+
 def pseudobulk(
     adata: AnnData,
     outpath: str = None,
@@ -942,95 +898,80 @@ def pseudobulk(
     if not os.path.exists(outpath):
         os.makedirs(outpath)
 
-    ### create adata subsets for each column value
     adata.obs[split_condition] = adata.obs[split_condition].astype("str")
     adata.obs[split_condition] = adata.obs[split_condition].astype("category")
     adata.obs[column] = adata.obs[column].astype("category")
 
+    ### sum expression of all (column value, split_condition) combinations at once
+    myexp = list(
+        adata.obs[split_condition].cat.categories
+    )  ### these are all different levels for experiments
+    mysums, present = _pseudobulk_sums(
+        adata.raw.X,
+        adata.obs[column].cat.codes.values,
+        adata.obs[split_condition].cat.codes.values,
+        len(adata.obs[column].cat.categories),
+        len(myexp),
+    )
+
     bulks = {}
-    myset = list(set(adata.obs[column]))
-    for i in myset:
-        ii = i.replace(" ", "_")  ## to avoid spaces in cell names
-        bulks[ii] = adata[adata.obs[column].isin([i])].copy()
-    bulks["all"] = adata.copy()
+    for code, i in enumerate(adata.obs[column].cat.categories):
+        if present[code].any():
+            ii = i.replace(" ", "_")  ## to avoid spaces in cell names
+            bulks[ii] = code
+    bulks["all"] = len(adata.obs[column].cat.categories)
 
-    ### go through each adata subset and export pseudobulk
+    ### go through each column value and export pseudobulk
+    mydat = adata.raw.var.loc[:, ["SYMBOL", "ENSEMBL"]]
+    mydat.rename(columns={"SYMBOL": "Description"}, inplace=True)
     dfbulks = {}
-    for x in bulks.keys():
-        # sum expression
-        auxdata = bulks[x].copy()
-        myexp = list(
-            auxdata.obs[split_condition].cat.categories
-        )  ### these are all different levels for experiments
-        mysums = zeros((len(auxdata.raw.var.index), len(myexp)))
-        for i in range(len(myexp)):
-            mysums[:, i] = expm1(
-                auxdata[auxdata.obs[split_condition] == myexp[i]].raw.X
-            ).sum(axis=0)
-        mysums = DataFrame(mysums)
-        mysums.index = adata.raw.var.index
-        mysums.columns = [x + "." + y for y in myexp]
-        dfbulks[x] = mysums
-
-        mydat = auxdata.raw.var.loc[:, ["SYMBOL", "ENSEMBL"]]
-        mydat.rename(columns={"SYMBOL": "Description"}, inplace=True)
+    for x, code in bulks.items():
+        samples = where(present[code])[0]
+        dfbulks[x] = DataFrame(
+            mysums[:, code * len(myexp) + samples].astype(float),
+            index=adata.raw.var.index,
+            columns=[x + "." + myexp[y] for y in samples],
+        )
+
         gct = mydat.merge(dfbulks[x], how="right", left_index=True, right_index=True)
         gct.set_index("ENSEMBL", inplace=True)
         gct.index.names = ["NAME"]
-        gct.columns = ["Description"] + myexp
+        gct.columns = ["Description"] + [myexp[y] for y in samples]
 
         # write out average expression
         gctFile_pseudo = outpath + "Pseudobulk-" + label + "-" + x + ".gct"
-        with open(gctFile_pseudo, "w") as fp:
-            fp.write("#1.2" + "\n")
-            fp.write(
-                str(gct.shape[0]) + "\t" + str(gct.shape[1] - 1) + "\n"
-            )  # "description" already merged in as a column
-        fp.close()
-        # ...and then the matrix
-        gct.to_csv(
-            gctFile_pseudo,
-            sep="\t",
-            index=True,
-            index_label="NAME",
-            header=True,
-            mode="a",
-            float_format="%.3f",
-        )
+        write_gct(gct, gctFile_pseudo)
         print("Pseudobulk-" + label + "-" + x + ".gct exported successfully to file")
 
     #### Output into single .tsv file
     dfmerge = concat(dfbulks, axis=1)
     dfmerge.columns = dfmerge.columns.droplevel()
-    dfmerge.to_csv(
-        outpath + "Pseudobulk-" + label + ".tsv", sep="\t", index_label=False
+    write_table(
+        dfmerge, outpath + "Pseudobulk-" + label + ".tsv", sep="\t", index_label=False
     )
 
-    ### Export one metadata file
-    myexp = list(adata.obs[split_condition].cat.categories)
+    ### Export one metadata file, using the first cell of every experiment
     colindex = range(
         0, len(adata.obs.columns)
     )  ### replace if only a subset of metadata should be used
+    obs = adata.obs.iloc[:, colindex]
+    first = obs.iloc[
+        unique(adata.obs[split_condition].cat.codes.values, return_index=True)[1]
+    ]
     mysums = []
     for i in range(len(myexp)):
-        mysums.append(
-            list(
-                adata[adata.obs[split_condition] == myexp[i]]
-                .obs.iloc[:, colindex]
-                .iloc[0, :]
-            )
-        )
+        mysums.append(list(first.iloc[i, :]))
     mysums = DataFrame(mysums).transpose()
-    mysums.index = (
-        adata[adata.obs[split_condition] == myexp[i]].obs.iloc[:, colindex].columns
-    )
+    mysums.index = obs.columns
     mysums.columns = myexp
     mysums = mysums.transpose().drop(labels=todrop, axis=1, errors="ignore")
     mysums["ID"] = list(mysums.index)
     colorder = ["ID", main_condition] + (
         mysums.columns.drop(["ID", main_condition]).tolist()
     )
-    mysums.loc[:, colorder].to_csv(outpath + "Pseudobulk.meta", sep="\t", index=False)
+    write_table(
+        mysums.loc[:, colorder], outpath + "Pseudobulk.meta", sep="\t", index=False
+    )
 
     return dfmerge
     sys.exit(0)
@@ -1130,11 +1071,11 @@ def generate_gep(
     gct.index.names = ["NAME"]
 
     gctFile_average = os.path.join(outpath, filename)
-    gct.to_csv(
+    write_table(
+        gct,
         gctFile_average,
-        index=True,
+        sep=",",
         index_label="NAME",
-        header=True,
         float_format="%.3f",
     )
     print("{} exported successfully to file".format(filename))
@@ -0,0 +1,126 @@
+import gzip
+
+from numpy import (
+    arange,
+    count_nonzero,
+    cumsum,
+    diff,
+    hstack,
+    int64,
+    ndarray,
+    repeat,
+    searchsorted,
+)
+from scipy import sparse
+
+from besca.export._write import _ascii_digits, _fixed_decimals, _text_buffer, _width
+
+# matrix market field names for the different numpy dtype kinds
+_MTX_FIELDS = {"i": "integer", "u": "unsigned-integer", "f": "real"}
+
+
+def _format_entries(rows, cols, values, decimals):
+    """format coordinate entries as 'row col value' lines
+
+    Every line is assembled from ascii digit blocks in fixed width columns of
+    one output buffer, the padding is removed again with a single boolean mask.
+    """
+    k, negative, invalid = _fixed_decimals(values, decimals)
+    if invalid.any():
+        raise ValueError("matrix contains values that can not be written out")
+    integer_part = k // 10**decimals
+
+    widths = [_width(rows), 1, _width(cols), 1, 1, _width(integer_part)]
+    if decimals > 0:
+        widths += [1, decimals]
+    widths += [1]
+    text, keep, column = _text_buffer(len(rows), widths)
+
+    _ascii_digits(rows, text[:, column[0]], keep[:, column[0]])
+    text[:, column[1]] = ord(" ")
+    _ascii_digits(cols, text[:, column[2]], keep[:, column[2]])
+    text[:, column[3]] = ord(" ")
+    text[:, column[4]] = ord("-")
+    keep[:, column[4]] = negative[:, None]
+    _ascii_digits(integer_part, text[:, column[5]], keep[:, column[5]])
+    if decimals > 0:
+        text[:, column[6]] = ord(".")
+        _ascii_digits(
+            k % 10**decimals, text[:, column[7]], keep[:, column[7]], pad=True
+        )
+    text[:, column[-1]] = ord("\n")
+
+    return text[keep].tobytes()
+
+
+def write_mtx(
+    X,
+    filename: str,
+    decimals: int = 1,
+    compression: str = None,
+    chunk_size: int = 1000000,
+) -> None:
+    """write a cells x genes matrix to a Matrix Market coordinate file
+
+    The matrix is written in the genes x cells orientation expected by the scseq
+    database (same layout as produced by transposing X and passing it to
+    scipy.io.mmwrite) without materializing the transposed matrix. X is
+    streamed in blocks of cells containing about chunk_size stored values,
+    each block is formatted with vectorized fixed precision formatting and
+    written out in one go.
+
+    parameters
+    ----------
+    X: `scipy.sparse.spmatrix` | `ndarray`
+        cells x genes matrix that should be written out
+    filename: `str`
+        path of the file that is to be written
+    decimals: `int` | default = 1
+        number of decimals that are written for every value
+    compression: `str` | default = None
+        None for plain text or 'gzip' to write a gzip compressed file
+    chunk_size: `int` | default = 1000000
+        approximate number of stored values that are formatted at once
+
+    returns
+    -------
+    None
+        writes the matrix to the specified file
+
+    """
+    if compression not in [None, "gzip"]:
+        raise ValueError("compression should be None or 'gzip'")
+    dense = type(X) == ndarray
+    if dense:
+        indptr = hstack([0, cumsum(count_nonzero(X, axis=1))])
+    else:
+        X = X.tocsr()
+        indptr = X.indptr
+    n_cells, n_genes = X.shape
+    nnz = int(indptr[-1])
+
+    field = _MTX_FIELDS.get(X.dtype.kind)
+    if field is None:
+        raise ValueError(f"unexpected dtype {X.dtype} for matrix market export")
+
+    # blocks of cells with approximately chunk_size stored values
+    bounds = searchsorted(indptr, arange(0, nnz, max(chunk_size, 1)), side="right") - 1
+    bounds = sorted(set(bounds.tolist() + [0, n_cells]))
+
+    if compression == "gzip":
+        # level 6 is what the gzip command line tool uses by default
+        fp = gzip.open(filename, "wb", compresslevel=6)
+    else:
+        fp = open(filename, "wb")
+    with fp:
+        fp.write(f"%%MatrixMarket matrix coordinate {field} general\n%\n".encode())
+        fp.write(f"{n_genes} {n_cells} {nnz}\n".encode())
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            block = X[start:stop]
+            if dense:
+                block = sparse.csr_matrix(block)
+            cols = repeat(arange(start + 1, stop + 1, dtype=int64), diff(block.indptr))
+            rows = block.indices.astype(int64) + 1
+            fp.write(_format_entries(rows, cols, block.data, decimals))
+
+    return None
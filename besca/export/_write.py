@@ -0,0 +1,393 @@
+import gzip
+import re
+
+from numpy import (
+    absolute,
+    asarray,
+    char,
+    cumsum,
+    errstate,
+    floor,
+    int64,
+    isfinite,
+    isnan,
+    log10,
+    ones,
+    rint,
+    signbit,
+    uint8,
+    uint32,
+    where,
+    zeros,
+)
+from pandas import CategoricalDtype, DatetimeIndex, isna, notna
+from pandas.api.types import is_float_dtype
+
+# characters that require a field to be quoted (same as the csv module)
+_QUOTE_CHARS = ['"', "\n", "\r"]
+
+# printf style float formats that are formatted vectorized, e.g. '%.3f' or '%1.3e'
+_FLOAT_FORMAT = re.compile(r"^%1?\.(\d+)([fe])$")
+
+
+def _ascii_digits(values, text, keep, pad=False):
+    """write non negative integers as right aligned ascii digits into text
+
+    text and keep are (n, width) views into the output buffer and its mask, keep
+    is set for the significant digits (i.e. without leading zeros, but always at
+    least one digit). If pad is True all digits are kept (zero padded output).
+    """
+    dtype = uint32 if len(values) == 0 or values.max() < 2**32 else int64
+    values = values.astype(dtype)
+    last = text.shape[1] - 1
+    for pos in range(last, -1, -1):
+        keep[:, pos] = True if pad or pos == last else values > 0
+        values, text[:, pos] = divmod(values, dtype(10))
+    text += ord("0")
+
+
+def _width(values):
+    """number of decimal digits needed for the largest of the passed integers"""
+    if len(values) == 0:
+        return 1
+    return len(str(int(values.max())))
+
+
+def _text_buffer(n, widths):
+    """allocate an ascii buffer for n lines made up of fields with fixed widths
+
+    Returns the buffer, the mask of the characters that are kept and a slice for
+    every field. The buffer is column major, so that filling in one character
+    position of all lines is a contiguous write.
+    """
+    bounds = cumsum([0] + widths)
+    text = zeros((n, bounds[-1]), dtype=uint8, order="F")
+    keep = ones((n, bounds[-1]), dtype=bool, order="F")
+    fields = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+    return text, keep, fields
+
+
+def _fixed_decimals(values, decimals):
+    """round values to a fixed number of decimals the way printf does
+
+    Returns the absolute values scaled by 10**decimals and rounded to integers,
+    the sign of every value and a mask of the values that could not be converted
+    (non finite or too large). Values that are too close to a rounding tie for
+    the scaling to be exact are rounded through the python string formatting.
+    """
+    x = values.astype(float)
+    with errstate(over="ignore"):
+        invalid = ~isfinite(x) | (absolute(x) * 10.0**decimals >= 2**62)
+    scaled = where(invalid, 0, absolute(x)) * 10.0**decimals
+    k = rint(scaled).astype(int64)
+    frac = scaled - floor(scaled)
+    unsure = (absolute(frac - 0.5) <= 1e-9 + scaled * 1e-15) | (scaled >= 2**52)
+    for i in where(unsure)[0]:
+        k[i] = int(("%.*f" % (decimals, absolute(x[i]))).replace(".", ""))
+    return k, signbit(x), invalid
+
+
+def _exponent_decimals(values, decimals):
+    """round values to scientific notation with a fixed number of decimals
+
+    Returns the significant digits as integers (decimals + 1 digits), the decimal
+    exponent, the sign and a mask of the values that have to be formatted
+    through the python string formatting (non finite, subnormal or too close to
+    a rounding tie).
+    """
+    x = values.astype(float)
+    a = absolute(where(isfinite(x), x, 0))
+    nonzero = a > 0
+    exponent = where(nonzero, floor(log10(where(nonzero, a, 1))), 0).astype(int64)
+
+    def scale(exponent):
+        scaled = a * 10.0 ** (decimals - exponent).astype(float)
+        tie = absolute(scaled - floor(scaled) - 0.5) <= 1e-9 + scaled * 1e-15
+        return scaled, tie
+
+    scaled, tie = scale(exponent)
+    # correct the exponent where log10 was off by one or the value is rounded up
+    # to the next power of ten
+    low = nonzero & (scaled < 10**decimals - 0.5)
+    high = scaled >= 10 ** (decimals + 1) - 0.5
+    exponent = exponent - low + high
+    scaled, corrected_tie = scale(exponent)
+
+    k = rint(scaled).astype(int64)
+    invalid = (
+        ~isfinite(x)
+        | ~isfinite(scaled)
+        | tie
+        | corrected_tie
+        | (nonzero & (a < 1e-300))
+    )
+    k[invalid] = 0
+    return k, exponent, signbit(x), invalid
+
+
+def _format_floats(values, float_format, na_rep=""):
+    """format a float array, vectorized for '%.<n>f' and '%.<n>e' formats
+
+    Returns a list of strings identical to formatting every value with the
+    python % operator (or na_rep for NaN values). Other formats fall back to
+    formatting every value separately.
+    """
+    match = _FLOAT_FORMAT.match(float_format)
+    if match is None:
+        return [na_rep if isnan(x) else float_format % x for x in values.tolist()]
+    decimals, kind = int(match.group(1)), match.group(2)
+    n = len(values)
+
+    if kind == "f":
+        k, negative, invalid = _fixed_decimals(values, decimals)
+        integer_part = k // 10**decimals
+        widths = [1, _width(integer_part)] + ([1, decimals] if decimals else []) + [1]
+        text, keep, fields = _text_buffer(n, widths)
+        text[:, fields[0]] = ord("-")
+        keep[:, fields[0]] = negative[:, None]
+        _ascii_digits(integer_part, text[:, fields[1]], keep[:, fields[1]])
+    else:
+        with errstate(over="ignore", invalid="ignore"):
+            k, exponent, negative, invalid = _exponent_decimals(values, decimals)
+        widths = [1, 1] + ([1, decimals] if decimals else []) + [2, 3, 1]
+        text, keep, fields = _text_buffer(n, widths)
+        text[:, fields[0]] = ord("-")
+        keep[:, fields[0]] = negative[:, None]
+        _ascii_digits(k // 10**decimals, text[:, fields[1]], keep[:, fields[1]])
+        text[:, fields[-3]] = ord("e")
+        text[:, fields[-3].start + 1] = where(exponent < 0, ord("-"), ord("+"))
+        _ascii_digits(absolute(exponent), text[:, fields[-2]], keep[:, fields[-2]])
+        # the exponent has at least two digits
+        keep[:, fields[-2].start + 1] = True
+    if decimals:
+        text[:, fields[2]] = ord(".")
+        _ascii_digits(k % 10**decimals, text[:, fields[3]], keep[:, fields[3]], True)
+    text[:, fields[-1]] = ord("\n")
+
+    formatted = text[keep].tobytes().decode("ascii").split("\n")[:-1]
+    for i in where(invalid)[0]:
+        formatted[i] = na_rep if isnan(values[i]) else float_format % values[i]
+    return formatted
+
+
+def _quote(strings, sep):
+    """quote strings containing the separator, quotes or line breaks like the csv module"""
+    special = [sep] + _QUOTE_CHARS
+    joined = "".join(strings)
+    if not any(char in joined for char in special):
+        return strings
+    return [
+        '"' + x.replace('"', '""') + '"' if any(char in x for char in special) else x
+        for x in strings
+    ]
+
+
+def _is_naive_datetime(values) -> bool:
+    """datetime values without time zone (time zone aware dates are written with str())"""
+    return values.dtype.kind == "M" and getattr(values.dtype, "tz", None) is None
+
+
+def _date_format(values):
+    """format of a datetime column as chosen by pandas.DataFrame.to_csv
+
+    Decided on the whole column: dates only if all times are midnight, otherwise
+    date and time with the fraction of seconds (milli, micro or nanoseconds)
+    needed by the most precise value.
+
+    returns
+    -------
+    the strftime format and the number of digits of the fraction of seconds
+    """
+    dates = values[notna(values)]
+    nanoseconds = asarray(dates, dtype="datetime64[ns]").view(int64)
+    if (nanoseconds % (86400 * 10**9) == 0).all():
+        return "%Y-%m-%d", 0
+    fraction = nanoseconds % 10**9
+    for digits in [0, 3, 6]:
+        if (fraction % 10 ** (9 - digits) == 0).all():
+            return "%Y-%m-%d %H:%M:%S", digits
+    return "%Y-%m-%d %H:%M:%S", 9
+
+
+def _format_dates(values, date_format, na_rep=""):
+    """format a datetime column with a format returned by _date_format"""
+    date_format, digits = date_format
+    dates = DatetimeIndex(values)
+    missing = isna(dates)
+    formatted = dates.strftime(date_format).to_numpy(dtype=object)
+    formatted[missing] = ""
+    if digits:
+        nanoseconds = asarray(dates, dtype="datetime64[ns]").view(int64)
+        fraction = (nanoseconds % 10**9) // 10 ** (9 - digits)
+        formatted = formatted + "." + char.zfill(fraction.astype(str), digits)
+    formatted[missing] = na_rep
+    return formatted.tolist()
+
+
+def _format_column(values, sep, float_format=None, na_rep="", date_format=None):
+    """format one column (pandas.Series or Index) to a list of strings
+
+    Follows the conventions of pandas.DataFrame.to_csv: float_format is applied
+    to float columns, other numeric columns use their numpy string
+    representation, dates use date_format (see _date_format, determined from
+    values if None) and all other values (including time deltas and the
+    categories of categoricals) are converted with str().
+    """
+    if is_float_dtype(values.dtype):
+        values = values.to_numpy()
+        if float_format is not None:
+            return _format_floats(values, float_format, na_rep)
+        formatted = values.astype(str)
+        formatted[isnan(values)] = na_rep
+        return formatted.tolist()
+    if values.dtype.kind in "iub" and not isna(values).any():
+        return values.to_numpy().astype(str).tolist()
+    if isinstance(values.dtype, CategoricalDtype):
+        # format the categories once and look them up through the codes
+        categorical = values.array
+        # to_csv does not apply float_format to categories
+        categories = _quote([str(x) for x in categorical.categories], sep) + [na_rep]
+        return [categories[code] for code in categorical.codes.tolist()]
+    if _is_naive_datetime(values):
+        if date_format is None:
+            date_format = _date_format(values)
+        return _format_dates(values, date_format, na_rep)
+    formatted = [
+        na_rep if missing else str(x) for x, missing in zip(values, isna(values))
+    ]
+    return _quote(formatted, sep)
+
+
+def write_table(
+    df,
+    filename: str,
+    sep: str = "\t",
+    float_format: str = None,
+    index: bool = True,
+    index_label=None,
+    header: bool = True,
+    preamble: str = None,
+    compression: str = None,
+    chunk_size: int = 100000,
+) -> None:
+    """write a pandas.DataFrame to a delimited text file
+
+    Drop-in replacement for the subset of pandas.DataFrame.to_csv used by the
+    besca export functions that produces the same output. The table is processed
+    in blocks of chunk_size rows, floats are formatted vectorized for fixed
+    ('%.3f') and scientific ('%.3e') float formats and every block is written
+    to the file in one go.
+
+    parameters
+    ----------
+    df: `pandas.DataFrame`
+        the table that is to be written out
+    filename: `str`
+        path of the file that is to be written
+    sep: `str` | default = '\\t'
+        field separator
+    float_format: `str` | default = None
+        printf style format applied to all float columns (and a float index)
+    index: `bool` | default = True
+        boolian indicator if the index should be written out as first column
+    index_label: `str` or `False` | default = None
+        header of the index column, if None the index name is used, if False the
+        header line does not contain a field for the index
+    header: `bool` | default = True
+        boolian indicator if the column names should be written out
+    preamble: `str` | default = None
+        text that is written before the header, e.g. the first lines of a .gct file
+    compression: `str` | default = None
+        None for plain text or 'gzip' to write a gzip compressed file
+    chunk_size: `int` | default = 100000
+        number of rows that are formatted and written at once
+
+    returns
+    -------
+    None
+        writes the table to the specified file
+
+    """
+    if compression not in [None, "gzip"]:
+        raise ValueError("compression should be None or 'gzip'")
+
+    lines = []
+    if header:
+        names = [str(x) for x in df.columns]
+        if index and index_label is not False:
+            if index_label is None:
+                index_label = df.index.name if df.index.name is not None else ""
+            names = [str(index_label)] + names
+        lines = [sep.join(_quote(names, sep)) + "\n"]
+
+    # the format of dates is decided on the whole column, not per block
+    formats = [
+        _date_format(x) if _is_naive_datetime(x) else None
+        for x in [df.iloc[:, i] for i in range(df.shape[1])] + [df.index]
+    ]
+
+    if compression == "gzip":
+        fp = gzip.open(filename, "wb", compresslevel=6)
+    else:
+        fp = open(filename, "wb")
+    with fp:
+        if preamble is not None:
+            fp.write(preamble.encode())
+        fp.write("".join(lines).encode())
+        for start in range(0, df.shape[0], chunk_size):
+            block = df.iloc[start : start + chunk_size]
+            columns = [
+                _format_column(block.iloc[:, i], sep, float_format, "", formats[i])
+                for i in range(block.shape[1])
+            ]
+            if index:
+                columns.insert(
+                    0, _format_column(block.index, sep, float_format, "", formats[-1])
+                )
+            text = "\n".join(map(sep.join, zip(*columns)))
+            fp.write((text + "\n").encode())
+
+    return None
+
+
+def write_gct(
+    df,
+    filename: str,
+    float_format: str = "%.3f",
+    compression: str = None,
+) -> None:
+    """write a pandas.DataFrame to a .gct file
+
+    The DataFrame needs to contain the gene descriptions as first column and the
+    gene identifiers as index.
+
+    parameters
+    ----------
+    df: `pandas.DataFrame`
+        the table that is to be written out, with the column 'Description' first
+    filename: `str`
+        path of the file that is to be written
+    float_format: `str` | default = '%.3f'
+        printf style format applied to all float columns
+    compression: `str` | default = None
+        None for plain text or 'gzip' to write a gzip compressed file
+
+    returns
+    -------
+    None
+        writes the table to the specified file
+
+    """
+    # "description" already merged in as a column
+    preamble = "#1.2" + "\n" + str(df.shape[0]) + "\t" + str(df.shape[1] - 1) + "\n"
+    write_table(
+        df,
+        filename,
+        sep="\t",
+        float_format=float_format,
+        index=True,
+        index_label="NAME",
+        preamble=preamble,
+        compression=compression,
+    )
+    return None
@@ -9,7 +9,7 @@ from pandas import DataFrame, Series
 from numpy import ndarray, arange, float32
 
 # import helper functions from besca
-from besca._helper import get_raw
+from besca._helper import get_gene_indexes, get_raw
 
 
 def _generate_circle(expression_values, center, radius, ax):
@@ -55,7 +55,7 @@ def _get_expression_table(adata, gene, color_map, max_expression):
             if adata.n_vars == 1:
                 expression_values = Series(adata.X.flatten()).value_counts().to_frame()
             else:
-                iLoc = adata.var_names.tolist().index(gene)
+                iLoc = get_gene_indexes(adata.var_names, gene)[0]
                 expression_values = (
                     Series(adata.X[:, iLoc].flatten()).value_counts().to_frame()
                 )
@@ -76,7 +76,7 @@ def _get_expression_table(adata, gene, color_map, max_expression):
 
     elif adata.n_obs == 1 and adata.n_vars > 1:
 
-        iLoc = adata.var_names.tolist().index(gene)
+        iLoc = get_gene_indexes(adata.var_names, gene)[0]
         expression_values = Series(adata.X.copy().toarray().flatten()[iLoc]).value_counts().to_frame()
         #expression_values= Series()
         expression_values.columns = ["counts"]
@@ -228,12 +228,12 @@ def dot_heatmap(
     if raw:
         adata_plot = get_raw(adata)
         adata_plot.var_names_make_unique()
-        gene_indexes = [adata_plot.var_names.tolist().index(x) for x in genes]
+        gene_indexes = get_gene_indexes(adata_plot.var_names, genes)
         adata_plot = adata_plot[:, gene_indexes]
     else:
         adata_plot = adata.copy()
         adata_plot.var_names_make_unique()
-        gene_indexes = [adata_plot.var_names.tolist().index(x) for x in genes]
+        gene_indexes = get_gene_indexes(adata_plot.var_names, genes)
         adata_plot = adata_plot[:, gene_indexes]
         # get groups to be plotted on y-axis
 
@@ -660,12 +660,12 @@ def dot_heatmap_split(
     if raw:
         adata_plot = get_raw(adata)
         adata_plot.var_names_make_unique()
-        gene_indexes = [adata_plot.var_names.tolist().index(x) for x in genes]
+        gene_indexes = get_gene_indexes(adata_plot.var_names, genes)
         adata_plot = adata_plot[:, gene_indexes].copy()
     else:
         adata_plot = adata.copy()
         adata_plot.var_names_make_unique()
-        gene_indexes = [adata_plot.var_names.tolist().index(x) for x in genes]
+        gene_indexes = get_gene_indexes(adata_plot.var_names, genes)
         adata_plot = adata_plot[:, gene_indexes].copy()
         # get groups to be plotted on y-axis
 
@@ -1212,12 +1212,12 @@ def dot_heatmap_split_greyscale(
     if raw:
         adata_plot = get_raw(adata)
         adata_plot.var_names_make_unique()
-        gene_indexes = [adata_plot.var_names.tolist().index(x) for x in genes]
+        gene_indexes = get_gene_indexes(adata_plot.var_names, genes)
         adata_plot = adata_plot[:, gene_indexes].copy()
     else:
         adata_plot = adata.copy()
         adata_plot.var_names_make_unique()
-        gene_indexes = [adata_plot.var_names.tolist().index(x) for x in genes]
+        gene_indexes = get_gene_indexes(adata_plot.var_names, genes)
         adata_plot = adata_plot[:, gene_indexes].copy()
         # get groups to be plotted on y-axis
 
@@ -455,7 +455,7 @@ def max_mito(
     elif annotation_type == "ENSEMBL":
 
         # read in reference mito file
-        mito_list = get_mito_genes(species)
+        mito_list = get_mito_genes(species, as_set=True)
         mito_genes = [name for name in adata.var_names if name in mito_list]  # ensembl
 
         # for each cell compute fraction of counts in mito genes vs. all genes
@@ -6,7 +6,7 @@ from matplotlib.offsetbox import AnchoredText
 import sys
 import os
 from besca.pl._general import stacked_split_violin, split_violin
-from besca._helper import get_raw
+from besca._helper import get_gene_indexes, get_raw
 import numpy as np
 
 
@@ -42,13 +42,8 @@ def _make_tidy(adata, genes, split_variable, label_split_variable=None, use_raw=
     else:
         bdata.X = bdata.X.todense()
 
-    # get index of raw gene names
-    gene_index = bdata.var_names.tolist()
-
     # get index location of genes
-    index = []
-    for gene in genes:
-        index.append(gene_index.index(gene))
+    index = get_gene_indexes(bdata.var_names, genes)
 
     # extract AnnData object containing only the relevant genes (this decreases computational time later)
     bdata = bdata[:, index]
@@ -2,12 +2,128 @@ import logging
 import sys
 import anndata
 from pandas import read_csv
-from numpy import sum
+from numpy import asarray, bincount, concatenate, cumsum, ones, sum
+from scipy.sparse import issparse
 from besca.datasets._mito import get_mito_genes
 
 # import helper functions from besca
 from besca._helper import get_raw
 
+def _count_positive(X, axis):
+    """Count the values above 0 along an axis without densifying sparse matrices."""
+    if not issparse(X):
+        return sum(X > 0, axis=axis)
+    X = X.tocsr()
+    positive = X.data[: X.indptr[-1]] > 0
+    if axis == 0:
+        return bincount(X.indices[: X.indptr[-1]][positive], minlength=X.shape[1])
+    cumulative = concatenate([[0], cumsum(positive)])
+    return cumulative[X.indptr[1:]] - cumulative[X.indptr[:-1]]
+
+
+def _filter_plan(
+    adata,
+    max_genes=None,
+    min_genes=None,
+    max_counts=None,
+    min_counts=None,
+    min_cells=None,
+    max_mito=None,
+    annotation_type=None,
+    species="human",
+):
+    """Determine the cells and genes removed by filter without slicing adata.
+
+    Computes the missing per cell and per gene statistics up front (adding them to
+    adata.obs and adata.var as filter always did) and combines the thresholds in the
+    order of filter: max_genes, min_genes, max_counts, min_counts, min_cells, max_mito.
+    Every step only counts the cells (or genes) that passed the previous steps.
+
+    returns
+    -------
+    keep_cells, keep_genes, report
+        boolean masks of the cells and genes that are kept and a list with the log
+        message, the number of removed cells or genes and the threshold of every step
+    """
+    # calculate values if necessary
+    if max_counts is not None or min_counts is not None:
+        if adata.obs.get("n_counts") is None:
+            adata.obs["n_counts"] = adata.X.sum(axis=1)
+    if min_genes is not None or max_genes is not None:
+        if adata.obs.get("n_genes") is None:
+            adata.obs["n_genes"] = _count_positive(adata.X, axis=1)
+    if min_cells is not None:
+        if adata.var.get("n_cells") is None:
+            adata.var["n_cells"] = _count_positive(adata.X, axis=0)
+
+    if max_mito is not None:
+        if adata.obs.get("percent_mito") is None:
+            mito_list = get_mito_genes(species, annotation_type, as_set=True)
+            mito_genes = [
+                name for name in adata.var_names if name in mito_list
+            ]  # ensembl
+            # for each cell compute fraction of counts in mito genes vs. all genes
+            n_counts = sum(adata.X, axis=1).A1
+            n_counts[n_counts == 0] = float("inf")
+            adata.obs["percent_mito"] = (
+                sum(adata[:, mito_genes].X, axis=1).A1 / n_counts
+            )
+
+    keep_cells = ones(adata.shape[0], dtype=bool)
+    keep_genes = ones(adata.shape[1], dtype=bool)
+    report = []
+
+    def apply(keep, passed, message, threshold):
+        passed = asarray(passed, dtype=bool)
+        report.append((message, int((keep & ~passed).sum()), threshold))
+        return keep & passed
+
+    if max_genes is not None:
+        keep_cells = apply(
+            keep_cells,
+            adata.obs.get("n_genes") <= max_genes,
+            "removed %d cells that expressed more than %d genes",
+            max_genes,
+        )
+    if min_genes is not None:
+        keep_cells = apply(
+            keep_cells,
+            adata.obs.get("n_genes") >= min_genes,
+            "removed %d cells that did not express at least %d genes",
+            min_genes,
+        )
+    if max_counts is not None:
+        keep_cells = apply(
+            keep_cells,
+            adata.obs.get("n_counts") <= max_counts,
+            "removed %d cells that had more than %d counts",
+            max_counts,
+        )
+    if min_counts is not None:
+        keep_cells = apply(
+            keep_cells,
+            adata.obs.get("n_counts") >= min_counts,
+            "removed %d cells that did not have at least %d counts",
+            min_counts,
+        )
+    if min_cells is not None:
+        keep_genes = apply(
+            keep_genes,
+            adata.var.get("n_cells") >= min_cells,
+            "removed %d genes that were not expressed" "in at least %d cells",
+            min_cells,
+        )
+    if max_mito is not None:
+        keep_cells = apply(
+            keep_cells,
+            adata.obs.get("percent_mito") < max_mito,
+            "removed %d cells that expressed" "%d%% mitochondrial genes or more",
+            max_mito * 100,
+        )
+
+    return keep_cells, keep_genes, report
+
+
 def filter(
     adata,
     max_genes=None,
@@ -22,7 +138,8 @@ def filter(
     """Filter cell outliers based on counts, numbers of genes expressed, number of cells expressing a gene and mitochondrial gene content.
 
     Filtering is performed iteratively in the order: max_genes, min_genes, max_counts, min_counts,
-    min_cells, max_mito.
+    min_cells, max_mito. All statistics are computed up front and the thresholds are combined
+    into one cell and one gene mask, so the data is only sliced (and copied) once.
 
     The Thresholds are defined as follows:
     max_genes >= n_genes
@@ -75,92 +192,21 @@ def filter(
             ncells, ngenes
         )
 
-        # calculate values if necessary
-        if max_counts is not None or min_counts is not None:
-            if adata.obs.get("n_counts") is None:
-                adata.obs["n_counts"] = adata.X.sum(axis=1)
-        if min_genes is not None or max_genes is not None:
-            if adata.obs.get("n_genes") is None:
-                adata.obs["n_genes"] = sum(adata.X > 0, axis=1)
-        if min_cells is not None:
-            if adata.var.get("n_cells") is None:
-                adata.var["n_cells"] = sum(adata.X > 0, axis=0).T
-
-        if max_mito is not None:
-            if adata.obs.get("percent_mito") is None:
-                mito_list = get_mito_genes(species, annotation_type)
-                mito_genes = [
-                    name for name in adata.var_names if name in mito_list
-                ]  # ensembl
-                # for each cell compute fraction of counts in mito genes vs. all genes
-                n_counts = sum(adata.X, axis=1).A1
-                n_counts[n_counts == 0] = float("inf")
-                adata.obs["percent_mito"] = (
-                    sum(adata[:, mito_genes].X, axis=1).A1 / n_counts
-                )
-
-        # perform actual filtering for all given parameters
-        if max_genes is not None:
-            curr_cells = adata.shape[0]
-            adata = adata[adata.obs.get("n_genes") <= max_genes, :].copy()
-            new_cells = adata.shape[0]
-            logging.info(
-                "removed %d cells that expressed more than %d genes",
-                curr_cells - new_cells,
-                max_genes
-            )
-
-        if min_genes is not None:
-            curr_cells = adata.shape[0]
-            adata = adata[adata.obs.get("n_genes") >= min_genes, :].copy()
-            new_cells = adata.shape[0]
-            logging.info(
-                "removed %d cells that did not express at least %d genes",
-                curr_cells - new_cells,
-                min_genes
-            )
-
-        if max_counts is not None:
-            curr_cells = adata.shape[0]
-            adata = adata[adata.obs.get("n_counts") <= max_counts, :].copy()
-            new_cells = adata.shape[0]
-            logging.info(
-                "removed %d cells that had more than %d counts",
-                curr_cells - new_cells,
-                max_counts
-            )
-
-        if min_counts is not None:
-            curr_cells = adata.shape[0]
-            adata = adata[adata.obs.get("n_counts") >= min_counts, :].copy()
-            new_cells = adata.shape[0]
-            logging.info(
-                "removed %d cells that did not have at least %d counts",
-                curr_cells - new_cells,
-                min_counts
-            )
-
-        if min_cells is not None:
-            curr_genes = adata.shape[1]
-            adata = adata[:, adata.var.get("n_cells") >= min_cells].copy()
-            new_genes = adata.shape[1]
-            logging.info(
-                "removed %d genes that were not expressed"
-                "in at least %d cells",
-                curr_genes - new_genes,
-                min_cells,
-            )
-
-        if max_mito is not None:
-            curr_cells = adata.shape[0]
-            adata = adata[adata.obs.get("percent_mito") < max_mito, :].copy()
-            new_cells = adata.shape[0]
-            logging.info(
-                "removed %d cells that expressed"
-                "%d%% mitochondrial genes or more",
-                curr_cells - new_cells,
-                max_mito * 100
-            )
+        # determine the cells and genes that pass all thresholds and slice once
+        keep_cells, keep_genes, report = _filter_plan(
+            adata,
+            max_genes=max_genes,
+            min_genes=min_genes,
+            max_counts=max_counts,
+            min_counts=min_counts,
+            min_cells=min_cells,
+            max_mito=max_mito,
+            annotation_type=annotation_type,
+            species=species,
+        )
+        for message, removed, threshold in report:
+            logging.info(message, removed, threshold)
+        adata = adata[keep_cells, keep_genes].copy()
 
         ncells_final = adata.shape[0]
         ngenes_final = adata.shape[1]
@@ -232,10 +278,9 @@ def filter_gene_list(adata, filepath, use_raw=True, use_genes="SYMBOL"):
         )  # ENS_GENE_ID  GENE_SYMBOL (2 cols)
     else:
         sys.exit("Please supply either SYMBOL or ENSEMBL ids")
-    genes = [i for i in adata.var_names if i not in gene_list]
-    # remove all the genes from the list
-    if len(genes) > 0:
-        gene_indexes = [adata.var_names.tolist().index(x) for x in genes]
+    # remove all the genes from the list (hashed membership test)
+    gene_indexes = (~adata.var_names.isin(set(gene_list))).nonzero()[0]
+    if len(gene_indexes) > 0:
         adata = adata[:, gene_indexes]
     else:
         logging.warning(
@@ -1,11 +1,17 @@
 import sys
-from pandas import read_csv
-from numpy import sum, any
+from pandas import Index, read_csv
+from numpy import any, asarray, bincount, concatenate, full, int64, ones
+from scipy.sparse import csr_matrix, issparse
 import warnings
 from besca.datasets._mito import get_mito_genes
 
 def fraction_counts(
-    adata, species="human", name="percent_mito", use_genes="SYMBOL", specific_file=None
+    adata,
+    species="human",
+    name="percent_mito",
+    use_genes="SYMBOL",
+    specific_file=None,
+    gene_sets=None,
 ):
     """Function to calculate fraction of counts per cell from a gene list.
     This function calculates the fraction of counts per cell for
@@ -28,11 +34,17 @@ def fraction_counts(
         adata.var_names (defines which column of input gene list is read)
     specific_file: `str` | default None.
         if indicated, the file will be used to extract the gene list
+    gene_sets: `dict` | default None.
+        if indicated, the fractions of all gene sets are calculated at once.
+        Dictionary with the column names as keys and either a list of genes or the
+        path to a gene list file (same format as specific_file) as values,
+        e.g. {'percent_mito': mito_genes, 'percent_ribo': 'human.ribosomal.tsv'}.
+        species, name and specific_file are ignored in this case.
     Returns
     -------
     None
-        Returns None but updates adata with new column named 'name'
-        containing calculated fraction of counts.
+        Returns None but updates adata with new column named 'name' (or one column
+        per gene set) containing calculated fraction of counts.
 
     Example
     -------
@@ -42,31 +54,63 @@ def fraction_counts(
     >>> bc.pp.fraction_counts(adata,  'human', use_genes='SYMBOL', specific_file=f"{os.path.dirname(__file__)[:-3]}/datasets/mito_files/test.mito.tsv")
     >>> counts = adata.obs.head(5)
     """
-    if specific_file is None:
-        gene_list = get_mito_genes(species, use_genes)
-    else:
-        # ENS_GENE_ID  GENE_SYMBOL (2 cols)
-        if use_genes == "SYMBOL":
-            gene_list = list(read_csv(specific_file, header=None, sep="\t")[1])
-        elif use_genes == "ENSEMBL":
-            gene_list = list(read_csv(specific_file, header=None, sep="\t")[0])
-    genes = [i for i in adata.var_names if i in gene_list]
-    # for each cell compute fraction of counts in gene_list vs. all genes
+    if gene_sets is None:
+        if specific_file is None:
+            gene_sets = {name: get_mito_genes(species, use_genes, as_set=True)}
+        else:
+            gene_sets = {name: specific_file}
+    elif len(gene_sets) == 0:
+        raise ValueError("gene_sets needs to contain at least one gene set")
+
+    # gene x gene set indicator matrix, genes are looked up through a hash index
+    var_names = Index(adata.var_names)
+    rows, cols = [], []
+    for i, gene_list in enumerate(gene_sets.values()):
+        if isinstance(gene_list, str):
+            gene_list = _read_gene_file(gene_list, use_genes)
+        if not isinstance(gene_list, (set, frozenset)):
+            gene_list = set(gene_list)
+        positions = var_names.isin(gene_list).nonzero()[0]
+        rows.append(positions)
+        cols.append(full(len(positions), i))
+    rows, cols = concatenate(rows), concatenate(cols)
+    dtype = adata.X.dtype if adata.X.dtype.kind == "f" else int64
+    indicator = csr_matrix(
+        (ones(len(rows), dtype=dtype), (rows, cols)),
+        shape=(adata.shape[1], len(gene_sets)),
+    )
+
+    # for each cell compute fraction of counts in every gene set vs. all genes
     # axis=1 --> sum over rows
-    if len(genes) > 0:
-        n_counts = sum(adata.X, axis=1).A1
-        if any(n_counts == 0):
-            warnings.warn(
-                "Some of the cells contain no counts. \
-                           Do not forget to remove 'empty' cells from data."
-            )
-            n_counts[n_counts == 0] = float("inf")
-        adata.obs[name] = sum(adata[:, genes].X, axis=1).A1 / n_counts
-    else:
-        adata.obs[name] = 0.0
-        print(
-            "None of the genes from input list found in data set. \
-               Please ensure you have correctly specified use_genes to match \
-               the type of genes saved in adata.var_names."
+    n_counts = asarray(adata.X.sum(axis=1)).ravel()
+    if any(n_counts == 0) and len(rows) > 0:
+        warnings.warn(
+            "Some of the cells contain no counts. \
+                       Do not forget to remove 'empty' cells from data."
         )
+        n_counts[n_counts == 0] = float("inf")
+    set_counts = adata.X @ indicator
+    set_counts = set_counts.toarray() if issparse(set_counts) else asarray(set_counts)
+
+    found = bincount(cols, minlength=len(gene_sets))
+    for i, set_name in enumerate(gene_sets):
+        if found[i] > 0:
+            adata.obs[set_name] = set_counts[:, i] / n_counts
+        else:
+            adata.obs[set_name] = 0.0
+            print(
+                "None of the genes from input list found in data set. \
+                   Please ensure you have correctly specified use_genes to match \
+                   the type of genes saved in adata.var_names."
+            )
     return None
+
+
+def _read_gene_file(filepath, use_genes):
+    """Read the gene list of a two column file (ENS_GENE_ID  GENE_SYMBOL)."""
+    if use_genes == "SYMBOL":
+        return list(read_csv(filepath, header=None, sep="\t")[1])
+    elif use_genes == "ENSEMBL":
+        return list(read_csv(filepath, header=None, sep="\t")[0])
+    else:
+        sys.exit("Please supply either SYMBOL or ENSEMBL ids")
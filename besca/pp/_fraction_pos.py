@@ -1,7 +1,83 @@
 import logging
 import sys
 import anndata
-from numpy import ndarray, mean
+from numpy import argpartition, argsort, bincount, diff, inf, isnan, ndarray, where
+from scipy.sparse import csr_matrix, isspmatrix_csr
+
+
+def _gene_qc_metrics(X, threshold=0, chunk_size=10000):
+    """Calculate per gene QC metrics in a single pass over the expression matrix.
+
+    Works on the stored values of sparse matrices (implicit zeros are accounted for
+    through the number of stored values per gene) and processes dense matrices in
+    blocks of chunk_size cells, so the matrix is never converted or copied as a whole.
+
+    parameters
+    ----------
+    X: `scipy.sparse.spmatrix` | `ndarray`
+        cells x genes expression matrix
+    threshold: `int` | default = 0
+        value above which a gene is deemed as being expressed
+    chunk_size: `int` | default = 10000
+        number of cells that are processed at once
+
+    returns
+    -------
+    dict
+        arrays with the total counts (`total_counts`), the fraction of reads
+        (`frac_reads`), the fraction of positive cells (`frac_pos`) and the
+        mean expression (`mean`) of every gene
+    """
+    n_cells, n_genes = X.shape
+    if not isinstance(X, ndarray) and not isspmatrix_csr(X):
+        X = csr_matrix(X)
+
+    total = 0
+    positive = 0
+    for start in range(0, n_cells, chunk_size):
+        stop = min(start + chunk_size, n_cells)
+        if isinstance(X, ndarray):
+            block = X[start:stop]
+            total = total + block.sum(axis=0, dtype=float)
+            positive = positive + (block > threshold).sum(axis=0)
+        else:
+            first, last = X.indptr[start], X.indptr[stop]
+            data, indices = X.data[first:last], X.indices[first:last]
+            total = total + bincount(indices, weights=data, minlength=n_genes)
+            positive = positive + bincount(
+                indices[data > threshold], minlength=n_genes
+            )
+    if not isinstance(X, ndarray) and 0 > threshold:
+        # the implicit zeros are above a negative threshold as well
+        stored = bincount(X.indices[: X.indptr[-1]], minlength=n_genes)
+        positive = positive + n_cells - stored
+
+    # keep the precision of float matrices as in the previous dense calculation,
+    # the fractions are float64
+    dtype = X.dtype if X.dtype.kind == "f" else float
+    return {
+        "total_counts": total.astype(dtype),
+        "frac_reads": total / total.sum(),
+        "frac_pos": positive / n_cells,
+        "mean": (total / n_cells).astype(dtype),
+    }
+
+
+def _top_genes(var, values, column, top_n):
+    """Return the rows of var with the largest values (descending order).
+
+    Only the top_n entries are sorted (partial sort), ties keep the order of var.
+    """
+    order_values = where(isnan(values), -inf, values)
+    if top_n is None or top_n >= len(values):
+        selected = argsort(-order_values, kind="stable")
+    else:
+        candidates = argpartition(-order_values, top_n - 1)[:top_n]
+        candidates.sort()
+        selected = candidates[argsort(-order_values[candidates], kind="stable")]
+    table = var.iloc[selected].copy()
+    table[column] = values[selected]
+    return table
 
 def frac_reads(adata):
     """Cacluate the fraction of reads being attributed to a specific gene.
@@ -30,14 +106,8 @@ def frac_reads(adata):
 
     if isinstance(adata, anndata.AnnData):
 
-        if type(adata.X) == ndarray:
-            adata_X = adata.X
-        else:
-            adata_X = adata.X.toarray()
-
         # calculate the fraction of reads that are attributed to each gene
-        cum_reads_gene = sum(adata_X)
-        frac_reads = cum_reads_gene / sum(cum_reads_gene)
+        frac_reads = _gene_qc_metrics(adata.X)["frac_reads"]
 
         adata.var["frac_reads"] = frac_reads.tolist()
 
@@ -75,13 +145,8 @@ def frac_pos(adata, threshold=0):
     """
     if isinstance(adata, anndata.AnnData):
 
-        if type(adata.X) == ndarray:
-            adata_X = adata.X
-        else:
-            adata_X = adata.X.toarray()
-
         # calculate the percentage of cells that show an expression of the gene above the threshold
-        fraction_pos = sum(adata_X > threshold) / adata.shape[0]
+        fraction_pos = _gene_qc_metrics(adata.X, threshold)["frac_pos"]
 
         # add calculated fraction positive to adata.var
         adata.var["frac_pos"] = fraction_pos.tolist()
@@ -116,13 +181,8 @@ def mean_expr(adata):
     """
     if isinstance(adata, anndata.AnnData):
 
-        if type(adata.X) == ndarray:
-            adata_X = adata.X
-        else:
-            adata_X = adata.X.toarray()
-
-        # calculate the percentage of cells that show an expression of the gene above the threshold
-        means = mean(adata_X, axis=0)
+        # calculate the mean expression of every gene
+        means = _gene_qc_metrics(adata.X)["mean"]
 
         # add calculated fraction positive to adata.var
         adata.var["mean"] = means.tolist()
@@ -161,27 +221,15 @@ def top_counts_genes(adata, top_n=10):
     if isinstance(adata, anndata.AnnData):
         if "frac_reads" in adata.var.columns:
 
-            # generate a table sorted by frac_pos (descending order)
-            sorted = adata.var.sort_values(by="frac_reads", ascending=False)
-
-            if top_n == None:
-                return sorted
-            else:
-                return sorted.head(top_n)
+            # generate a table sorted by frac_reads (descending order)
+            values = adata.var["frac_reads"].values
+            return _top_genes(adata.var, values, "frac_reads", top_n)
         else:
             logging.info("calculating frac_reads")
 
-            # calculate fraciton positive for a gene
-            bdata = adata.copy()
-            frac_reads(bdata)
-
-            # generate a table sorted by frac_pos (descending order)
-            sorted = bdata.var.sort_values(by="frac_reads", ascending=False)
-
-            if top_n == None:
-                return sorted
-            else:
-                return sorted.head(top_n)
+            # calculate frac_reads without modifying adata and return the top_n genes
+            values = _gene_qc_metrics(adata.X)["frac_reads"]
+            return _top_genes(adata.var, values, "frac_reads", top_n)
     else:
         sys.exit("please pass an AnnData object as data")
 
@@ -215,25 +263,13 @@ def top_expressed_genes(adata, top_n=10):
         if "frac_pos" in adata.var.columns:
 
             # generate a table sorted by frac_pos (descending order)
-            sorted = adata.var.sort_values(by="frac_pos", ascending=False)
-
-            if top_n == None:
-                return sorted
-            else:
-                return sorted.head(top_n)
+            values = adata.var["frac_pos"].values
+            return _top_genes(adata.var, values, "frac_pos", top_n)
         else:
             logging.info("calculating frac_pos")
 
-            # calculate fraciton positive for a gene
-            bdata = adata.copy()
-            frac_pos(bdata)
-
-            # generate a table sorted by frac_pos (descending order)
-            sorted = bdata.var.sort_values(by="frac_pos", ascending=False)
-
-            if top_n == None:
-                return sorted
-            else:
-                return sorted.head(top_n)
+            # calculate frac_pos without modifying adata and return the top_n genes
+            values = _gene_qc_metrics(adata.X)["frac_pos"]
+            return _top_genes(adata.var, values, "frac_pos", top_n)
     else:
         sys.exit("please pass an AnnData object as data")
@@ -1,6 +1,5 @@
 import numpy as np
-from scipy.sparse.csr import csr_matrix
-from anndata._core.views import SparseCSRView
+from scipy.sparse import issparse
 
 def closure(mat):
     """
@@ -152,15 +151,67 @@ def multiplicative_replacement(mat, delta=None):
     return mat.squeeze()
 
 
-def normalize_geometric(adata):
+def _multiplicative_replacement_clr(mat, delta=None):
+    """Perform multiplicative_replacement followed by clr on a block of rows.
+
+    Computes the result analytically instead of materializing the replaced and
+    closed matrices: zeros are replaced by log(delta) and the nonzero proportions are
+    scaled by 1 - n_zeros * delta (the closure within clr only adds a constant per
+    row to the log values, which cancels with the subtraction of the geometric mean).
+
+    Parameters
+    ----------
+    mat : array_like
+       a dense block of counts where
+       rows = compositions and
+       columns = components
+    delta: float, optional
+       a small number to be used to replace zeros, see multiplicative_replacement
+    Returns
+    -------
+    numpy.ndarray, np.float64
+         clr transformed block
+    """
+    mat = np.nan_to_num(np.asarray(mat, dtype=np.float64))
+    if np.any(mat < 0):
+        raise ValueError("Cannot have negative proportions")
+    totals = mat.sum(axis=1, keepdims=True)
+    if np.any(totals == 0):
+        raise ValueError("Input matrix cannot have rows with all zeros")
+
+    z_mat = mat == 0
+    if delta is None:
+        delta = (1.0 / mat.shape[-1]) ** 2
+    zcnts = 1 - z_mat.sum(axis=1, keepdims=True) * delta
+    if np.any(zcnts < 0):
+        raise ValueError(
+            "The multiplicative replacment created negative "
+            "proportions. Consider using a smaller `delta`."
+        )
+
+    with np.errstate(divide="ignore"):
+        lmat = np.log(mat * (zcnts / totals))
+    lmat[z_mat] = np.log(delta)
+    lmat -= lmat.mean(axis=1, keepdims=True)
+    return lmat
+
+
+def normalize_geometric(adata, chunk_size=10000):
     """Perform geometric normalization on CITEseq data.
 
     Add description of why geometric normalization
 
+    The zeros are replaced using the multiplicative replacement strategy before the
+    centre log ratio transformation is applied. Cells are processed in blocks of
+    chunk_size rows, so only one block is held as dense float64 array at a time, and
+    the result is written to a new float32 array.
+
     parameters
     ----------
     adata: :class:`~anndata.AnnData`
         The annotated data matrix.
+    chunk_size: `int` | default = 10000
+        number of cells that are normalized at once
 
     returns
     -------
@@ -176,24 +227,21 @@ def normalize_geometric(adata):
 
     X = adata.X
 
-    X = np.nan_to_num(X)
-
-    # if the matrix is sparse make to array
-    if type(X) == csr_matrix:
-        X = X.todense()
-    # need to add a catch for newly encountered datatype
-    elif type(X) == SparseCSRView:
-        X = X.todense()
-
-    # ensure that X is an array otherwise this will cause type issue with multiplicative replacement function
-    X = np.array(X)
-
-    # replacement of zero values with very small numbers without changing the overall sums
-    X = multiplicative_replacement(X)
-
-    # centre log ratio transformation
-    X = clr(X)
-
-    adata.X = X
+    # always a new array: adata.X can be a view of another AnnData or shared with a layer
+    X = X.tocsr() if issparse(X) else np.asarray(X)
+    result = np.empty(X.shape, dtype=np.float32)
+
+    for start in range(0, X.shape[0], chunk_size):
+        block = X[start : start + chunk_size]
+        if issparse(block):
+            block = block.toarray()
+        # replacement of zero values with very small numbers without changing the
+        # overall sums and centre log ratio transformation
+        result[start : start + chunk_size] = _multiplicative_replacement_clr(block)
+
+    # setting X of a view writes into the parent AnnData, make the view an actual object first
+    if adata.is_view:
+        adata._init_as_actual(adata.copy())
+    adata.X = result
 
     return None  # adata object is automatically updated
@@ -0,0 +1,137 @@
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+from besca.pp._filtering import _count_positive
+
+# scale factor of the median absolute deviation (consistency with the sd, as in R's mad)
+_MAD_CONSTANT = 1.4826
+
+
+def _outlier_thresholds(metric, nmads=3, sample_size=None, random_state=0):
+    """Thresholds of scater's isOutlier: median -/+ nmads median absolute deviations.
+
+    Missing values are ignored. If sample_size is given and the metric contains more
+    values, median and MAD are estimated on a random sample of sample_size values.
+
+    returns
+    -------
+    lower, higher
+        the lower and the upper threshold
+    """
+    values = np.asarray(metric, dtype=float)
+    values = values[~np.isnan(values)]
+    if sample_size is not None and len(values) > sample_size:
+        rng = np.random.default_rng(random_state)
+        values = rng.choice(values, size=sample_size, replace=False)
+    if len(values) == 0:
+        return np.nan, np.nan
+    median = np.median(values)
+    mad = _MAD_CONSTANT * np.median(np.abs(values - median))
+    return median - nmads * mad, median + nmads * mad
+
+
+def _n_outliers(metric, threshold, type):
+    """number of values below (type='lower') or above (type='higher') the threshold"""
+    metric = np.asarray(metric, dtype=float)
+    with np.errstate(invalid="ignore"):
+        if type == "lower":
+            return int((metric < threshold).sum())
+        return int((metric > threshold).sum())
+
+
+def _format_value(value):
+    return "%g" % round(value, 2)
+
+
+def val_outlier_native(adata, nmads=3, sample_size=None, random_state=0):
+    """Native implementation of the thresholds estimated by valOutlier.
+
+    Computes the per cell and per gene QC metrics of scater's perCellQCMetrics
+    (total counts, detected genes, percentage of counts in genes with 'MT-' in their
+    SYMBOL and the number of cells expressing every gene) in one pass over the
+    stored values of adata.X and derives the same MAD based thresholds as the R
+    implementation, without converting adata to R.
+
+    Parameters
+    ----------
+    adata: `AnnData`
+        Unfiltered AnnData object of RNA counts.
+    nmads: `int`
+        Number of median absolute deviation to use as threshold for outlier detection.
+    sample_size: `int` | default = None
+        if given, medians and MADs are estimated on a random sample of this many
+        cells (genes), the number of removed cells is still counted on all cells.
+    random_state: `int` | default = 0
+        seed of the random sample.
+
+    Returns
+    -------
+    numpy.ndarray with the advised standard_min_genes, standard_min_cells,
+    standard_min_counts, standard_n_genes, standard_percent_mito and
+    standard_max_counts (same order as valOutlier).
+    """
+    X = adata.X
+    if issparse(X):
+        X = csr_matrix(X)
+    counts = np.asarray(X.sum(axis=1, dtype=float)).ravel()
+    detected = np.asarray(_count_positive(X, axis=1)).ravel()
+    expressed = np.asarray(_count_positive(X, axis=0)).ravel()
+
+    mito = adata.var["SYMBOL"].astype(str).str.contains("MT-", regex=False).values
+    has_mito = mito.any()
+    if has_mito:
+        mito_counts = np.asarray(X[:, np.flatnonzero(mito)].sum(axis=1, dtype=float))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mito_percent = 100 * mito_counts.ravel() / counts
+
+    def thresholds(metric):
+        return _outlier_thresholds(metric, nmads, sample_size, random_state)
+
+    lower_detected, higher_detected = thresholds(detected)
+    rm_detected = _n_outliers(detected, lower_detected, "lower")
+    rm_high_detected = _n_outliers(detected, higher_detected, "higher")
+    lower_detected = max(lower_detected, 0)
+
+    lower_expressed = thresholds(expressed)[0]
+    rm_expressed = _n_outliers(expressed, lower_expressed, "lower")
+    lower_expressed = max(lower_expressed, 0)
+
+    lower_sum, higher_sum = thresholds(counts)
+    rm_sum = _n_outliers(counts, lower_sum, "lower")
+    rm_high_sum = _n_outliers(counts, higher_sum, "higher")
+    lower_sum = max(lower_sum, 0)
+
+    if has_mito:
+        max_mito = thresholds(mito_percent)[1]
+        rm_mito = _n_outliers(mito_percent, max_mito, "higher")
+        max_mito = min(max_mito / 100, 1)
+
+    messages = [
+        ("standard_min_genes", lower_detected, rm_detected, "cells"),
+        ("standard_min_cells", lower_expressed, rm_expressed, "genes"),
+        ("standard_min_counts", lower_sum, rm_sum, "cells"),
+        ("standard_n_genes", higher_detected, rm_high_detected, "cells"),
+    ]
+    if has_mito:
+        messages.append(("standard_percent_mito", max_mito, rm_mito, "cells"))
+    messages.append(("standard_max_counts", higher_sum, rm_high_sum, "cells"))
+
+    print("Advised parameters based on outliers with " + str(nmads) + " NMADS:")
+    for name, value, removed, unit in messages:
+        print(f"{name}: {_format_value(value)}, removing {removed} {unit}")
+        if name == "standard_n_genes" and not has_mito:
+            print("No mitochondrial gene detected.")
+    if not has_mito:
+        max_mito = 1
+
+    return np.round(
+        [
+            lower_detected,
+            lower_expressed,
+            lower_sum,
+            higher_detected,
+            max_mito,
+            higher_sum,
+        ],
+        2,
+    )
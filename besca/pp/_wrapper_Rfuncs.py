@@ -1,12 +1,19 @@
 import os
 from scanpy import read_csv as sc_read_csv
-import importlib
 import scanpy as sc
+import numpy as np
 
+from besca._rsession import assign_counts, get_dense, r_session
+from besca.pp._outlier import val_outlier_native
 
-def valOutlier(adata, nmads=3, rlib_loc=""):
+
+def valOutlier(
+    adata, nmads=3, rlib_loc="", method="native", sample_size=None, random_state=0
+):
     """
-    Estimates and returns the thresholds to use for gene/cell filtering based on outliers calculated from the deviation to the median QCs. Wrapper function based on 'isOutlier' function of the 'scater' R package.
+    Estimates and returns the thresholds to use for gene/cell filtering based on outliers calculated from the deviation to the median QCs. Based on the 'isOutlier' function of the 'scater' R package.
+
+    By default the thresholds are calculated natively in python on the sparse count matrix. With method='scater' the original wrapper of the R package is used (requires rpy2 and scater).
 
     Parameters
     ----------
@@ -16,43 +23,28 @@ def valOutlier(adata, nmads=3, rlib_loc=""):
         Number of median absolute deviation to use as threshold for outlier detection. Lenient NMADS (3 to 5) generally yield the best results.
     rlib_loc: `str`
         R library location that will be added to the default .libPaths() to locate the required packages.
+    method: `str` | default = 'native'
+        'native' to calculate the thresholds in python or 'scater' to use the R package.
+    sample_size: `int` | default = None
+        only for method='native': estimate the medians and MADs on a random sample of this many cells (genes), which keeps the estimation fast on very large datasets.
+    random_state: `int` | default = 0
+        only for method='native': seed of the random sample.
 
     Returns
     -------
     The estimated parameters to set in the besca workflow considering the QC distribution.
     """
+    if method == "native":
+        return val_outlier_native(
+            adata, nmads=nmads, sample_size=sample_size, random_state=random_state
+        )
+    elif method != "scater":
+        raise ValueError("method must be either 'native' or 'scater'")
 
-    rpy2_import = importlib.util.find_spec("rpy2")
-    if rpy2_import is None:
-        raise ImportError("deviance requires rpy2. Install with pip install rpy2")
-    import rpy2.robjects as ro
-    import anndata2ri
-    from scipy.sparse import issparse
-
-    anndata2ri.activate()
-
-    ro.globalenv["rlib_loc"] = rlib_loc
-    ro.r(".libPaths(c(rlib_loc, .libPaths()))")
-    ro.r("suppressPackageStartupMessages(library(scater))")
-    ro.r("suppressPackageStartupMessages(library(Matrix))")
-    ro.r("suppressPackageStartupMessages(library(Seurat))")
-
-    if issparse(adata.X):
-        if not adata.X.has_sorted_indices:
-            adata.X.sort_indices()
-
-    for key in adata.layers:
-        if issparse(adata.layers[key]):
-            if not adata.layers[key].has_sorted_indices:
-                adata.layers[key].sort_indices()
-
-    ro.globalenv["dat"] = adata
-    ro.globalenv["sym"] = adata.var["SYMBOL"]
-    ro.r('seurat_obj = as.Seurat(dat, counts="X", data = NULL)')
-    ro.r(
-        "dat =  SingleCellExperiment(assays = list(counts=seurat_obj@assays$RNA@counts) )"
-    )
-    ro.r("rownames(dat) <- sym")
+    ro = r_session(["scater", "Matrix"], rlib_loc, caller="valOutlier")
+    assign_counts(ro, "counts", adata.X, genes=adata.var["SYMBOL"])
+    ro.r("dat <- SingleCellExperiment(assays = list(counts = counts))")
+    ro.r("rm(counts)")
     ro.r(
         """
     valOutlier <- function(dat, nmads = 3){
@@ -116,7 +108,7 @@ def valOutlier(adata, nmads=3, rlib_loc=""):
      """
     )
     ro.globalenv["nmads"] = nmads
-    return ro.r("valOutlier(dat, nmads = nmads)")
+    return np.array(ro.r("valOutlier(dat, nmads = nmads)"))
 
 
 def scTransform(adata, hvg=False, n_genes=4000, rlib_loc=""):
@@ -139,36 +131,14 @@ def scTransform(adata, hvg=False, n_genes=4000, rlib_loc=""):
     returns an AnnData object reduced to the highly-variable genes.
     """
 
-    rpy2_import = importlib.util.find_spec("rpy2")
-    if rpy2_import is None:
-        raise ImportError("deviance requires rpy2. Install with pip install rpy2")
-    import rpy2.robjects as ro
-    from rpy2.robjects import numpy2ri
-    import anndata2ri
-    from scipy.sparse import issparse
-
-    ro.globalenv["rlib_loc"] = rlib_loc
-    ro.r(".libPaths(c(rlib_loc, .libPaths()))")
-    ro.r("suppressPackageStartupMessages(library(Seurat))")
-    ro.r("suppressPackageStartupMessages(library(scater))")
-    anndata2ri.activate()
+    ro = r_session(["Seurat", "scater"], rlib_loc, caller="scTransform")
 
     sc.pp.filter_genes(adata, min_cells=5)
 
-    if issparse(adata.X):
-        if not adata.X.has_sorted_indices:
-            adata.X.sort_indices()
-
-    for key in adata.layers:
-        if issparse(adata.layers[key]):
-            if not adata.layers[key].has_sorted_indices:
-                adata.layers[key].sort_indices()
-
-    ro.globalenv["adata"] = adata
-
-    ro.r('seurat_obj = as.Seurat(adata, counts="X", data = NULL)')
+    assign_counts(ro, "counts", adata.X, genes=adata.var_names, cells=adata.obs_names)
+    ro.r("seurat_obj <- CreateSeuratObject(counts = counts)")
+    ro.r("rm(counts)")
     if hvg:
-        numpy2ri.activate()
         ro.globalenv["n_genes"] = n_genes
         print("Reducing the data to", n_genes, "variable genes.")
         ro.r(
@@ -183,7 +153,7 @@ def scTransform(adata, hvg=False, n_genes=4000, rlib_loc=""):
             "res <- SCTransform(object=seurat_obj, return.only.var.genes = FALSE, do.correct.umi = FALSE)"
         )
 
-        norm_x = ro.r("res@assays$SCT@scale.data").T
+        norm_x = get_dense(ro, "res@assays$SCT@scale.data").T
 
         adata.layers["counts"] = norm_x
         adata.raw = adata
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+from scipy.special import xlogy
+
+
+def _block_deviance(X, start, stop, totals, p, family):
+    """deviance contribution of the non-zero counts of the cells start:stop per gene"""
+    block = X[start:stop]
+    y = block.data.astype(np.float64)
+    n = np.repeat(totals[start:stop], np.diff(block.indptr))
+    pj = p[block.indices]
+    if family == "binomial":
+        # saturated log-likelihood, zero counts contribute nothing
+        term = xlogy(y, y / n) + xlogy(n - y, (n - y) / n)
+        # the null log-likelihood is added for all cells at once, only the
+        # contribution of the zero counts is corrected for here
+        term -= xlogy(y, pj) + xlogy(n - y, 1 - pj) - xlogy(n, 1 - pj)
+    else:
+        term = xlogy(y, y / (n * pj))
+    return np.bincount(block.indices, weights=term, minlength=X.shape[1])
+
+
+def deviance_native(X, family="binomial", chunk_size=10000, n_jobs=None):
+    """Deviance of every gene under a multinomial null model of constant expression.
+
+    Native implementation of devianceFeatureSelection of the R package scry. The
+    counts are never densified: cell totals and gene totals are computed in a
+    first pass, afterwards the contribution of the stored counts is accumulated
+    per gene over blocks of chunk_size cells, which are processed in parallel.
+
+    parameters
+    ----------
+    X: `csr_matrix` | `numpy.ndarray`
+        raw counts with cells as rows and genes as columns
+    family: `str` | default = 'binomial'
+        'binomial' or 'poisson' approximation of the multinomial model
+    chunk_size: `int` | default = 10000
+        number of cells processed per block
+    n_jobs: `int` | default = None
+        number of threads, defaults to the number of CPUs
+
+    returns
+    -------
+    numpy.ndarray with the deviance of every gene
+    """
+    if family not in ["binomial", "poisson"]:
+        raise ValueError("family must be either 'binomial' or 'poisson'")
+    if not issparse(X) or X.format != "csr":
+        X = csr_matrix(X)
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    totals = np.asarray(X.sum(axis=1, dtype=np.float64)).ravel()
+    gene_totals = np.asarray(X.sum(axis=0, dtype=np.float64)).ravel()
+    p = gene_totals / totals.sum()
+
+    starts = range(0, X.shape[0], chunk_size)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        blocks = pool.map(
+            lambda start: _block_deviance(
+                X, start, start + chunk_size, totals, p, family
+            ),
+            starts,
+        )
+        deviance = sum(blocks, np.zeros(X.shape[1]))
+
+    if family == "binomial":
+        # null log-likelihood as if all counts of a gene were zero
+        deviance -= xlogy(totals.sum(), 1 - p)
+    deviance *= 2
+    # genes without counts (or a single gene containing all counts)
+    deviance[gene_totals == 0] = 0
+    return deviance
@@ -0,0 +1,70 @@
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+
+def _pointwise_dim(distances, k, unbiased=True):
+    """Levina-Bickel maximum likelihood dimension of every point from its k nearest neighbours"""
+    dist = distances[:, :k]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_ratio = np.log(dist[:, [-1]] / dist[:, :-1]).sum(axis=1)
+        return (k - 1 - int(unbiased)) / log_ratio
+
+
+def max_lik_global_dim_est(
+    pcs, k=20, unbiased=True, sample_size=None, random_state=0, n_jobs=None
+):
+    """Native implementation of maxLikGlobalDimEst of the R package intrinsicDimension.
+
+    The dimension is estimated for every point with the maximum likelihood
+    estimator of Levina and Bickel and aggregated over all points by maximum
+    likelihood (inverse of the mean inverse estimate, MacKay and Ghahramani),
+    the defaults of the R function. The neighbours are searched once for the
+    largest k, so several k can be evaluated at the cost of one search.
+
+    parameters
+    ----------
+    pcs: `numpy.ndarray`
+        coordinates of the cells, e.g. adata.obsm['X_pca']
+    k: `int` | `list`
+        number of neighbours, or a list of numbers of neighbours to evaluate
+    unbiased: `bool` | default = True
+        use the factor k-2 instead of k-1
+    sample_size: `int` | default = None
+        if given, the pointwise dimension is only estimated for a random sample
+        of this many cells (their neighbours are searched among all cells)
+    random_state: `int` | default = 0
+        seed of the random sample
+    n_jobs: `int` | default = None
+        number of parallel jobs of the neighbour search, -1 to use all CPUs
+
+    returns
+    -------
+    the estimated dimension, or a dictionary with the estimate for every k if
+    a list of k was given
+    """
+    ks = [k] if np.isscalar(k) else list(k)
+    if min(ks) < 3:
+        raise ValueError("k must be at least 3")
+    pcs = np.asarray(pcs)
+
+    query = pcs
+    if sample_size is not None and sample_size < pcs.shape[0]:
+        rng = np.random.default_rng(random_state)
+        sample = rng.choice(pcs.shape[0], size=sample_size, replace=False)
+        query = pcs[np.sort(sample)]
+
+    nn = NearestNeighbors(n_neighbors=max(ks) + 1, n_jobs=n_jobs).fit(pcs)
+    distances = nn.kneighbors(query, return_distance=True)[0]
+    # the closest point is the query cell itself
+    distances = distances[:, 1:]
+
+    estimates = {}
+    for n_neighbors in ks:
+        dim = _pointwise_dim(distances, n_neighbors, unbiased)
+        # duplicated cells have an undefined pointwise dimension
+        dim = dim[np.isfinite(dim) & (dim > 0)]
+        estimates[n_neighbors] = 1 / np.mean(1 / dim)
+
+    if np.isscalar(k):
+        return estimates[k]
+    return estimates
@@ -1,52 +1,88 @@
 import os
 from scanpy import read_csv as sc_read_csv
-import importlib
 from besca.st._FAIR_export import export_norm_citeseq
 import logging
 from scanpy.tools import pca as sc_pca
+import numpy as np
 
+from besca._rsession import assign_counts, assign_dense, r_session
+from besca.st._deviance import deviance_native
+from besca.st._dimest import max_lik_global_dim_est
 
-def maxLikGlobalDimEst(adata, k=20, nrpcs=50, rlib_loc=""):
+
+def maxLikGlobalDimEst(
+    adata,
+    k=20,
+    nrpcs=50,
+    rlib_loc="",
+    method="native",
+    sample_size=None,
+    random_state=0,
+    n_jobs=None,
+):
     """
     Estimates the intrinsic dimensionality of the data, based on the 'maxLikGlobalDimEst' function of the 'intrinsicDimension' R package.
 
+    By default the estimate is calculated natively in python on adata.obsm['X_pca'], which is reused if it contains at least nrpcs components. With method='intrinsicDimension' the original wrapper of the R package is used (requires rpy2 and intrinsicDimension).
+
     Parameters
     ----------
     adata: `AnnData`
         AnnData object of RNA counts.
-    k: `
-        Number of neighbours to use in the 'maxLikGlobalDimEst'. Choosing k between 10 and 20 generally yields the best results.
+    k: `int` | `list`
+        Number of neighbours to use in the 'maxLikGlobalDimEst'. Choosing k between 10 and 20 generally yields the best results. For method='native' a list of k can be given, which are all evaluated with one neighbour search.
     nrpcs:
         Number of PCs to compute initially before estimating the dimensionality. Consider increasing it for very high dimensional data.
     rlib_loc: `str`
         R library location that will be added to the default .libPaths() to locate the required packages.
+    method: `str` | default = 'native'
+        'native' to estimate the dimensionality in python or 'intrinsicDimension' to use the R package.
+    sample_size: `int` | default = None
+        only for method='native': estimate the dimension on a random sample of this many cells (their neighbours are searched among all cells).
+    random_state: `int` | default = 0
+        only for method='native': seed of the random sample.
+    n_jobs: `int` | default = None
+        only for method='native': number of parallel jobs of the neighbour search, -1 to use all CPUs.
 
     Returns
     -------
-    Returns the estimated intrinsic dimensionality of the data that can be used for graph clustering.
+    Returns the estimated intrinsic dimensionality of the data that can be used for graph clustering, or a dictionary with the estimate for every k if a list of k was given.
     """
-
-    rpy2_import = importlib.util.find_spec("rpy2")
-    if rpy2_import is None:
-        raise ImportError(
-            "maxLikGlobalDimEst requires rpy2. Install with pip install rpy2"
+    if method == "native":
+        if "X_pca" not in adata.obsm or adata.obsm["X_pca"].shape[1] < nrpcs:
+            print("Using random_state = 0 for all the following calculations")
+            sc_pca(adata, svd_solver="arpack", random_state=0, n_comps=nrpcs)
+        dim_est = max_lik_global_dim_est(
+            adata.obsm["X_pca"][:, :nrpcs],
+            k=k,
+            unbiased=True,
+            sample_size=sample_size,
+            random_state=random_state,
+            n_jobs=n_jobs,
         )
-    import rpy2.robjects as ro
-    import anndata2ri
-    from scipy.sparse import issparse
-
-    ro.globalenv["rlib_loc"] = rlib_loc
-    ro.r(".libPaths(c(rlib_loc, .libPaths()))")
-    ro.r("suppressPackageStartupMessages(library(intrinsicDimension))")
+        if not isinstance(dim_est, dict):
+            print("Estimated dimensionality:", round(dim_est))
+            return int(round(dim_est))
+        for n_neighbors, value in dim_est.items():
+            dim_est[n_neighbors] = int(round(value))
+            print(
+                "Estimated dimensionality (k=" + str(n_neighbors) + "):",
+                dim_est[n_neighbors],
+            )
+        return dim_est
+    elif method != "intrinsicDimension":
+        raise ValueError("method must be either 'native' or 'intrinsicDimension'")
+
+    ro = r_session(["intrinsicDimension"], rlib_loc, caller="maxLikGlobalDimEst")
 
     random_state = 0
     print("Using random_state = 0 for all the following calculations")
     sc_pca(adata, svd_solver="arpack", random_state=0, n_comps=nrpcs)
     adata.obsm["X_pca"] *= -1  # multiply by -1 to match Seurat
 
-    ro.globalenv["pcs"] = adata.obsm["X_pca"]
+    assign_dense(ro, "pcs", adata.obsm["X_pca"])
     ro.globalenv["k"] = k
-    ro.r("n <- maxLikGlobalDimEst(as.matrix(pcs), k=k, unbiased=TRUE)")
+    ro.r("n <- maxLikGlobalDimEst(pcs, k=k, unbiased=TRUE)")
 
     ro.r('message("Estimated dimensionality: ", round(n$dim.est))')
 
@@ -55,9 +91,19 @@ def maxLikGlobalDimEst(adata, k=20, nrpcs=50, rlib_loc=""):
     return int(n_dimest[0])
 
 
-def deviance(adata, n_genes=4000, rlib_loc=""):
+def deviance(
+    adata,
+    n_genes=4000,
+    rlib_loc="",
+    method="native",
+    family="binomial",
+    chunk_size=10000,
+    n_jobs=None,
+):
     """
-    Wrapper of the 'deviance' method of highly-variable gene selection, included in the 'scry' R package.
+    Highly-variable gene selection with the 'deviance' method of the 'scry' R package.
+
+    By default the deviance is calculated natively in python on the sparse count matrix, without densifying it. With method='scry' the original wrapper of the R package is used (requires rpy2 and scry).
 
     Parameters
     ----------
@@ -67,43 +113,42 @@ def deviance(adata, n_genes=4000, rlib_loc=""):
         Number of highly-variable genes to return. A selection of 4000-5000 generally yields the best results.
     rlib_loc: `str`
         R library location that will be added to the default .libPaths() to locate the required packages.
+    method: `str` | default = 'native'
+        'native' to calculate the deviance in python or 'scry' to use the R package.
+    family: `str` | default = 'binomial'
+        only for method='native': 'binomial' or 'poisson' deviance, as in scry.
+    chunk_size: `int` | default = 10000
+        only for method='native': number of cells processed per block.
+    n_jobs: `int` | default = None
+        only for method='native': number of threads, defaults to the number of CPUs.
 
     Returns
     -------
-    returns an AnnData object reduced to the highly-variable genes.
+    returns an AnnData object reduced to the highly-variable genes, ordered by decreasing deviance.
     """
-    rpy2_import = importlib.util.find_spec("rpy2")
-    if rpy2_import is None:
-        raise ImportError("deviance requires rpy2. Install with pip install rpy2")
-    from rpy2.robjects.packages import importr
-    import rpy2.robjects as ro
-    import anndata2ri
-    from scipy.sparse import issparse
-
-    anndata2ri.activate()
-
-    ro.globalenv["rlib_loc"] = rlib_loc
-    ro.r(".libPaths(c(rlib_loc, .libPaths()))")
-    ro.r("suppressPackageStartupMessages(library(scry))")
-    ro.r("suppressPackageStartupMessages(library(Seurat))")
-
-    if issparse(adata.X):
-        if not adata.X.has_sorted_indices:
-            adata.X.sort_indices()
-    for key in adata.layers:
-        if issparse(adata.layers[key]):
-            if not adata.layers[key].has_sorted_indices:
-                adata.layers[key].sort_indices()
-
-    ro.globalenv["adata"] = adata
+    if method == "native":
+        print("Reducing the data to", n_genes, "variable genes.")
+        dev = deviance_native(
+            adata.X, family=family, chunk_size=chunk_size, n_jobs=n_jobs
+        )
+        # stable sort, ties keep the order of adata.var
+        top = np.argsort(-dev, kind="stable")[:n_genes]
+        adata = adata[:, top].copy()
+        adata.var["deviance"] = dev[top]
+        adata.var["highly_variable"] = True
+        return adata
+    elif method != "scry":
+        raise ValueError("method must be either 'native' or 'scry'")
+
+    ro = r_session(["scry", "Matrix"], rlib_loc, caller="deviance")
+
+    # genes x cells sparse counts, scry does not need a dense matrix
+    assign_counts(ro, "counts", adata.X, genes=adata.var_names)
     ro.globalenv["n"] = n_genes
     print("Reducing the data to", n_genes, "variable genes.")
-    ro.globalenv["rownam"] = adata.var.index
-    ro.r('seurat_obj = as.Seurat(adata, counts="X", data = NULL)')
-    ro.r("adata <- t(as.matrix(seurat_obj@assays$RNA@counts))")
-    ro.r("out <- devianceFeatureSelection(adata)")
-    ro.r("out <- sort(devianceFeatureSelection(adata),decreasing = TRUE)[1:n] ")
-    hvgs_r = ro.r("rownam[order(out, decreasing = TRUE)][1:n]")
+    ro.r("out <- devianceFeatureSelection(counts)")
+    hvgs_r = ro.r("rownames(counts)[order(out, decreasing = TRUE)][1:n]")
+    ro.r("rm(counts)")
     adata = adata[:, list(hvgs_r)]
     adata.var["highly_variable"] = True
 
@@ -148,26 +193,22 @@ def dsb_normalize(
     returns an AnnData object with DSB-normalized counts.
     """
 
-    rpy2_import = importlib.util.find_spec("rpy2")
-    if rpy2_import is None:
-        raise ImportError("dsb_normalize requires rpy2. Install with pip install rpy2")
-    from rpy2.robjects.packages import importr
-    import rpy2.robjects as ro
-    import anndata2ri
-    from scipy.sparse import issparse
-
-    ro.globalenv["rlib_loc"] = rlib_loc
-    ro.r(".libPaths(c(rlib_loc, .libPaths()))")
-    ro.r("suppressPackageStartupMessages(library(vctrs))")
-    ro.r("suppressPackageStartupMessages(library(ggplot2))")
-    ro.r("suppressPackageStartupMessages(library(patchwork))")
-    ro.r("suppressPackageStartupMessages(library(dsb))")
-    ro.r("suppressPackageStartupMessages(library(tidyverse))")
-    ro.r("suppressPackageStartupMessages(library(magrittr))")
-    ro.r("suppressPackageStartupMessages(library(data.table))")
-    ro.r("suppressPackageStartupMessages(library(Matrix))")
-    ro.r("suppressPackageStartupMessages(library(DropletUtils))")
-    ro.r("suppressPackageStartupMessages(library(readr))")
+    ro = r_session(
+        [
+            "vctrs",
+            "ggplot2",
+            "patchwork",
+            "dsb",
+            "tidyverse",
+            "magrittr",
+            "data.table",
+            "Matrix",
+            "DropletUtils",
+            "readr",
+        ],
+        rlib_loc,
+        caller="dsb_normalize",
+    )
 
     ro.r(
         """
@@ -154,7 +154,13 @@ def setup_citeseq(
 
 
 def read_matrix(
-    root_path, citeseq=None, annotation=True, use_genes="SYMBOL", species="human"
+    root_path,
+    citeseq=None,
+    annotation=True,
+    use_genes="SYMBOL",
+    species="human",
+    cache=True,
+    cache_dir=None,
 ):
     """Read matrix file as expected for the standard workflow.
     ----------
@@ -173,6 +179,11 @@ def read_matrix(
     citeseq: 'gex_only' or 'citeseq_only' or None | default = None
         string indicating if only gene expression values (gex_only) or only protein
         expression values ('citeseq_only') or everything is read if None is specified
+    cache: `bool` | default = True
+        boolian identifier if the parsed input files should be stored in (and
+        reloaded from) a binary cache, see besca.Import.read_mtx
+    cache_dir: `str` | default = None
+        directory of the cache, defaults to ~/.cache/besca/read_mtx
     Returns
     -------
     returns an AnnData object
@@ -186,6 +197,8 @@ def read_matrix(
         annotation=annotation,
         use_genes=use_genes,
         species=species,
+        cache=cache,
+        cache_dir=cache_dir,
     )
     logging.info(
         "After input: "
@@ -290,8 +303,8 @@ def clr_normalize(adata, results_folder):
     normalize_geometric(adata)
     print("clr normalization applied to adata")
 
-    # keep raw copy
-    adata.raw = adata.copy()
+    # keep raw copy (assigning raw already copies X)
+    adata.raw = adata
     print("normalized values saved into adata.raw")
 
     # make log entries
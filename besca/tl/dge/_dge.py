@@ -6,7 +6,7 @@ from numpy import sign, log10, inf, max, abs, floor, arange, round, sort
 from plotly.offline import plot as plotly_plot
 
 # other besca functions
-from besca._helper import get_raw, subset_adata
+from besca._helper import get_rank_genes_groups, get_raw, subset_adata
 
 import pytest
 
@@ -30,129 +30,24 @@ def extract_info_rank_genes_groups(adata):
         each of type pandas.DataFrame
 
     """
-    rank_genes = adata.uns["rank_genes_groups"]
-    groups = rank_genes["names"].dtype.names
-    group_number = len(groups)
+    frames = get_rank_genes_groups(adata.uns["rank_genes_groups"])
 
     # get gene information
     mydat = adata.var.loc[:, ["SYMBOL", "ENSEMBL"]]
     mydat.rename(columns={"SYMBOL": "Description"}, inplace=True)
 
-    # initialize dataframe for storing the scores
-    scores = DataFrame(
-        {"n_" + key[:1]: rank_genes[key][groups[0]] for key in ["names", "scores"]}
-    )
-    scores.rename(columns={"n_s": groups[0], "n_n": "NAME"}, inplace=True)
-    scores.set_index("NAME", inplace=True)
-    scores.index = scores.index.astype(str)
-
-    for i in range(1, group_number):
-        n_scores = DataFrame(
-            {"n_" + key[:1]: rank_genes[key][groups[i]] for key in ["names", "scores"]}
+    results = []
+    for key in ["scores", "pvals", "logfoldchanges", "pvals_adj"]:
+        # merge in gene annotation
+        result = mydat.merge(
+            frames[key], how="right", left_index=True, right_index=True
         )
-        n_scores.set_index("n_n", inplace=True)
-        n_scores.index = n_scores.index.astype(str)
-        scores = scores.merge(n_scores, how="left", left_index=True, right_index=True)
-        newname = groups[i]
-        scores.rename(columns={"n_s": newname}, inplace=True)
-    scores = scores.astype(float)
-
-    # merge in gene annotation
-    scores = mydat.merge(scores, how="right", left_index=True, right_index=True)
-
-    # make index into ENSEMBL instead of symbol
-    scores.set_index("ENSEMBL", inplace=True)
-    scores.index.names = ["NAME"]
-
-    # get pvalues
-    # initialize dataframe for storing the pvalues
-    pvalues = DataFrame(
-        {"n_" + key[:1]: rank_genes[key][groups[0]] for key in ["names", "pvals"]}
-    )
-    pvalues.rename(columns={"n_p": groups[0], "n_n": "NAME"}, inplace=True)
-    pvalues.set_index("NAME", inplace=True)
-    pvalues.index = pvalues.index.astype(str)
 
-    for i in range(1, group_number):
-        n_pvalues = DataFrame(
-            {"n_" + key[:1]: rank_genes[key][groups[i]] for key in ["names", "pvals"]}
-        )
-        n_pvalues.set_index("n_n", inplace=True)
-        n_pvalues.index = n_pvalues.index.astype(str)
-        pvalues = pvalues.merge(
-            n_pvalues, how="left", left_index=True, right_index=True
-        )
-        newname = groups[i]
-        pvalues.rename(columns={"n_p": newname}, inplace=True)
-    pvalues = pvalues.astype(float)
-
-    # merge in pvalues
-    pvalues = mydat.merge(pvalues, how="right", left_index=True, right_index=True)
-
-    # make index into ENSEMBL instead of symbol
-    pvalues.set_index("ENSEMBL", inplace=True)
-    pvalues.index.names = ["NAME"]
-
-    # get logFC
-    logFC = DataFrame(
-        {
-            "n_" + key[:1]: rank_genes[key][groups[0]]
-            for key in ["names", "logfoldchanges"]
-        }
-    )
-    logFC.rename(columns={"n_l": groups[0], "n_n": "NAME"}, inplace=True)
-    logFC.set_index("NAME", inplace=True)
-    logFC.index = logFC.index.astype(str)
-
-    for i in range(1, group_number):
-        n_logFC = DataFrame(
-            {
-                "n_" + key[:1]: rank_genes[key][groups[i]]
-                for key in ["names", "logfoldchanges"]
-            }
-        )
-        n_logFC.set_index("n_n", inplace=True)
-        n_logFC.index = n_logFC.index.astype(str)
-        logFC = logFC.merge(n_logFC, how="left", left_index=True, right_index=True)
-        newname = groups[i]
-        logFC.rename(columns={"n_l": newname}, inplace=True)
-    logFC = logFC.astype(float)
-
-    # merge in pvalues
-    logFC = mydat.merge(logFC, how="right", left_index=True, right_index=True)
-
-    # make index into ENSEMBL instead of symbol
-    logFC.set_index("ENSEMBL", inplace=True)
-    logFC.index.names = ["NAME"]
-
-    # get FDRs
-    FDRs = DataFrame(
-        {"n_" + key[:1]: rank_genes[key][groups[0]] for key in ["names", "pvals_adj"]}
-    )
-    FDRs.rename(columns={"n_p": groups[0], "n_n": "NAME"}, inplace=True)
-    FDRs.set_index("NAME", inplace=True)
-    FDRs.index = FDRs.index.astype(str)
-
-    for i in range(1, group_number):
-        n_FDRs = DataFrame(
-            {
-                "n_" + key[:1]: rank_genes[key][groups[i]]
-                for key in ["names", "pvals_adj"]
-            }
-        )
-        n_FDRs.set_index("n_n", inplace=True)
-        n_FDRs.index = n_FDRs.index.astype(str)
-        FDRs = FDRs.merge(n_FDRs, how="left", left_index=True, right_index=True)
-        newname = groups[i]
-        FDRs.rename(columns={"n_p": newname}, inplace=True)
-    FDRs = FDRs.astype(float)
-
-    # merge in pvalues
-    FDRs = mydat.merge(FDRs, how="right", left_index=True, right_index=True)
-
-    # make index into ENSEMBL instead of symbol
-    FDRs.set_index("ENSEMBL", inplace=True)
-    FDRs.index.names = ["NAME"]
+        # make index into ENSEMBL instead of symbol
+        result.set_index("ENSEMBL", inplace=True)
+        result.index.names = ["NAME"]
+        results.append(result)
+    scores, pvalues, logFC, FDRs = results
 
     return (scores, pvalues, logFC, FDRs)
 
@@ -4,6 +4,7 @@ from besca.tl.sig._annot import (
     getset,
     make_anno,
     match_cluster,
+    match_clusters,
     match_label,
     obtain_dblabel,
     obtain_new_label,
@@ -12,6 +13,7 @@ from besca.tl.sig._annot import (
 )
 from besca.tl.sig._gems_link import get_gems, get_similar_geneset, insert_gems
 from besca.tl.sig._io_sig import convert_to_directed, read_GMT_sign, write_gmtx_forgems
+from besca.tl.sig._library import SignatureLibrary, read_signature_library
 from besca.tl.sig._sig import (
     combined_signature_score,
     compute_signed_score,
@@ -30,12 +32,15 @@ __all__ = [
     "filter_siggenes",
     "convert_siggenes",
     "read_GMT_sign",
+    "read_signature_library",
+    "SignatureLibrary",
     "getset",
     "score_mw",
     "add_anno",
     "make_anno",
     "read_annotconfig",
     "match_cluster",
+    "match_clusters",
     "obtain_new_label",
     "obtain_dblabel",
     "get_gems",
@@ -2,7 +2,8 @@
 import numpy as np
 import pandas as pd
 from scanpy import AnnData
-from scipy.stats import mannwhitneyu
+from scipy.sparse import csr_matrix
+from scipy.stats import norm
 
 def getset(df: pd.DataFrame, signame_complete: str, threshold) -> set:
     """Handles missing signatures aux function for make_anno
@@ -50,11 +51,41 @@ def gene_fr(f: pd.DataFrame, gene_name: str):
     return k.mean(axis=0, skipna=True)
 
 
+def _column_ranks(values: np.ndarray):
+    """Average ranks of the values of every column, with the tie group (id and size) of every value."""
+    n = values.shape[0]
+    order = np.argsort(values, axis=0, kind="stable")
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    new_group = np.ones(values.shape, dtype=bool)
+    new_group[1:] = sorted_values[1:] != sorted_values[:-1]
+    last_of_group = np.ones(values.shape, dtype=bool)
+    last_of_group[:-1] = new_group[1:]
+    position = np.broadcast_to(np.arange(n)[:, None], values.shape)
+    first = np.maximum.accumulate(np.where(new_group, position, 0), axis=0)
+    last = np.minimum.accumulate(np.where(last_of_group, position, n)[::-1], axis=0)[
+        ::-1
+    ]
+
+    ranks, group, size = (np.empty(values.shape) for _ in range(3))
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=0)
+    np.put_along_axis(group, order, np.cumsum(new_group, axis=0), axis=0)
+    np.put_along_axis(size, order, last - first + 1, axis=0)
+    return ranks, group, size
+
+
 def score_mw(f: pd.DataFrame, mymarkers: dict) -> pd.DataFrame:
     """Score Clusters based on a set of immune signatures to generate a df of pvals
     Takes as an input a dataframe with fractions per clusters and a dictionary of signatures
     Performs a Mann-Whitney test per each column and Signature, returns -10logpValues
 
+    The test of every signature (the fractions of its genes, x) against all
+    genes of a cluster (y) is the one sided (greater) test of scipy's
+    mannwhitneyu with continuity and tie correction. As x is contained in y,
+    the statistic only depends on the ranks of x within y, so every cluster
+    column is ranked once and the U statistics of all signatures are
+    obtained with one matrix product; only the tie correction is computed
+    per signature.
+
     Parameters
     ----------
     f: panda.DataFrame
@@ -67,18 +98,57 @@ def score_mw(f: pd.DataFrame, mymarkers: dict) -> pd.DataFrame:
     panda.DataFrame
         a dataframe of -10logpValues per cluster and signature
     """
-    ids = set(f.iloc[:, 2 : len(f.columns)])
-    mypFrame = pd.DataFrame(index=mymarkers.keys(), columns=list(ids))
-    for key, value in mymarkers.items():
-        for i in list(ids):
-            mypFrame.loc[key, i] = -10 * np.log(
-                mannwhitneyu(
-                    x=f.loc[f["Description"].isin(value), :][i],
-                    y=f[i],
-                    alternative="greater",
-                ).pvalue
-            )
-    return mypFrame
+    clusters = list(f.columns[2:])
+    values = f[clusters].to_numpy(dtype=float)
+    ranks, group, size = _column_ranks(values)
+    n2 = values.shape[0]
+    # tie term of y alone: sum over the tie groups of (t^3 - t)
+    tie_y = (size**2 - 1).sum(axis=0)
+
+    # rows of f of every signature (signatures x genes indicator matrix)
+    rows = [np.flatnonzero(f["Description"].isin(x)) for x in mymarkers.values()]
+    lengths = np.array([len(x) for x in rows])
+    members = csr_matrix(
+        (
+            np.ones(lengths.sum()),
+            (np.repeat(np.arange(len(rows)), lengths), np.concatenate(rows)),
+        ),
+        shape=(len(rows), n2),
+    )
+    n1 = lengths.astype(float)[:, None]
+    # the ranks of x within x and y together are their ranks in y plus n1/2 on average
+    U1 = members @ ranks - n1 / 2
+
+    tie_term = np.tile(tie_y, (len(rows), 1))
+    for k, x in enumerate(rows):
+        if len(x) == 0:
+            continue
+        # values of x join the tie groups of y, runs of equal values in x extend them
+        order = np.argsort(group[x], axis=0, kind="stable")
+        x_group = np.take_along_axis(group[x], order, axis=0).T.ravel()
+        x_size = np.take_along_axis(size[x], order, axis=0).T.ravel()
+        start = np.ones(len(x_group), dtype=bool)
+        start[1:] = x_group[1:] != x_group[:-1]
+        start[:: len(x)] = True
+        run_length = np.bincount(np.cumsum(start) - 1)
+        t = x_size[start]
+        extra = 3 * t**2 * run_length + 3 * t * run_length**2 + run_length**3
+        tie_term[k] += np.bincount(
+            np.flatnonzero(start) // len(x),
+            weights=extra - run_length,
+            minlength=len(clusters),
+        )
+
+    n = n1 + n2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sd = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+        z = (U1 - n1 * n2 / 2 - 0.5) / sd
+        pvalue = np.clip(norm.sf(z), 0, 1)
+        scores = -10 * np.log(pvalue)
+    # signatures without any gene in f can not be tested
+    scores[n1[:, 0] == 0] = np.nan
+    scores[:, np.isnan(values).any(axis=0)] = np.nan
+    return pd.DataFrame(scores, index=list(mymarkers.keys()), columns=clusters)
 
 
 def add_anno(adata: AnnData, cnames: pd.DataFrame, mycol, clusters="leiden"):
@@ -116,9 +186,25 @@ def add_anno(adata: AnnData, cnames: pd.DataFrame, mycol, clusters="leiden"):
         )
         return errm
     else:
-        for i in list(set(newlab)):
-            newlab = newlab.replace(i, cnames.loc[i, mycol]).copy()
-        return newlab
+        annotation = cnames[mycol]
+        if isinstance(newlab.dtype, pd.CategoricalDtype):
+            # relabel the categories once, the cells keep their category codes
+            categories = newlab.cat.categories
+            labels = np.where(
+                categories.isin(annotation.index),
+                annotation.reindex(categories).to_numpy(dtype=object),
+                categories.to_numpy(dtype=object),
+            )
+            label_codes, new_categories = pd.factorize(labels, sort=True)
+            codes = newlab.cat.codes.to_numpy()
+            return pd.Series(
+                pd.Categorical.from_codes(
+                    np.where(codes >= 0, label_codes[codes], -1), new_categories
+                ),
+                index=newlab.index,
+                name=newlab.name,
+            )
+        return newlab.map(annotation).where(newlab.isin(annotation.index), newlab)
 
 
 def read_annotconfig(configfile: str):
@@ -240,40 +326,45 @@ def make_anno(
     sigscoresk = {x: sigscores[x] for x in sigscores.keys() if not x in toexclude}
 
     # First part, get cluster identities
-    myclust = list(df.columns)
-    cnames = pd.DataFrame(index=myclust)
+    myclust = pd.Index(df.columns)
+    cnames = pd.DataFrame(index=list(myclust))
+
+    def attributed(celltypes):
+        # boolean matrix celltypes x clusters of the clusters attributed to every cell type
+        matrix = np.zeros((len(celltypes), len(myclust)), dtype=bool)
+        for k, celltype in enumerate(celltypes):
+            matrix[k] = myclust.isin(list(sigscoresk[celltype]))
+        return matrix
+
+    def first_match(celltypes, matrix, default):
+        # first cell type (in level order) of every cluster, default if none matches
+        labels = np.array(list(celltypes) + [None], dtype=object)
+        first = np.where(matrix.any(axis=0), matrix.argmax(axis=0), len(celltypes))
+        return np.where(first < len(celltypes), labels[first], default)
+
     # DATA INITIALISATION; first level
     colname = lab + "0"
-    cnames[colname] = None
-    for celltype in levskk[0]:
-        for ii in myclust:
-            if ii in sigscoresk[celltype]:
-                if cnames.loc[ii, colname] is None:
-                    cnames.loc[ii, colname] = celltype
+    cnames[colname] = first_match(
+        levskk[0], attributed(levskk[0]), np.full(len(myclust), None)
+    )
     # ASSIGNED ALL FIRST LEVEL
     if len(levskk) > 2:
         for j in range(len(levskk) - 1):
             parent_col = lab + str(j)
             colname = lab + str(j + 1)
-            cnames[colname] = None
-            for ii in myclust:
-                # Find child level and removing excluding term
-                sublev = set(
-                    sigconfig.loc[
-                        sigconfig["Parent"] == cnames.loc[ii, parent_col], :
-                    ].index
-                ).intersection(toinc)
-                # getting the right order using levskk
-                sublevk = [x for x in levskk[j + 1] if x in sublev]
-                assigned_type = False
-                for lev in sublevk:
-                    if ii in sigscoresk[lev]:
-                        if cnames.loc[ii, colname] is None:
-                            cnames.loc[ii, colname] = lev
-                            assigned_type = True
-                # If no value, put parent value
-                if not assigned_type:
-                    cnames.loc[ii, colname] = cnames.loc[ii, parent_col]
+            parents = cnames[parent_col].to_numpy(dtype=object)
+            # child levels of the cluster's cell type, in the order of levskk
+            sublev = levskk[j + 1]
+            sublev_parent = (
+                sigconfig["Parent"].reindex(sublev).to_numpy(dtype=object)[:, None]
+            )
+            allowed = (
+                attributed(sublev)
+                & (sublev_parent == parents[None, :])
+                & pd.notna(parents)[None, :]
+            )
+            # If no value, put parent value
+            cnames[colname] = first_match(sublev, allowed, parents)
     return cnames
 
 
@@ -302,12 +393,81 @@ def match_cluster(
         a list of the cluster IDs that match the query label
     """
 
-    myc = []
-    myleiden = list(set(adata[adata.obs[obsquery].isin([obsqueryval])].obs[obsref]))
-    for i in myleiden:
-        mysub = adata[adata.obs[obsref].isin([i])].copy()
-        myc.append(len(mysub[mysub.obs[obsquery] == obsqueryval]) / len(mysub))
-    return list(np.array(myleiden)[np.array(myc) > cutoff])
+    matched = match_clusters(adata, obsquery, obsref, cutoff, [obsqueryval])
+    return matched.get(obsqueryval, [])
+
+
+def _obs_codes(column: pd.Series):
+    """integer codes (-1 for missing values) and the categories of an adata.obs column"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(dtype=np.int64), column.cat.categories
+    return pd.factorize(column)
+
+
+def match_clusters(
+    adata: AnnData,
+    obsquery: str,
+    obsref: str = "leiden",
+    cutoff=0.5,
+    obsqueryvals: list = None,
+) -> dict:
+    """Matches categories from adata.obs to each other for all values of a query category at once.
+    For every value of obsquery (or the values in obsqueryvals), returns the clusters (or other
+    adata.obs categories, obsref) that contain >50% (or distinct cutoff, cutoff) of cells of this kind,
+    as match_cluster does for a single value.
+
+    A single value x cluster contingency table is counted from the codes of the two
+    columns, only adata.obs is accessed.
+
+    Parameters
+    ----------
+    adata: AnnData
+      AnnData object
+    obsquery: 'str'
+      adata.obs category name used for querying
+    obsref: 'str'
+      adata.obs category name to be returned
+    cutoff: 'numpy.float64'
+      fraction of positive cells returned
+    obsqueryvals: list of str
+      values of obsquery to match, defaults to all values of obsquery
+    returns
+    -------
+    dict
+        the list of the cluster IDs that match every query label
+
+    Example
+    -------
+    >>> import besca as bc
+    >>> import pandas as pd
+    >>> from anndata import AnnData
+    >>> adata = AnnData(obs=pd.DataFrame({'celltype': ['B', 'B', 'B', 'T', 'T', 'T'],
+    ...                                   'leiden': ['0', '0', '1', '1', '1', '2']},
+    ...                                  index=[str(i) for i in range(6)]))
+    >>> bc.tl.sig.match_clusters(adata, 'celltype', 'leiden')
+    {'B': ['0'], 'T': ['1', '2']}
+    """
+    query_codes, query_values = _obs_codes(adata.obs[obsquery])
+    ref_codes, clusters = _obs_codes(adata.obs[obsref])
+    n_values, n_clusters = len(query_values), len(clusters)
+
+    both = (query_codes >= 0) & (ref_codes >= 0)
+    counts = np.bincount(
+        query_codes[both] * n_clusters + ref_codes[both],
+        minlength=n_values * n_clusters,
+    ).reshape(n_values, n_clusters)
+    # all cells of a cluster count, also the ones without query value
+    totals = np.bincount(ref_codes[ref_codes >= 0], minlength=n_clusters)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        matches = (counts > 0) & (counts / totals > cutoff)
+
+    if obsqueryvals is None:
+        obsqueryvals = list(query_values)
+    positions = pd.Index(query_values).get_indexer(obsqueryvals)
+    return {
+        value: list(clusters[matches[position]]) if position >= 0 else []
+        for value, position in zip(obsqueryvals, positions)
+    }
 
 
 def obtain_new_label(
@@ -1,6 +1,38 @@
 # this file contains the helper functions
 # for signature scoring analysis in python using scanpy
 
+from functools import lru_cache
+
+from besca.datasets._homologs import get_mouse_human_conversion
+
+
+def _invert_conversion(conversionTable) -> dict:
+    """Dictionary mapping every value of the conversion Series to its first index label."""
+    # entries without label (e.g. genes without ortholog) are not converted
+    labelled = conversionTable[conversionTable.index.notna()]
+    first = labelled[~labelled.duplicated()]
+    return dict(zip(first.values, first.index.astype(str)))
+
+
+@lru_cache(maxsize=1)
+def _bundled_conversion_lookup() -> dict:
+    """inverted table of get_mouse_human_conversion, which returns the same Series on every call"""
+    return _invert_conversion(get_mouse_human_conversion())
+
+
+def _conversion_lookup(conversionTable):
+    """Dictionary mapping every value of the conversion Series to its first index label.
+
+    Converting many symbols is then a dictionary lookup per symbol instead of
+    a scan of the table. The inverted table of the bundled mouse to human
+    table (get_mouse_human_conversion) is computed once per process, tables
+    given by the user are inverted on every call, so they can be modified in
+    between.
+    """
+    if conversionTable is get_mouse_human_conversion():
+        return _bundled_conversion_lookup()
+    return _invert_conversion(conversionTable)
+
 
 def _to_geneid(conversionTable, symbol):
     """Convert the symbol into another using the conversionSymbol table,
@@ -25,8 +57,4 @@ def _to_geneid(conversionTable, symbol):
     >>> _to_geneid( x, 'bb')
     'b'
     """
-    try:
-        res = conversionTable[conversionTable == symbol].index.format()[0]
-        return res
-    except IndexError:
-        return None
+    return _conversion_lookup(conversionTable).get(symbol)
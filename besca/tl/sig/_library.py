@@ -0,0 +1,307 @@
+# this file contains the compiled signature library: signatures parsed once,
+# stored as integer gene codes and cached to disk
+
+import hashlib
+import os
+
+import numpy as np
+from pandas import Index, unique
+
+from besca.Import._cache import _content_hash
+from besca.tl.sig._helper import _conversion_lookup
+from besca.tl.sig._io_sig import read_GMT_sign
+
+# bump when the layout of the cached libraries changes
+_LIBRARY_VERSION = "1"
+
+
+def default_library_dir() -> str:
+    """directory used for cached signature libraries if no cache_dir is specified"""
+    return os.path.join(os.path.expanduser("~"), ".cache", "besca", "signatures")
+
+
+class SignatureLibrary:
+    """Signatures compiled to integer gene codes.
+
+    Every entry of the library is one direction (UP or DN) of a signature.
+    The genes of all entries are stored as codes into one vocabulary of unique
+    gene names (codes[offsets[i]:offsets[i + 1]] are the genes of entry i), so
+    resolving the library against the var_names of a dataset is a single hash
+    lookup of the vocabulary. The library can be passed directly to
+    combined_signature_score and compute_signed_score instead of a signature
+    dictionary.
+
+    Create it with read_signature_library or SignatureLibrary.from_dict.
+    """
+
+    def __init__(
+        self, names, entry_signature, entry_direction, vocabulary, codes, offsets
+    ):
+        self.names = list(names)
+        self.entry_signature = np.asarray(entry_signature, dtype=np.int32)
+        self.entry_direction = list(entry_direction)
+        self.vocabulary = Index(vocabulary, dtype=object)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, signature_name):
+        return signature_name in self.names
+
+    def __repr__(self):
+        return (
+            "SignatureLibrary with "
+            + str(len(self.names))
+            + " signatures of "
+            + str(len(self.vocabulary))
+            + " genes"
+        )
+
+    @classmethod
+    def from_dict(cls, signature_dict: dict, direction: str = "UP"):
+        """Compile a signature dictionary.
+
+        Parameters
+        ----------
+        signature_dict: `dict`
+            signatures as returned by read_GMT_sign, values are either a dict
+            with the directions as keys and the genes as values or a list of genes
+        direction: `str` | default = "UP"
+            direction of the signatures given as lists of genes
+
+        Returns
+        -------
+        SignatureLibrary
+        """
+        names, entry_signature, entry_direction, genes = [], [], [], []
+        for signature_name, dir_dict in signature_dict.items():
+            if not isinstance(dir_dict, dict):
+                dir_dict = {direction: dir_dict}
+            entry_signature += [len(names)] * len(dir_dict)
+            names.append(signature_name)
+            for key, gene_list in dir_dict.items():
+                entry_direction.append(key)
+                genes.append([str(gene).strip() for gene in gene_list])
+
+        lengths = [len(gene_list) for gene_list in genes]
+        all_genes = [gene for gene_list in genes for gene in gene_list]
+        vocabulary = Index(unique(np.array(all_genes, dtype=object)))
+        codes = vocabulary.get_indexer(all_genes)
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        return cls(names, entry_signature, entry_direction, vocabulary, codes, offsets)
+
+    def save(self, filename: str):
+        """Write the library to a compressed numpy archive (.npz)."""
+        with open(filename, "wb") as fp:
+            np.savez_compressed(
+                fp,
+                names=np.array(self.names, dtype=str),
+                entry_signature=self.entry_signature,
+                entry_direction=np.array(self.entry_direction, dtype=str),
+                vocabulary=np.array(self.vocabulary, dtype=str),
+                codes=self.codes,
+                offsets=self.offsets,
+            )
+
+    @classmethod
+    def load(cls, filename: str):
+        """Read a library written with save."""
+        with np.load(filename, allow_pickle=False) as archive:
+            return cls(
+                archive["names"].tolist(),
+                archive["entry_signature"],
+                archive["entry_direction"].tolist(),
+                archive["vocabulary"].tolist(),
+                archive["codes"],
+                archive["offsets"],
+            )
+
+    def positions(self, var_names, signature_names=None):
+        """Positions in var_names of the genes of every signature and direction.
+
+        Parameters
+        ----------
+        var_names: `pandas.Index`
+            gene names of the dataset, e.g. adata.raw.var_names
+        signature_names: `list` | default = None
+            names of the signatures to return, defaults to all signatures
+
+        Returns
+        -------
+        list of (signature name, direction, numpy.ndarray) with the unique
+        positions of the genes found in var_names, in the order of the library
+        """
+        gene_positions = Index(var_names).get_indexer(self.vocabulary)
+        selected = None if signature_names is None else set(signature_names)
+        result = []
+        for entry, signature_index in enumerate(self.entry_signature):
+            signature_name = self.names[signature_index]
+            if selected is not None and signature_name not in selected:
+                continue
+            entry_codes = self.codes[self.offsets[entry] : self.offsets[entry + 1]]
+            found = gene_positions[entry_codes]
+            result.append(
+                (signature_name, self.entry_direction[entry], unique(found[found >= 0]))
+            )
+        return result
+
+    def convert(self, conversion):
+        """Convert the genes of the library with an ortholog conversion Series.
+
+        Every gene of the vocabulary is looked up once in the inverted
+        conversion table (see convert_siggenes); genes without ortholog are
+        removed, as well as directions without any converted gene.
+
+        Parameters
+        ----------
+        conversion: class:`~pandas.Series`
+            gene symbols in other species in index and the symbols of the
+            library as values, e.g. bc.datasets.get_mouse_human_conversion()
+
+        Returns
+        -------
+        SignatureLibrary with the converted genes
+        """
+        lookup = _conversion_lookup(conversion)
+        mapped = np.array([lookup.get(gene) for gene in self.vocabulary], dtype=object)
+        found = np.array([gene is not None for gene in mapped], dtype=bool)
+        vocabulary = Index(unique(mapped[found]), dtype=object)
+        new_codes = vocabulary.get_indexer(mapped)
+
+        keep = found[self.codes]
+        kept_before = np.concatenate([[0], np.cumsum(keep, dtype=np.int64)])
+        lengths = np.diff(kept_before[self.offsets])
+        entries = lengths > 0
+        offsets = np.concatenate([[0], np.cumsum(lengths[entries])])
+        return SignatureLibrary(
+            self.names,
+            self.entry_signature[entries],
+            [d for d, e in zip(self.entry_direction, entries) if e],
+            vocabulary,
+            new_codes[self.codes[keep]],
+            offsets,
+        )
+
+    def to_dict(self, var_names=None) -> dict:
+        """Signature dictionary of the library (as returned by read_GMT_sign).
+
+        If var_names is given, only the genes present in var_names are kept and
+        directions without any such gene are dropped (as filter_siggenes).
+        """
+        signature_dict = {name: {} for name in self.names}
+        vocabulary = np.asarray(self.vocabulary, dtype=object)
+        if var_names is None:
+            for entry, signature_index in enumerate(self.entry_signature):
+                entry_codes = self.codes[self.offsets[entry] : self.offsets[entry + 1]]
+                signature_dict[self.names[signature_index]][
+                    self.entry_direction[entry]
+                ] = vocabulary[entry_codes].tolist()
+            return signature_dict
+
+        var_names = Index(var_names)
+        for signature_name, direction, found in self.positions(var_names):
+            if len(found):
+                signature_dict[signature_name][direction] = list(var_names[found])
+        return signature_dict
+
+
+def _read_gmtx(GMT_file: str, UP_suffix: str, DN_suffix: str) -> dict:
+    """read the signatures of a GeMS gmtx file (header line, 'gene | coefficient' fields)"""
+    with open(GMT_file, "r") as fp:
+        lines = fp.read().split("\n")
+    header = lines[0].split("\t")
+    first_gene = header.index("genes|score") if "genes|score" in header else 2
+    signatures = {}
+    for line in lines[1:]:
+        fields = line.split("\t")
+        if len(fields) <= first_gene or not len(fields[0]):
+            continue
+        name, direction = fields[0], "UP"
+        for suffix, key in [(DN_suffix, "DN"), (UP_suffix, "UP")]:
+            if name.endswith(suffix) and len(name) > len(suffix):
+                name, direction = name[: -len(suffix)], key
+                break
+        genes = [field.split("|")[0].strip() for field in fields[first_gene:]]
+        signatures.setdefault(name, {})[direction] = [gene for gene in genes if gene]
+    return signatures
+
+
+def read_signature_library(
+    GMT_file: str,
+    UP_suffix: str = "_UP",
+    DN_suffix: str = "_DN",
+    cache: bool = True,
+    cache_dir: str = None,
+) -> SignatureLibrary:
+    """Read a gmt or gmtx file into a compiled SignatureLibrary.
+
+    The file is parsed once (with read_GMT_sign for gmt files, UP/DN suffixes are
+    normalised to directions) and the compiled library is cached in cache_dir,
+    keyed by the content hash of the file, so further reads of the same file
+    only load the binary cache.
+
+    Parameters
+    ----------
+    GMT_file: `str`
+        gmt or gmtx (GeMS export, recognised by the file extension) file location
+    UP_suffix : `str` | default = "_UP"
+        suffix of the signature names indicating the signature is UP.
+    DN_suffix : `str` | default = "_DN"
+        suffix of the signature names indicating the signature is DN.
+    cache: `bool` | default = True
+        if False the file is always parsed and the library is not cached
+    cache_dir: `str` | default = None
+        directory of the cached libraries, defaults to ~/.cache/besca/signatures
+
+    Returns
+    -------
+    SignatureLibrary
+
+    Example
+    -------
+    >>> import besca as bc
+    >>> import pkg_resources
+    >>> gmt_file = pkg_resources.resource_filename('besca', 'datasets/genesets/Immune.gmt')
+    >>> library = bc.tl.sig.read_signature_library(gmt_file, cache=False)
+    >>> library
+    SignatureLibrary with 9 signatures of 26 genes
+    >>> library.to_dict()['myeloid']
+    {'UP': ['S100A8', 'S100A9', 'CST3']}
+    """
+
+    def parse():
+        if GMT_file.lower().endswith(".gmtx"):
+            signatures = _read_gmtx(GMT_file, UP_suffix, DN_suffix)
+        else:
+            signatures = read_GMT_sign(GMT_file, UP_suffix, DN_suffix, True, False)
+        return SignatureLibrary.from_dict(signatures)
+
+    if not cache:
+        return parse()
+    if cache_dir is None:
+        cache_dir = default_library_dir()
+    # a missing GMT_file raises here, an unusable cache directory only
+    # prevents saving the library (see below)
+    key = hashlib.blake2b(digest_size=20)
+    for part in [_LIBRARY_VERSION, UP_suffix, DN_suffix]:
+        key.update(part.encode() + b"\0")
+    key.update(_content_hash(GMT_file, cache_dir).encode())
+
+    library_file = os.path.join(cache_dir, key.hexdigest() + ".npz")
+    if os.path.isfile(library_file):
+        try:
+            return SignatureLibrary.load(library_file)
+        except (OSError, ValueError, KeyError):
+            print("cached signature library is unreadable, reparsing " + GMT_file)
+
+    library = parse()
+    try:
+        library.save(library_file + ".tmp")
+        os.replace(library_file + ".tmp", library_file)
+    except OSError as error:
+        print("signature library could not be cached (" + str(error) + ")")
+        if os.path.isfile(library_file + ".tmp"):
+            os.remove(library_file + ".tmp")
+    return library
@@ -3,8 +3,17 @@
 # import using the python version 1.3.2 at least is a prerequisit!
 # needs to be checked in all functions
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pandas import DataFrame, Index, concat
 from scanpy import AnnData
 from scanpy.tools import score_genes
+from scipy.sparse import csc_matrix, csr_matrix, issparse
+from scipy.stats import rankdata
+
+from besca.tl.sig._library import SignatureLibrary
 
 
 def _handle_signature(
@@ -82,3 +91,278 @@ def _handle_signature(
             score = list(map(sum, zip(score, scoreTMP)))
     adata.obs[scoreName] = score.copy()
     return None
+
+
+def _score_genes_bins(X, n_bins: int = 25):
+    """Expression bins of scanpy's score_genes, computed once for all signatures.
+
+    Returns the bin of every gene (-1 for genes with a non finite mean) and
+    the positions of the genes of every bin, in var order.
+    """
+    gene_means = np.asarray(X.mean(axis=0, dtype=np.float64)).ravel()
+    finite = np.isfinite(gene_means)
+    n_items = int(np.round(finite.sum() / (n_bins - 1)))
+    ranks = rankdata(gene_means[finite], method="min")
+    cuts = np.full(len(gene_means), -1, dtype=np.int64)
+    cuts[finite] = ranks // n_items
+    members = {cut: np.flatnonzero(cuts == cut) for cut in np.unique(cuts[finite])}
+    return cuts, members
+
+
+def _control_genes(gene_idx, cuts, members, ctrl_size: int = 50, random_state=0):
+    """Control genes of scanpy's score_genes for the genes at the positions gene_idx.
+
+    ctrl_size genes are drawn from every expression bin of the signature genes
+    with the same random draws as score_genes (legacy seeded numpy sampling),
+    signature genes are not used as controls.
+    """
+    rng = np.random.RandomState(random_state)
+    control = []
+    for cut in np.unique(cuts[gene_idx]):
+        r_genes = members[cut]
+        if ctrl_size < len(r_genes):
+            r_genes = r_genes[rng.choice(len(r_genes), size=ctrl_size, replace=False)]
+        control.append(r_genes)
+    return np.setdiff1d(np.concatenate(control), gene_idx)
+
+
+def _signature_positions(signature, signature_names: list, var_names):
+    """(column, direction, gene positions in var_names) of every signature direction
+
+    signature is either a signature dictionary or a SignatureLibrary, the column
+    is the position of the signature in signature_names.
+    """
+    column = {signature_name: col for col, signature_name in enumerate(signature_names)}
+    if isinstance(signature, SignatureLibrary):
+        entries = signature.positions(var_names, signature_names)
+    else:
+        entries = []
+        for signature_name in signature_names:
+            directions = signature.get(signature_name, {})
+            if not isinstance(directions, dict):
+                directions = {"UP": directions}
+            for direction, genes in directions.items():
+                gene_idx = var_names.get_indexer(Index(genes).unique())
+                entries.append((signature_name, direction, gene_idx[gene_idx >= 0]))
+    for signature_name, direction, gene_idx in entries:
+        yield column[signature_name], direction, gene_idx
+
+
+def _batched_signature_scores(
+    adata: AnnData,
+    signature: dict,
+    signature_names: list,
+    method: str,
+    verbose: bool,
+    use_raw: bool,
+):
+    """Compute the signed scores of several signatures with one matrix product.
+
+    Batched version of _handle_signature for the scanpy method: the expression
+    bins are computed once, the signature and control genes of all signatures
+    and directions are collected in one sparse gene x signature weight matrix
+    (+1/n for the genes, -1/n for the controls, negated for DN) and all
+    UP - DN scores are obtained from a single product with the expression
+    matrix. The scores are added to adata.obs in one assignment.
+
+    Parameters
+    ----------
+    signature: `dict`
+       dictionary of signatures; keys are the signature names, values are
+       dictionaries with the directions (UP/DN) as keys and the genes as values.
+       Can also be a SignatureLibrary.
+    signature_names: `list`
+        names of the signatures to compute
+    method: `str`
+        name of the method, used in the obs column names
+    adata:class:`~anndata.AnnData`
+        An AnnData object (from scanpy).
+    use_raw: `boolean`
+        If True, computation will be done on adata.raw.X (on adata.X otherwise),
+        defaults to True if adata.raw is present (as score_genes)
+
+    Returns
+    -------
+    None
+    The adata object is modified.
+    """
+    if use_raw is None:
+        use_raw = adata.raw is not None
+    X = adata.raw.X if use_raw else adata.X
+    var_names = adata.raw.var_names if use_raw else adata.var_names
+    cuts, members = _score_genes_bins(X)
+
+    rows, cols, weights = [], [], []
+    for col, direction, gene_idx in _signature_positions(
+        signature, signature_names, var_names
+    ):
+        gene_idx = gene_idx[cuts[gene_idx] >= 0]
+        control_idx = _control_genes(gene_idx, cuts, members) if len(gene_idx) else []
+        if len(control_idx) == 0:
+            if verbose:
+                print(
+                    "score score_" + signature_names[col] + "_" + method + direction,
+                    "is 0. Exception",
+                )
+            continue
+        sign = -1 if direction == "DN" else 1
+        rows += [gene_idx, control_idx]
+        cols += [np.full(len(gene_idx) + len(control_idx), col)]
+        weights += [
+            np.full(len(gene_idx), sign / len(gene_idx)),
+            np.full(len(control_idx), -sign / len(control_idx)),
+        ]
+
+    if weights:
+        W = csc_matrix(
+            (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(X.shape[1], len(signature_names)),
+        )
+        scores = X @ W
+        scores = scores.toarray() if issparse(scores) else np.asarray(scores)
+    else:
+        scores = np.zeros((X.shape[0], len(signature_names)))
+
+    _add_scores(adata, scores, signature_names, method)
+    return None
+
+
+def _add_scores(adata: AnnData, scores, signature_names: list, method: str):
+    """add the score columns score_<name>_<method> to adata.obs in one assignment"""
+    score_names = ["score_" + name + "_" + method for name in signature_names]
+    obs = adata.obs.drop(columns=[name for name in score_names if name in adata.obs])
+    adata.obs = concat(
+        [obs, DataFrame(scores, index=adata.obs_names, columns=score_names)], axis=1
+    )
+
+
+def _rank_block(X, max_rank: int):
+    """Truncated expression ranks of the cells of a block.
+
+    Genes are ranked per cell by decreasing expression (ties get their average
+    rank). Only the max_rank top ranked genes are stored, as max_rank + 1 - rank,
+    so that not stored genes correspond to the rank max_rank + 1.
+    """
+    X = csr_matrix(X)
+    X.eliminate_zeros()
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    order = np.lexsort((-X.data, rows))
+    values, rows = X.data[order], rows[order]
+    position = np.arange(len(values)) - X.indptr[rows] + 1
+    # runs of tied values within a cell share their average rank
+    new_run = np.ones(len(values), dtype=bool)
+    new_run[1:] = (values[1:] != values[:-1]) | (rows[1:] != rows[:-1])
+    run = np.cumsum(new_run) - 1
+    rank = (np.bincount(run, weights=position) / np.bincount(run))[run]
+    keep = rank <= max_rank
+    return csr_matrix(
+        (max_rank + 1 - rank[keep], (rows[keep], X.indices[order][keep])),
+        shape=X.shape,
+    )
+
+
+def _rank_signature_scores(
+    adata: AnnData,
+    signature: dict,
+    signature_names: list,
+    method: str,
+    use_raw: bool,
+    max_rank: int = 1500,
+    chunk_size: int = 1000,
+    n_jobs: int = None,
+):
+    """Compute signed rank based (UCell) scores of several signatures.
+
+    Every cell is scored on its own: the genes of a cell are ranked by
+    expression, truncated after max_rank, and a signature of n genes is
+    scored by the normalised Mann-Whitney U statistic of their ranks,
+    1 - (sum(ranks) - n(n+1)/2) / (n * max_rank), as in UCell. A cell
+    expressing none of the genes within the top max_rank ranks scores 0.
+    Scores do not depend on the other cells, so samples can be scored
+    separately. The ranks are computed once per block of chunk_size cells,
+    in parallel, and all signatures of a block are scored with one sparse
+    product. The score is UP - DN.
+
+    Parameters
+    ----------
+    signature: `dict`
+       dictionary of signatures; keys are the signature names, values are
+       dictionaries with the directions (UP/DN) as keys and the genes as values.
+       Can also be a SignatureLibrary.
+    signature_names: `list`
+        names of the signatures to compute
+    method: `str`
+        name of the method, used in the obs column names
+    adata:class:`~anndata.AnnData`
+        An AnnData object (from scanpy) of non-negative expression values, a
+        ValueError is raised for negative values such as scaled data.
+    use_raw: `boolean`
+        If True, computation will be done on adata.raw.X (on adata.X otherwise),
+        defaults to True if adata.raw is present
+    max_rank: `int` | default = 1500
+        number of top ranked genes per cell considered
+    chunk_size: `int` | default = 1000
+        number of cells ranked per block
+    n_jobs: `int` | default = None
+        number of threads, defaults to the number of CPUs
+
+    Returns
+    -------
+    None
+    The adata object is modified.
+    """
+    if use_raw is None:
+        use_raw = adata.raw is not None
+    X = adata.raw.X if use_raw else adata.X
+    var_names = adata.raw.var_names if use_raw else adata.var_names
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    # zeros are not ranked, negative values (e.g. scaled data) would rank below them
+    if X.shape[0] and X.shape[1] and (X.min() if issparse(X) else np.min(X)) < 0:
+        raise ValueError(
+            "method 'ucell' requires non-negative expression values, "
+            "use (log-normalised) counts instead of scaled data"
+        )
+
+    # one indicator column per signature and direction
+    rows, cols, lengths, signs, targets = [], [], [], [], []
+    for col, direction, gene_idx in _signature_positions(
+        signature, signature_names, var_names
+    ):
+        if len(gene_idx) == 0:
+            continue
+        rows.append(gene_idx)
+        cols.append(np.full(len(gene_idx), len(lengths)))
+        lengths.append(len(gene_idx))
+        signs.append(-1 if direction == "DN" else 1)
+        targets.append(col)
+    if not lengths:
+        _add_scores(
+            adata, np.zeros((X.shape[0], len(signature_names))), signature_names, method
+        )
+        return None
+
+    indicator = csc_matrix(
+        (np.ones(sum(lengths)), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(X.shape[1], len(lengths)),
+    )
+    n = np.array(lengths, dtype=np.float64)
+    combine = csc_matrix(
+        (signs, (np.arange(len(lengths)), targets)),
+        shape=(len(lengths), len(signature_names)),
+    )
+
+    def score_block(start):
+        inverted_ranks = _rank_block(X[start : start + chunk_size], max_rank)
+        hits = (inverted_ranks @ indicator).toarray()
+        rank_sum = n * (max_rank + 1) - hits
+        auc = 1 - (rank_sum - n * (n + 1) / 2) / (n * max_rank)
+        auc[hits == 0] = 0
+        return auc @ combine
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        scores = np.vstack(
+            list(pool.map(score_block, range(0, X.shape[0], chunk_size)))
+        )
+    _add_scores(adata, scores, signature_names, method)
+    return None
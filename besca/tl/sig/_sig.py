@@ -3,12 +3,17 @@
 import sys
 import logging
 
-# for conversion
-from itertools import repeat
+import numpy as np
+from scipy.sparse import issparse
 
-from besca.tl.sig._helper import _to_geneid
+from besca.tl.sig._helper import _conversion_lookup
 from besca.tl.sig._io_sig import read_GMT_sign
-from besca.tl.sig._metrics import _handle_signature
+from besca.tl.sig._library import SignatureLibrary
+from besca.tl.sig._metrics import (
+    _batched_signature_scores,
+    _handle_signature,
+    _rank_signature_scores,
+)
 
 def filter_by_set(strs, universe_set):
     """Remove strings from the list that are not in the universe set
@@ -45,9 +50,11 @@ def filter_by_set(strs, universe_set):
     """
     if strs is None or len(strs)==0:
         return []
+    if not isinstance(universe_set, (set, frozenset)):
+        universe_set = set(universe_set)
     genes = [gene.strip() for gene in strs] ## sometimes the gene names have empty spaces around
-    int_gene_set = set(genes).intersection(universe_set)
-    int_gene = sorted(int_gene_set, key=genes.index) ## keep the input order
+    ## unique genes in the input order
+    int_gene = [gene for gene in dict.fromkeys(genes) if gene in universe_set]
     return(int_gene)
                 
     
@@ -134,12 +141,14 @@ def convert_siggenes(signature_dict, conversion):
         (UP/DN), and genes names in values. An example: `{'gs1': {'UP': 'A', 
         'DN': 'B'}, 'gs2': {'UP': ['C', 'D'], 'DN': ['E', 'A']}}`.
     conversion: class:`~pandas.Series`
-        An Series object, with gene symbols in other species in index and human gene symbol as values
+        An Series object, with gene symbols in other species in index and human gene symbol as values,
+        e.g. bc.datasets.get_mouse_human_conversion()
 
     Returns
     -------
     signature_dict `dict`
         a dictionary of signatures in the same format as the input, with ortholog genes
+        (a SignatureLibrary if signature_dict is a SignatureLibrary)
         
     Example
     -------
@@ -158,20 +167,24 @@ def convert_siggenes(signature_dict, conversion):
     """
     if conversion is None:
         return signature_dict
+    if isinstance(signature_dict, SignatureLibrary):
+        return signature_dict.convert(conversion)
     
+    # inverted conversion table, computed once per conversion Series
+    lookup = _conversion_lookup(conversion)
     signature_dict_converted = {}
     for geneset, dir_dict in signature_dict.items():
         if type(dir_dict) is dict:
             signature_dict_converted[geneset] = {}
             for direction, genes in dir_dict.items():
-                mapped_genes = [g for g in map(_to_geneid, repeat(conversion), genes) if g is not None]
+                mapped_genes = [lookup[g] for g in genes if g in lookup]
                 if len(mapped_genes) >= 1:
                     signature_dict_converted[geneset][direction] = mapped_genes
                 else:
                     logging.info('No genes are left after conversion in '
                           + geneset + ' direction ' + direction)
         elif type(dir_dict) is list or type(dir_dict) is tuple:
-            mapped_genes = [g for g in map(_to_geneid, repeat(conversion), genes) if g is not None]
+            mapped_genes = [lookup[g] for g in dir_dict if g in lookup]
             if len(mapped_genes) >= 1:
                 signature_dict_converted[geneset] = mapped_genes
             else:
@@ -194,11 +207,15 @@ def combined_signature_score(
     verbose=False,
     use_raw=None,
     conversion=None,
+    batched=True,
+    max_rank=1500,
 ):
     """Super Wrapper function to compute combined signature score for UP and DN scores.
     This function combines genesets (signatures) scores compose of UP and DN.
     Results are stored in adata.obs with the key: "score_"+ signature_name+"_" + method  .
     The scanpy method is the score_gene method from the scanpy python package.
+    The ucell method is a rank based score computed for every cell independently (as in UCell),
+    it requires non-negative expression values.
     Combination of the scores is done substracting UP and DN (scanpy = UP - DN).
 
     If you do not have a signature dictionary composed with direction; please see bc.tl.sig.convert_to_directed
@@ -211,7 +228,8 @@ def combined_signature_score(
     GMT_file: `str` | default = None
         gmt file location containing the geneset
     signature_dict: `str` | default = None
-        pre-loaded signature dictionnary using read_GMT_sign or get_GEMS_sign
+        pre-loaded signature dictionnary using read_GMT_sign or get_GEMS_sign,
+        or a SignatureLibrary obtained with read_signature_library
     UP_suffix : str` | default = "_UP"
         str suffix indicating that the suffix indicating the signature in a UP direction (end of the signature).
         Can be replaced by "None" (quoted) or any kind of unexpected string to avoid combination.
@@ -219,7 +237,7 @@ def combined_signature_score(
         str suffix indicating that the suffix indicating the signature in a DN direction (end of the signature).
         Can be replaced by "None" (quoted) or any kind of unexpected string  to avoid combination.
     method: `str` | default = "scanpy"
-        a string indicating which method to use ('scanpy' available)
+        a string indicating which method to use ('scanpy' or 'ucell')
     overwrite: `boolean` | default = False
         If False, will parse the data.obs to only recompute scores that are not present.
     verbose: `boolean` | default = False
@@ -230,6 +248,10 @@ def combined_signature_score(
         If not none, this should contain a serie indexed by x with column containing values y.
         This indicate the how to transpose the signatures (from x to y).
         Classical example would be indexed by Ensembl id and column would contains HGNC symbol.
+    batched: `boolean` | default = True
+        If True, all signatures are scored at once (see compute_signed_score).
+    max_rank: `int` | default = 1500
+        Only for method='ucell': number of top ranked genes per cell considered.
 
     Returns
     -------
@@ -249,6 +271,8 @@ def combined_signature_score(
     # However here we divided geneset provenance and computation.
     if GMT_file is None and signature_dict is None:
         sys.exit("need to provide either GMT_file or signature_dict gene annotation.")
+    if isinstance(signature_dict, SignatureLibrary) and GMT_file is not None:
+        signature_dict = signature_dict.to_dict()
     if not GMT_file is None:
         if signature_dict is not None:
             signature_dict.update(
@@ -271,18 +295,31 @@ def combined_signature_score(
         overwrite=overwrite,
         verbose=verbose,
         use_raw=use_raw,
+        batched=batched,
+        max_rank=max_rank,
     )
     return None
 
 
 def compute_signed_score(
-    adata, signature_dict, method="scanpy", overwrite=False, verbose=False, use_raw=None
+    adata,
+    signature_dict,
+    method="scanpy",
+    overwrite=False,
+    verbose=False,
+    use_raw=None,
+    batched=True,
+    max_rank=1500,
 ):
     """Compute signed score combining UP and DN for all signatures in signature_dict
     This function combines genesets (signatures) scores.
     Results are stored in adata.obs with the key: "score_" + method + signature_name.
     Multiples methods can be used to compute geneset scores.
     The scanpy method is the score_gene method.
+    The ucell method scores every cell by the normalised Mann-Whitney U statistic of the
+    expression ranks of the signature genes, truncated to the max_rank top ranked genes of
+    the cell (as in UCell). It does not depend on the other cells and requires non-negative
+    expression values (not scaled data).
     Combination of the scores is done substracting UP and DN (scanpy = UP - DN).
     Method in development. Not all options implemented yet.
 
@@ -293,25 +330,65 @@ def compute_signed_score(
     signature_dict: `dict`
         a dictionary of signature. Nested dictionnaries, key: signature names
         Values are a dict  with keys as the directions (UP/DN) and genes names in values.
+        Can also be a SignatureLibrary (see read_signature_library), whose genes are
+        resolved to the var_names with a single lookup.
     method: `str` | default = scanpy
-        a string indicating which method to use ('scanpy' available)
+        a string indicating which method to use ('scanpy' or 'ucell')
     overwrite: `boolean` | default = False
         If False, will parse the data.obs to only recompute scores that are not present.
     use_raw: `boolean` | default = None
+    batched: `boolean` | default = True
+        If True, the expression bins of the scanpy method are computed once and all
+        signatures are scored with a single sparse matrix product (same control genes
+        and scores as score_genes). Falls back to scoring every signature separately
+        if the expression matrix contains missing values.
+    max_rank: `int` | default = 1500
+        Only for method='ucell': number of top ranked genes per cell considered.
 
     Returns
     -------
     None
 
     """
-    # Filter out signature genes not present in adata
-    signature_dict_filtered=filter_siggenes(adata, signature_dict)
+    if isinstance(signature_dict, SignatureLibrary):
+        signature_names = signature_dict.names
+        # the batched methods resolve the genes of the library themselves
+        signature_dict_filtered = signature_dict
+    else:
+        signature_names = list(signature_dict.keys())
+        # Filter out signature genes not present in adata
+        signature_dict_filtered=filter_siggenes(adata, signature_dict)
+
+    signature_names = [
+        signature_name
+        for signature_name in signature_names
+        if overwrite or "score_" + signature_name + "_" + method not in adata.obs
+    ]
+    if verbose:
+        print("Computing " + str(len(signature_names)) + " signature scores")
+    if method == "ucell":
+        _rank_signature_scores(
+            adata, signature_dict_filtered, signature_names, method, use_raw, max_rank
+        )
+        return None
+
+    if batched and method == "scanpy":
+        if use_raw is None:
+            use_raw = adata.raw is not None
+        X = adata.raw.X if use_raw else adata.X
+        if not np.isnan(X.data if issparse(X) else X).any():
+            _batched_signature_scores(
+                adata, signature_dict_filtered, signature_names, method, verbose, use_raw
+            )
+            return None
 
+    if isinstance(signature_dict_filtered, SignatureLibrary):
+        signature_dict_filtered = signature_dict_filtered.to_dict(adata.raw.var_names)
     [
         _handle_signature(
             signature_dict_filtered, method, adata, signature_name, overwrite, verbose, use_raw
         )
-        for signature_name in signature_dict.keys()
+        for signature_name in signature_names
     ]
     return None
 
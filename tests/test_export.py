@@ -0,0 +1,80 @@
+import pathlib
+from os.path import join
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import io, sparse
+
+from besca.export import write_mtx
+from besca.export._write import write_table
+
+
+@pytest.fixture
+def count_matrix() -> sparse.csr_matrix:
+    X = sparse.random(200, 50, density=0.1, format="csr", random_state=0)
+    X.data = np.round(X.data * 100, 1).astype(np.float32)
+    return X
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_write_mtx(
+    count_matrix: sparse.csr_matrix,
+    compression: str,
+    tmp_path_factory: pathlib.Path,
+):
+
+    tmp_path = tmp_path_factory.mktemp("write_mtx")
+    filename = join(tmp_path, "matrix.mtx" + (".gz" if compression else ""))
+
+    write_mtx(count_matrix, filename, compression=compression, chunk_size=100)
+
+    result = io.mmread(filename)
+    assert result.shape == (50, 200)
+    assert np.allclose(result.toarray(), count_matrix.T.toarray())
+
+
+@pytest.mark.parametrize("sep", ["\t", ","])
+@pytest.mark.parametrize("float_format", [None, "%.3f", "%.3e"])
+@pytest.mark.parametrize("chunk_size", [2, 3, 100])
+def test_write_table_matches_to_csv(
+    sep: str,
+    float_format: str,
+    chunk_size: int,
+    tmp_path_factory: pathlib.Path,
+):
+
+    df = pd.DataFrame(
+        {
+            "float32": np.array([0.1, np.nan, -2.5, 1e-8], dtype=np.float32),
+            "float64": [1 / 3, -1234.5678, np.nan, 2e20],
+            "int": [1, -2, 30, 400],
+            "bool": [True, False, True, True],
+            "nullable_int": pd.array([1, None, 3, -4], dtype="Int64"),
+            "string": ["a", "b\tc", 'say "hi"', "d,e"],
+            "categorical": pd.Categorical(["x", None, "y", "x"]),
+            "float_categorical": pd.Categorical([1.5, 2.25, None, 1.5]),
+            "date": pd.to_datetime(["2020-01-01", None, "2020-03-01", "2021-12-31"]),
+            "datetime": pd.to_datetime(
+                ["2020-01-01 10:30", "2020-01-02 00:00", None, "2020-01-03 23:59"]
+            ),
+            # midnight in the first chunk, the format is decided on the whole column
+            "late_time": pd.Timestamp("2020-01-01")
+            + pd.to_timedelta([0, 24, 48, 60], unit="h"),
+            "milliseconds": pd.Timestamp("2020-01-01")
+            + pd.to_timedelta([0, None, 86400250, 172800000], unit="ms"),
+            "timedelta": pd.to_timedelta([1, 2, None, 30], unit="h"),
+        },
+        index=pd.Index(["c1", "c2", "c3", "c4"], name="cell"),
+    )
+
+    tmp_path = tmp_path_factory.mktemp("write_table")
+    expected = join(tmp_path, "expected.tsv")
+    result = join(tmp_path, "result.tsv")
+    df.to_csv(expected, sep=sep, float_format=float_format)
+    write_table(df, result, sep=sep, float_format=float_format, chunk_size=chunk_size)
+
+    with open(expected, "rb") as fp:
+        expected_bytes = fp.read()
+    with open(result, "rb") as fp:
+        assert fp.read() == expected_bytes
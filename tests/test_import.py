@@ -0,0 +1,34 @@
+import pathlib
+from os.path import join
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from besca.export import write_mtx
+from besca.Import import read_matrix_market
+
+
+@pytest.fixture
+def count_matrix() -> sparse.csr_matrix:
+    X = sparse.random(200, 50, density=0.1, format="csr", random_state=0)
+    X.data = np.round(X.data * 100, 1).astype(np.float32)
+    return X
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_read_matrix_market(
+    count_matrix: sparse.csr_matrix,
+    compression: str,
+    tmp_path_factory: pathlib.Path,
+):
+
+    tmp_path = tmp_path_factory.mktemp("read_mtx")
+    filename = join(tmp_path, "matrix.mtx" + (".gz" if compression else ""))
+
+    write_mtx(count_matrix, filename, compression=compression)
+
+    result = read_matrix_market(filename, chunk_size=256)
+    assert sparse.isspmatrix_csr(result)
+    assert result.shape == (200, 50)
+    assert np.allclose(result.toarray(), count_matrix.toarray())
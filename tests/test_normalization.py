@@ -0,0 +1,31 @@
+import numpy as np
+from anndata import AnnData
+
+import besca as bc
+
+
+def test_normalize_geometric_view_keeps_parent():
+    rng = np.random.default_rng(0)
+    X = rng.poisson(5, size=(20, 8)).astype(np.float32)
+    parent = AnnData(X.copy())
+    parent.layers["counts"] = parent.X
+
+    view = parent[:5]
+    bc.pp.normalize_geometric(view, chunk_size=2)
+
+    assert np.array_equal(parent.X, X)
+    assert np.array_equal(parent.layers["counts"], X)
+    assert view.X.dtype == np.float32
+    assert np.allclose(view.X.sum(axis=1), 0, atol=1e-4)
+
+
+def test_normalize_geometric_shared_layer():
+    rng = np.random.default_rng(1)
+    X = rng.poisson(5, size=(10, 6)).astype(np.float32)
+    adata = AnnData(X.copy())
+    adata.layers["counts"] = adata.X
+
+    bc.pp.normalize_geometric(adata)
+
+    assert np.array_equal(adata.layers["counts"], X)
+    assert not np.array_equal(adata.X, X)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from anndata import AnnData
+from scipy import sparse
+from scipy.stats import rankdata
+
+import besca as bc
+
+
+@pytest.fixture
+def adata() -> AnnData:
+    rng = np.random.default_rng(0)
+    X = rng.poisson(0.8, size=(60, 120)).astype(np.float32)
+    X = np.log1p(X * rng.uniform(0.5, 2, size=(60, 1))).astype(np.float32)
+    adata = AnnData(sparse.csr_matrix(X))
+    adata.var_names = ["G" + str(i) for i in range(120)]
+    adata.raw = adata
+    return adata
+
+
+@pytest.fixture
+def signatures() -> dict:
+    return {
+        "up_dn": {"UP": ["G1", "G5", "G7", "G30"], "DN": ["G2", "G40", "G41"]},
+        "up": {"UP": ["G10", "G11", "G12", "G13", "G14", "G15"]},
+        "partly_missing": {"UP": ["G3", "G60", "missing1"], "DN": ["missing2"]},
+        "missing": {"UP": ["missing3", "missing4"]},
+    }
+
+
+def test_batched_scores_match_score_genes(adata: AnnData, signatures: dict):
+
+    batched = adata.copy()
+    bc.tl.sig.compute_signed_score(batched, signatures, batched=True)
+    single = adata.copy()
+    bc.tl.sig.compute_signed_score(single, signatures, batched=False)
+
+    for name in signatures:
+        column = "score_" + name + "_scanpy"
+        assert np.allclose(
+            batched.obs[column].astype(float),
+            single.obs[column].astype(float),
+            atol=1e-6,
+        )
+
+
+def _ucell_reference(x, genes, max_rank):
+    """UCell score of one cell computed from its full ranking, zeros are not ranked"""
+    rank = rankdata(-x, method="average")
+    rank[x == 0] = len(x)
+    rank = np.minimum(rank, max_rank + 1)
+    if np.all(rank[genes] > max_rank):
+        return 0.0
+    n = len(genes)
+    return 1 - (rank[genes].sum() - n * (n + 1) / 2) / (n * max_rank)
+
+
+def test_ucell_scores_match_reference(signatures: dict):
+
+    # few distinct values, many ties within a cell
+    rng = np.random.default_rng(1)
+    X = rng.integers(0, 4, size=(8, 40)).astype(np.float32)
+    X[0] = 0
+    adata = AnnData(sparse.csr_matrix(X))
+    adata.var_names = ["G" + str(i) for i in range(40)]
+    adata.raw = adata
+    signatures = {
+        "up_dn": {"UP": ["G1", "G5", "G7", "G30"], "DN": ["G2", "G31"]},
+        "up": {"UP": ["G10", "G11", "G12"]},
+    }
+    max_rank = 10
+
+    bc.tl.sig.compute_signed_score(adata, signatures, method="ucell", max_rank=max_rank)
+
+    for name, directions in signatures.items():
+        expected = np.zeros(adata.n_obs)
+        for direction, genes in directions.items():
+            idx = adata.var_names.get_indexer(genes)
+            sign = -1 if direction == "DN" else 1
+            expected += sign * np.array([_ucell_reference(x, idx, max_rank) for x in X])
+        assert np.allclose(adata.obs["score_" + name + "_ucell"], expected)
+
+
+def test_ucell_rejects_negative_values(adata: AnnData, signatures: dict):
+
+    adata.raw = AnnData(adata.X.toarray() - 1, var=adata.var)
+    with pytest.raises(ValueError):
+        bc.tl.sig.compute_signed_score(adata, signatures, method="ucell")